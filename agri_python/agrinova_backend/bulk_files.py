@@ -0,0 +1,37 @@
+"""
+Bulk File Helpers
+Input/output file handling shared by the bulk management commands
+(recommend_bulk, find_nearest_markets_bulk)
+"""
+
+import csv
+import json
+import os
+
+from django.core.management.base import CommandError
+
+
+def file_format(path):
+    """
+    'csv' or 'ndjson', from the file extension
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.ndjson', '.jsonl'):
+        return 'ndjson'
+    raise CommandError(f'Unsupported file type: {path} (use .csv, .ndjson or .jsonl)')
+
+
+def read_records(input_file, input_format):
+    """
+    Yield one dict per CSV row or non-empty NDJSON line
+    """
+    if input_format == 'csv':
+        yield from csv.DictReader(input_file)
+        return
+
+    for line in input_file:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
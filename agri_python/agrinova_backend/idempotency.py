@@ -0,0 +1,238 @@
+"""
+Idempotency Keys
+Replays the stored response when a client retries a POST with the same
+Idempotency-Key header, instead of computing and writing it again
+"""
+
+import functools
+import hashlib
+import json
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from drf_yasg import openapi
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from authentication.models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+MAX_KEY_LENGTH = 255
+
+# Swagger header parameter for the endpoints using @idempotent
+IDEMPOTENCY_KEY_PARAMETER = openapi.Parameter(
+    IDEMPOTENCY_HEADER,
+    openapi.IN_HEADER,
+    description='Client-generated key (e.g. a UUID) per logical request; retries with '
+                'the same key replay the first response instead of running again',
+    type=openapi.TYPE_STRING,
+    required=False
+)
+
+# begin() outcomes
+NEW = 'new'
+REPLAY = 'replay'
+IN_PROGRESS = 'in_progress'
+MISMATCH = 'mismatch'
+
+
+class IdempotencyStore:
+    """
+    Completed responses keyed on (scope, user, Idempotency-Key), with
+    per-entry expiry, in the IdempotencyKey table so every worker sees
+    the same keys
+
+    A request claims its key by inserting the row; the unique index on
+    (scope, user, key) lets exactly one of several concurrent requests
+    (on any worker) win, and the others find the row in flight. A claim
+    whose request never completed (e.g. the worker died) lapses after
+    claim_timeout seconds. Expired rows are purged through the expires_at
+    index at most every purge_interval seconds per process.
+    """
+
+    def __init__(self, ttl_seconds=3600, claim_timeout=60, purge_interval=300):
+        self.ttl_seconds = ttl_seconds
+        self.claim_timeout = claim_timeout
+        self.purge_interval = purge_interval
+        self._purged_at = None
+        self._lock = threading.Lock()
+        self.replays = 0
+        self.conflicts = 0
+
+    def begin(self, key, fingerprint):
+        """
+        Claim key for a request whose body hashes to fingerprint
+        Returns (outcome, stored response): NEW when the caller should
+        process the request and then complete() or release() the key,
+        REPLAY with the stored (status, data), IN_PROGRESS while the first
+        request is running, or MISMATCH when the key was used for a
+        different request body
+        """
+        self._purge_if_due()
+        scope, user_id, idempotency_key = key
+        lookup = {'scope': scope, 'user_id': user_id, 'key': idempotency_key}
+
+        # Two attempts: a competing claim can be inserted or lapse in between
+        for _ in range(2):
+            entry = IdempotencyKey.objects.filter(**lookup).first()
+            if entry is not None and entry.expires_at <= timezone.now():
+                IdempotencyKey.objects.filter(pk=entry.pk, expires_at__lte=timezone.now()).delete()
+                entry = None
+
+            if entry is None:
+                try:
+                    with transaction.atomic():
+                        IdempotencyKey.objects.create(
+                            **lookup,
+                            fingerprint=fingerprint,
+                            expires_at=timezone.now() + timedelta(seconds=self.claim_timeout)
+                        )
+                except IntegrityError:
+                    continue
+                return NEW, None
+
+            if entry.fingerprint != fingerprint:
+                self._count('conflicts')
+                return MISMATCH, None
+            if entry.status_code is None:
+                self._count('conflicts')
+                return IN_PROGRESS, None
+
+            self._count('replays')
+            return REPLAY, (entry.status_code, entry.response)
+
+        self._count('conflicts')
+        return IN_PROGRESS, None
+
+    def complete(self, key, status_code, data):
+        """
+        Store the response of a request claimed with begin()
+        """
+        scope, user_id, idempotency_key = key
+        IdempotencyKey.objects.filter(
+            scope=scope, user_id=user_id, key=idempotency_key, status_code__isnull=True
+        ).update(
+            status_code=status_code,
+            response=data,
+            expires_at=timezone.now() + timedelta(seconds=self.ttl_seconds)
+        )
+
+    def release(self, key):
+        """
+        Forget a claimed key without storing a response, so it can be retried
+        """
+        scope, user_id, idempotency_key = key
+        IdempotencyKey.objects.filter(
+            scope=scope, user_id=user_id, key=idempotency_key, status_code__isnull=True
+        ).delete()
+
+    def purge_expired(self):
+        """
+        Delete expired keys; returns how many were deleted
+        """
+        with self._lock:
+            self._purged_at = time.monotonic()
+        deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+        return deleted
+
+    def clear(self):
+        IdempotencyKey.objects.all().delete()
+
+    def stats(self):
+        with self._lock:
+            replays, conflicts = self.replays, self.conflicts
+        return {
+            'entries': IdempotencyKey.objects.filter(status_code__isnull=False).count(),
+            'in_flight': IdempotencyKey.objects.filter(status_code__isnull=True).count(),
+            'ttl_seconds': self.ttl_seconds,
+            'replays': replays,
+            'conflicts': conflicts,
+        }
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _purge_if_due(self):
+        if self.purge_interval is None:
+            return
+        purged_at = self._purged_at
+        if purged_at is None or time.monotonic() - purged_at >= self.purge_interval:
+            self.purge_expired()
+
+
+def request_fingerprint(data):
+    """
+    Hash of a request body, independent of key order
+    """
+    body = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def idempotent(scope):
+    """
+    Decorator for APIView handlers honouring the Idempotency-Key header
+
+    Responses below 500 are stored and replayed for retries with the same
+    key (and body) from the same user within IDEMPOTENCY_KEY_TTL, marked
+    with an Idempotent-Replayed header. Errors (including validation
+    errors raised as exceptions) are not stored, so the retry runs again.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not idempotency_key:
+                return handler(view, request, *args, **kwargs)
+
+            if len(idempotency_key) > MAX_KEY_LENGTH:
+                return Response({
+                    'error': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters'
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            key = (scope, request.user.pk, idempotency_key)
+            outcome, stored = idempotency_store.begin(key, request_fingerprint(request.data))
+
+            if outcome == REPLAY:
+                status_code, data = stored
+                return Response(data, status=status_code, headers={'Idempotent-Replayed': 'true'})
+            if outcome == IN_PROGRESS:
+                return Response({
+                    'error': f'A request with this {IDEMPOTENCY_HEADER} is still being processed'
+                }, status=status.HTTP_409_CONFLICT)
+            if outcome == MISMATCH:
+                return Response({
+                    'error': f'{IDEMPOTENCY_HEADER} was already used for a different request'
+                }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+            try:
+                response = handler(view, request, *args, **kwargs)
+            except BaseException:
+                idempotency_store.release(key)
+                raise
+
+            if response.status_code < 500:
+                # Stored as plain JSON data, detached from the serializers and models
+                idempotency_store.complete(
+                    key, response.status_code, json.loads(JSONRenderer().render(response.data))
+                )
+            else:
+                idempotency_store.release(key)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+# Global instance
+idempotency_store = IdempotencyStore(
+    ttl_seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 3600),
+    claim_timeout=getattr(settings, 'IDEMPOTENCY_CLAIM_TIMEOUT', 60),
+    purge_interval=getattr(settings, 'IDEMPOTENCY_PURGE_INTERVAL', 300)
+)
@@ -151,3 +151,74 @@ CORS_ALLOW_ALL_ORIGINS = True  # For development only
 
 # Custom User Model
 AUTH_USER_MODEL = 'authentication.CustomUser'
+
+# Crop recommendation engine
+# How often (seconds) the in-memory crop catalog checks the database for
+# changes made by other processes. None disables the check.
+CROP_CATALOG_REVALIDATE_SECONDS = 60
+
+# Result cache in front of POST /recommend/, keyed on quantized soil inputs
+# (pH 0.1, NPK 1 mg/kg, rainfall 10 mm) and the catalog version. Off (0) by
+# default: with a size set, single recommendations are scored on the
+# quantized inputs, so they can differ slightly from the stored SoilData
+# values and from /recommend/batch/, which always scores the exact inputs.
+CROP_RECOMMENDATION_CACHE_SIZE = 0
+CROP_RECOMMENDATION_CACHE_TTL = 300
+
+# Scoring backend used when a request doesn't pick one ('range',
+# 'decision_tree', 'random_forest' or 'gradient_boosting'). Model backends
+# need a trained artifact for the current crop catalog.
+CROP_SCORING_BACKEND = 'range'
+
+# Trained Decision Tree artifact written by `manage.py train_crop_model`.
+# Other algorithms are stored alongside it (crop_model.<algorithm>.joblib).
+CROP_MODEL_ARTIFACT_PATH = BASE_DIR / 'artifacts' / 'crop_model.joblib'
+
+# Serve the Decision Tree from its compiled NumPy export (crop_model.tree.npz,
+# written alongside the artifact) so workers load it without unpickling the
+# scikit-learn model. Falls back to the artifact when the export is missing.
+CROP_MODEL_LOAD_COMPILED_TREE = True
+
+# Retrain the loaded models on a background thread when a crop is edited in
+# this process. The new model is swapped in once ready; until then requests
+# keep using the old one.
+CROP_MODEL_RETRAIN_ON_CATALOG_CHANGE = False
+
+# Precomputed lookup grid built by `manage.py build_recommendation_grid`.
+# When enabled and current for the crop catalog, range scoring answers inputs
+# inside the grid from the nearest grid point. With EXACT_BOUNDARIES, points
+# where neighbouring recommendations differ are still scored exactly.
+CROP_RECOMMENDATION_GRID_ENABLED = False
+CROP_RECOMMENDATION_GRID_PATH = BASE_DIR / 'artifacts' / 'crop_grid.joblib'
+CROP_RECOMMENDATION_GRID_EXACT_BOUNDARIES = True
+
+# Write-behind logging: POST /api/crops/recommend/ and
+# /api/markets/find-nearest/ respond before their records are stored, then a
+# background thread inserts them in bulk once MAX_BATCH records are waiting or
+# FLUSH_INTERVAL seconds have passed. Past MAX_PENDING queued records requests
+# write synchronously again. Pending records are flushed on graceful shutdown.
+WRITE_BEHIND_ENABLED = False
+WRITE_BEHIND_MAX_BATCH = 200
+WRITE_BEHIND_FLUSH_INTERVAL = 1.0
+WRITE_BEHIND_MAX_PENDING = 10_000
+
+# Idempotency-Key support on POST /api/crops/recommend/ and
+# /api/markets/find-nearest/: a retry with the same key within the TTL gets
+# the stored response without recomputing or writing. Keys live in the
+# database (authentication.IdempotencyKey), so retries landing on another
+# worker are replayed too. A key whose first request never finished is freed
+# after IDEMPOTENCY_CLAIM_TIMEOUT seconds; expired keys are deleted at most
+# every IDEMPOTENCY_PURGE_INTERVAL seconds per worker.
+IDEMPOTENCY_KEY_TTL = 3600
+IDEMPOTENCY_CLAIM_TIMEOUT = 60
+IDEMPOTENCY_PURGE_INTERVAL = 300
+
+# Market finder
+# How often (seconds) the in-memory array of active market coordinates checks
+# the database for changes made by other processes. None disables the check.
+MARKET_COORDINATES_REVALIDATE_SECONDS = 60
+
+# Search radius (km) that nearest-market lookups start from when this process
+# has no market coordinates loaded and queries the database by bounding box.
+# The radius grows 4-fold until enough markets are found.
+MARKET_SEARCH_INITIAL_RADIUS_KM = 25.0
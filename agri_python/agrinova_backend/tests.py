@@ -0,0 +1,191 @@
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.signals import request_started
+from django.db import OperationalError
+from django.test import TestCase
+from authentication.models import IdempotencyKey
+from .idempotency import IN_PROGRESS, MISMATCH, NEW, REPLAY, IdempotencyStore
+from .worker_startup import RETRY_DISPATCH_UID, warm_up
+from .write_behind import WriteBehindQueue
+
+
+class RecordingInsert:
+    """
+    Insert function that records each call and can fail on given payloads
+    """
+
+    def __init__(self, fail_on=()):
+        self.calls = []
+        self.fail_on = set(fail_on)
+        self.called = threading.Event()
+
+    def __call__(self, payloads):
+        self.calls.append(list(payloads))
+        self.called.set()
+        if self.fail_on.intersection(payloads):
+            raise ValueError('bad record')
+
+
+class WriteBehindQueueTests(TestCase):
+    def make_queue(self, **options):
+        queue = WriteBehindQueue(**{'enabled': True, 'max_batch': 100, 'flush_interval': 60, **options})
+        self.addCleanup(queue.close)
+        return queue
+
+    def test_flushes_once_max_batch_is_waiting(self):
+        queue = self.make_queue(max_batch=3)
+        insert = RecordingInsert()
+
+        for payload in (1, 2):
+            queue.submit(insert, payload)
+        self.assertFalse(insert.called.wait(0.1))
+        queue.submit(insert, 3)
+
+        self.assertTrue(insert.called.wait(5))
+        self.assertEqual(insert.calls, [[1, 2, 3]])
+
+    def test_flushes_after_interval(self):
+        queue = self.make_queue(flush_interval=0.05)
+        insert, other = RecordingInsert(), RecordingInsert()
+        started = time.monotonic()
+
+        queue.submit(insert, 1)
+        queue.submit(other, 'a')
+        queue.submit(insert, 2)
+
+        self.assertTrue(insert.called.wait(5))
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+        self.assertTrue(other.called.wait(5))
+        # One call per insert function, in submission order
+        self.assertEqual((insert.calls, other.calls), ([[1, 2]], [['a']]))
+
+    def test_failed_batch_is_retried_one_by_one(self):
+        queue = self.make_queue()
+        insert = RecordingInsert(fail_on={'bad'})
+        for payload in ('a', 'bad', 'c'):
+            queue.submit(insert, payload)
+
+        with self.assertLogs('agrinova_backend.write_behind', 'ERROR'):
+            self.assertEqual(queue.flush(), 2)
+
+        self.assertEqual(insert.calls, [['a', 'bad', 'c'], ['a'], ['bad'], ['c']])
+        stats = queue.stats()
+        self.assertEqual((stats['written'], stats['dropped'], stats['depth']), (2, 1, 0))
+
+    def test_refuses_past_max_pending(self):
+        queue = self.make_queue(max_pending=2)
+        insert = RecordingInsert()
+
+        self.assertTrue(queue.submit(insert, 1))
+        self.assertTrue(queue.accepting())
+        self.assertTrue(queue.submit(insert, 2))
+
+        # Callers then write synchronously
+        self.assertFalse(queue.accepting())
+        self.assertFalse(queue.submit(insert, 3))
+        self.assertEqual(queue.flush(), 2)
+        self.assertTrue(queue.accepting())
+
+    def test_disabled_queue_refuses(self):
+        queue = WriteBehindQueue(enabled=False)
+
+        self.assertFalse(queue.accepting())
+        self.assertFalse(queue.submit(RecordingInsert(), 1))
+
+    def test_close_drains_pending(self):
+        queue = self.make_queue()
+        insert = RecordingInsert()
+        for payload in range(5):
+            queue.submit(insert, payload)
+        thread = queue._thread
+
+        queue.close()
+
+        self.assertEqual(insert.calls, [[0, 1, 2, 3, 4]])
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(queue.submit(insert, 5))
+        self.assertEqual(queue.stats()['written'], 5)
+
+
+class IdempotencyStoreTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='farmer', password='secret')
+        self.key = ('recommend', self.user.pk, 'retry-1')
+        # Two stores stand in for two worker processes
+        self.worker, self.other_worker = IdempotencyStore(), IdempotencyStore()
+
+    def test_key_is_shared_between_workers(self):
+        self.assertEqual(self.worker.begin(self.key, 'body'), (NEW, None))
+        self.assertEqual(self.other_worker.begin(self.key, 'body'), (IN_PROGRESS, None))
+
+        self.worker.complete(self.key, 200, {'id': 7})
+
+        self.assertEqual(self.other_worker.begin(self.key, 'body'), (REPLAY, (200, {'id': 7})))
+        self.assertEqual(self.other_worker.begin(self.key, 'other body'), (MISMATCH, None))
+        self.assertEqual(self.other_worker.stats()['replays'], 1)
+
+    def test_keys_are_scoped_per_user_and_endpoint(self):
+        other_user = get_user_model().objects.create_user(username='officer', password='secret')
+        self.worker.begin(self.key, 'body')
+
+        self.assertEqual(self.worker.begin(('recommend', other_user.pk, 'retry-1'), 'body'), (NEW, None))
+        self.assertEqual(self.worker.begin(('find_nearest', self.user.pk, 'retry-1'), 'body'), (NEW, None))
+
+    def test_released_key_can_be_claimed_again(self):
+        self.worker.begin(self.key, 'body')
+        self.worker.release(self.key)
+
+        self.assertEqual(self.other_worker.begin(self.key, 'body'), (NEW, None))
+
+    def test_abandoned_claim_lapses(self):
+        IdempotencyStore(claim_timeout=0).begin(self.key, 'body')
+
+        self.assertEqual(self.worker.begin(self.key, 'body'), (NEW, None))
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    def test_expired_responses_are_purged(self):
+        store = IdempotencyStore(ttl_seconds=0, purge_interval=None)
+        store.begin(self.key, 'body')
+        store.complete(self.key, 200, {'id': 7})
+        store.begin(('recommend', self.user.pk, 'retry-2'), 'body')
+
+        self.assertEqual(store.purge_expired(), 1)
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['retry-2'])
+
+    def test_claims_purge_when_due(self):
+        expiring = IdempotencyStore(ttl_seconds=0, purge_interval=None)
+        expiring.begin(('recommend', self.user.pk, 'expired-1'), 'body')
+        expiring.complete(('recommend', self.user.pk, 'expired-1'), 200, {'id': 7})
+
+        # The first claim on a worker purges
+        self.worker.begin(('recommend', self.user.pk, 'retry-1'), 'body')
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['retry-1'])
+
+        # Later ones only after purge_interval
+        expiring.begin(('recommend', self.user.pk, 'expired-2'), 'body')
+        expiring.complete(('recommend', self.user.pk, 'expired-2'), 200, {'id': 8})
+        self.worker.begin(('recommend', self.user.pk, 'retry-2'), 'body')
+        self.assertEqual(IdempotencyKey.objects.count(), 3)
+
+
+class WorkerStartupTests(TestCase):
+    def test_warm_up_waits_for_the_database(self):
+        self.addCleanup(request_started.disconnect, dispatch_uid=RETRY_DISPATCH_UID)
+
+        with mock.patch('agrinova_backend.worker_startup.crop_recommendation_engine') as engine, \
+                mock.patch('agrinova_backend.worker_startup.market_coordinates_store') as store:
+            # As on a database that was never migrated
+            store.warm.side_effect = OperationalError('no such table: market_finder_market')
+            with self.assertLogs('agrinova_backend.worker_startup', 'WARNING'):
+                self.assertFalse(warm_up())
+
+            store.warm.side_effect = None
+            request_started.send(sender=self.__class__)
+            request_started.send(sender=self.__class__)
+
+        # Retried on the next request only, as it then succeeds
+        self.assertEqual(store.warm.call_count, 2)
+        self.assertEqual(engine.load_models.call_count, 2)
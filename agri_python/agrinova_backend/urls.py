@@ -20,6 +20,7 @@ from rest_framework.authtoken import views as authtoken_views
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from .views import WriteBehindStatsView
 
 # Swagger/OpenAPI Schema Configuration
 schema_view = get_schema_view(
@@ -62,6 +63,7 @@ urlpatterns = [
     path('api/crops/', include('crop_recommendation.urls')),
     path('api/markets/', include('market_finder.urls')),
     path('api-token-auth/', authtoken_views.obtain_auth_token),
+    path('api/write-behind/stats/', WriteBehindStatsView.as_view(), name='write-behind-stats'),
     
     # Swagger/OpenAPI Documentation URLs
     re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
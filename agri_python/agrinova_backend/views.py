@@ -0,0 +1,17 @@
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from drf_yasg.utils import swagger_auto_schema
+from .write_behind import write_behind_queue
+
+class WriteBehindStatsView(APIView):
+    """
+    Queue depth and flush latency of the write-behind log queue (this worker only).
+    """
+    permission_classes = [permissions.IsAdminUser]
+    
+    @swagger_auto_schema(
+        operation_description="Get write-behind queue depth, counters and flush latency (admin only)"
+    )
+    def get(self, request):
+        return Response(write_behind_queue.stats(), status=status.HTTP_200_OK)
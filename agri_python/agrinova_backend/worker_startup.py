@@ -0,0 +1,48 @@
+"""
+Worker Startup
+Loads per-worker state (trained models, lookup grid, market coordinates)
+ahead of the first request; used by wsgi.py and asgi.py
+"""
+
+import logging
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import DatabaseError
+from crop_recommendation.recommendation_engine import crop_recommendation_engine
+from market_finder.geo import market_coordinates_store
+
+logger = logging.getLogger(__name__)
+
+RETRY_DISPATCH_UID = 'agrinova_backend.worker_startup.retry'
+
+
+def warm_up():
+    """
+    Load the trained crop models, the optional lookup grid and the market
+    coordinates with their KD-tree
+    If the database can't be read yet (e.g. not migrated), the worker still
+    starts and warm_up runs again on each request until it succeeds
+    Returns True once everything is loaded
+    """
+    try:
+        # Trained models (see `manage.py train_crop_model`)
+        crop_recommendation_engine.load_models()
+
+        # Optional precomputed lookup grid (see `manage.py build_recommendation_grid`)
+        if getattr(settings, 'CROP_RECOMMENDATION_GRID_ENABLED', False):
+            crop_recommendation_engine.load_lookup_grid()
+
+        # Active market coordinates and their KD-tree for nearest-market searches
+        market_coordinates_store.warm()
+    except DatabaseError:
+        logger.warning('Database not ready, retrying worker warm-up on the next request', exc_info=True)
+        request_started.connect(_retry_warm_up, dispatch_uid=RETRY_DISPATCH_UID)
+        return False
+
+    return True
+
+
+def _retry_warm_up(sender, **kwargs):
+    request_started.disconnect(dispatch_uid=RETRY_DISPATCH_UID)
+    warm_up()
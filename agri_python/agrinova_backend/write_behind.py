@@ -0,0 +1,211 @@
+"""
+Write-Behind Queue
+Buffers log records (soil tests, recommendations, market searches) in
+process and inserts them in bulk from a background thread, so responses
+don't wait for the database
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# Number of recent flushes kept for latency percentiles
+FLUSH_TIMINGS_WINDOW = 1000
+
+
+class WriteBehindQueue:
+    """
+    Opt-in (WRITE_BEHIND_ENABLED) in-process buffer of pending inserts
+
+    Items are (insert function, payload) pairs. A flush groups them by
+    function and calls insert(payloads) once per group in a transaction;
+    if that fails, the group's payloads are retried one by one so a single
+    bad record doesn't lose the rest.
+    The background flusher writes once max_batch items are waiting or
+    flush_interval seconds after the oldest one, whichever comes first.
+    At most max_pending items are buffered; beyond that submit() refuses
+    and callers write synchronously. Pending items are flushed when the
+    interpreter exits, so a graceful worker shutdown loses nothing.
+    """
+
+    def __init__(self, enabled=False, max_batch=200, flush_interval=1.0, max_pending=10_000):
+        self.enabled = enabled
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._pending = deque()
+        self._oldest_at = None
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.max_depth = 0
+        self._flush_seconds = deque(maxlen=FLUSH_TIMINGS_WINDOW)
+
+    @property
+    def depth(self):
+        return len(self._pending)
+
+    def accepting(self):
+        """
+        Whether submit() would currently queue an item
+        """
+        return self.enabled and not self._closed and len(self._pending) < self.max_pending
+
+    def submit(self, insert, payload):
+        """
+        Queue payload for insert([payload, ...]) on the flusher thread
+        Returns False (nothing queued) when disabled, closed or full
+        """
+        with self._condition:
+            if not self.enabled or self._closed or len(self._pending) >= self.max_pending:
+                return False
+
+            if not self._pending:
+                self._oldest_at = time.monotonic()
+            self._pending.append((insert, payload))
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, len(self._pending))
+
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='write-behind-flusher', daemon=True
+                )
+                self._thread.start()
+            if len(self._pending) >= self.max_batch:
+                self._condition.notify()
+
+        return True
+
+    def flush(self):
+        """
+        Write everything pending now, in the calling thread
+        Returns the number of records written
+        """
+        with self._flush_lock:
+            with self._condition:
+                items = list(self._pending)
+                self._pending.clear()
+                self._oldest_at = None
+
+            if not items:
+                return 0
+
+            started = time.perf_counter()
+            written = self._write(items)
+            self._flush_seconds.append(time.perf_counter() - started)
+            self.flushes += 1
+            self.written += written
+            self.dropped += len(items) - written
+
+        return written
+
+    def close(self, timeout=10.0):
+        """
+        Stop the flusher and write everything still pending
+        Registered to run at interpreter exit
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+            thread = self._thread
+
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        with self._flush_lock:
+            timings = sorted(self._flush_seconds)
+
+        def percentile(fraction):
+            if not timings:
+                return 0.0
+            return round(timings[min(len(timings) - 1, int(fraction * len(timings)))] * 1000, 3)
+
+        return {
+            'enabled': self.enabled,
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'max_pending': self.max_pending,
+            'submitted': self.submitted,
+            'written': self.written,
+            'dropped': self.dropped,
+            'flushes': self.flushes,
+            'flush_p50_ms': percentile(0.5),
+            'flush_p99_ms': percentile(0.99),
+        }
+
+    def _write(self, items):
+        groups = {}
+        for insert, payload in items:
+            groups.setdefault(insert, []).append(payload)
+
+        written = 0
+        for insert, payloads in groups.items():
+            try:
+                with transaction.atomic():
+                    insert(payloads)
+                written += len(payloads)
+                continue
+            except Exception:
+                logger.exception('Write-behind flush of %d records failed, retrying one by one', len(payloads))
+
+            for payload in payloads:
+                try:
+                    with transaction.atomic():
+                        insert([payload])
+                    written += 1
+                except Exception:
+                    logger.exception('Dropped write-behind record')
+
+        return written
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and not self._due():
+                    timeout = None
+                    if self._pending:
+                        timeout = self._oldest_at + self.flush_interval - time.monotonic()
+                    self._condition.wait(timeout)
+                closed = self._closed
+
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Write-behind flush failed')
+
+            if closed:
+                break
+
+        connection.close()
+
+    def _due(self):
+        if len(self._pending) >= self.max_batch:
+            return True
+        return bool(self._pending) and time.monotonic() - self._oldest_at >= self.flush_interval
+
+
+# Global instance
+write_behind_queue = WriteBehindQueue(
+    enabled=getattr(settings, 'WRITE_BEHIND_ENABLED', False),
+    max_batch=getattr(settings, 'WRITE_BEHIND_MAX_BATCH', 200),
+    flush_interval=getattr(settings, 'WRITE_BEHIND_FLUSH_INTERVAL', 1.0),
+    max_pending=getattr(settings, 'WRITE_BEHIND_MAX_PENDING', 10_000)
+)
+atexit.register(write_behind_queue.close)
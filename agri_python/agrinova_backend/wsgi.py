@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'agrinova_backend.settings')
 
 application = get_wsgi_application()
+
+# Load models, lookup grid and market coordinates once per worker
+from agrinova_backend.worker_startup import warm_up  # noqa: E402
+
+warm_up()
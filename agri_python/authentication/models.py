@@ -27,3 +27,28 @@ class UserProfile(models.Model):
     
     def __str__(self):
         return f"{self.user.username}'s Profile"
+
+class IdempotencyKey(models.Model):
+    """
+    Idempotency-Key of a POST request and, once it finished, its response
+    Shared by all workers; the unique index makes claiming a key atomic
+    """
+    scope = models.CharField(max_length=50, help_text="Endpoint the key was used on")
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64, help_text="SHA-256 of the request body")
+    
+    # Empty while the first request is still running
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    def __str__(self):
+        return f"{self.scope} - {self.user_id} - {self.key}"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'user', 'key'], name='idempotency_scope_user_key_uniq'),
+        ]
@@ -0,0 +1,253 @@
+"""
+Crop Engine Benchmarks
+Times the recommendation engine on synthetic crop catalogs of increasing size,
+used by `manage.py benchmark_crop_engine`
+"""
+
+import gc
+import os
+import platform
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import sklearn
+from .crop_catalog import CropCatalog
+from .models import Crop
+from .recommendation_engine import CropRecommendationEngine
+from .seasons import season_bitmask
+
+DEFAULT_CATALOG_SIZES = (20, 1_000, 10_000, 100_000)
+DEFAULT_BATCH_SIZES = (1, 10, 100, 1_000, 10_000)
+
+SEASON_VALUES = [value for value, _ in Crop.SEASONS]
+
+# Metrics compared between runs, and whether lower is better
+COMPARED_METRICS = {
+    'p50_ms': True,
+    'peak_memory_mb': True,
+}
+
+
+def synthetic_catalog(size, seed=0):
+    """
+    Build an in-memory catalog of `size` crops with random but plausible
+    requirement ranges and 1-3 growing seasons each
+    Nothing is written to the database
+    """
+    rng = np.random.default_rng(seed)
+
+    # (low, high) of each range's minimum, and of the range width
+    bounds = [
+        ((4.5, 7.0), (0.5, 2.0)),       # pH
+        ((10, 150), (10, 80)),          # nitrogen
+        ((5, 80), (5, 40)),             # phosphorus
+        ((10, 150), (10, 80)),          # potassium
+        ((300, 2000), (200, 1500)),     # rainfall
+    ]
+    minimums = np.column_stack([rng.uniform(*low, size) for low, _ in bounds])
+    maximums = minimums + np.column_stack([rng.uniform(*width, size) for _, width in bounds])
+
+    season_counts = rng.integers(1, 4, size)
+    crops = []
+    for idx in range(size):
+        seasons = rng.choice(SEASON_VALUES, season_counts[idx], replace=False)
+        crops.append(Crop(
+            pk=idx + 1,
+            name=f'Crop {idx + 1}',
+            min_ph=minimums[idx, 0], max_ph=maximums[idx, 0],
+            min_nitrogen=minimums[idx, 1], max_nitrogen=maximums[idx, 1],
+            min_phosphorus=minimums[idx, 2], max_phosphorus=maximums[idx, 2],
+            min_potassium=minimums[idx, 3], max_potassium=maximums[idx, 3],
+            min_rainfall=minimums[idx, 4], max_rainfall=maximums[idx, 4],
+            suitable_seasons=','.join(seasons),
+            season_mask=season_bitmask(','.join(seasons))
+        ))
+
+    return CropCatalog(crops)
+
+
+def synthetic_samples(count, seed=0):
+    """
+    Random soil samples (ph, n, p, k, rainfall, season) spanning the catalog ranges
+    """
+    rng = np.random.default_rng(seed)
+    values = np.column_stack([
+        rng.uniform(3.5, 9.5, count),
+        rng.uniform(0, 250, count),
+        rng.uniform(0, 130, count),
+        rng.uniform(0, 250, count),
+        rng.uniform(0, 3500, count),
+    ])
+    seasons = rng.choice(SEASON_VALUES, count)
+    return [(*row, season) for row, season in zip(values.tolist(), seasons.tolist())]
+
+
+def measure(func, repeats=200, min_repeats=3, time_budget=1.0, items=1):
+    """
+    Call func repeatedly and summarize its latency
+    After one untimed warm-up call, stops after `repeats` calls or once
+    time_budget seconds are used (but never before min_repeats). Peak memory
+    comes from one extra traced call, so tracing overhead does not skew the
+    timings.
+    items: units of work per call, for throughput
+    """
+    func()
+
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < repeats:
+        call_started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - call_started)
+        if len(timings) >= min_repeats and time.perf_counter() - started >= time_budget:
+            break
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings = np.array(timings)
+    p50, p99 = np.percentile(timings, [50, 99])
+    return {
+        'repeats': int(timings.size),
+        'mean_ms': round(float(timings.mean()) * 1000, 4),
+        'p50_ms': round(float(p50) * 1000, 4),
+        'p99_ms': round(float(p99) * 1000, 4),
+        'throughput_per_s': round(items / float(p50), 2) if p50 > 0 else None,
+        'peak_memory_mb': round(peak / 2 ** 20, 3),
+    }
+
+
+def run_suite(catalog_sizes=DEFAULT_CATALOG_SIZES, batch_sizes=DEFAULT_BATCH_SIZES, repeats=200,
+              time_budget=1.0, max_cells=50_000_000, max_train_crops=1_000, seed=0, log=None):
+    """
+    Benchmark the engine on each catalog size
+
+    Cases per catalog: prepare_training_data, train_model,
+    calculate_suitability_scores (one sample, all crops), predict (one sample)
+    and predict_batch for each batch size. Cases larger than max_cells
+    (samples x crops per call), and training on catalogs above
+    max_train_crops, are skipped and listed.
+    Returns a JSON-serializable dict of results.
+    """
+    log = log or (lambda message: None)
+
+    # Fresh engine without the result cache, so every call really scores
+    engine = CropRecommendationEngine()
+    engine.result_cache = None
+
+    results = []
+    skipped = []
+
+    def run(name, crops, func, batch_size=None, items=1, **kwargs):
+        case = {'name': name, 'crops': crops, 'batch_size': batch_size}
+        kwargs.setdefault('repeats', repeats)
+        case.update(measure(func, time_budget=time_budget, items=items, **kwargs))
+        results.append(case)
+        log(format_case(case))
+
+    for size in catalog_sizes:
+        catalog = synthetic_catalog(size, seed)
+        samples = synthetic_samples(max(batch_sizes, default=1), seed)
+        single = samples[0]
+        encoded = [*single[:5], engine._encode_season(single[5])]
+
+        rows = int(catalog.season_mask.sum()) * 5
+        run('prepare_training_data', size,
+            lambda: engine.prepare_training_data(catalog, seed=seed), items=rows)
+
+        # Tree training grows with rows x classes, so it is capped separately
+        if size <= max_train_crops:
+            run('train_model', size,
+                lambda: engine.train_model(seed=seed, catalog=catalog), items=rows,
+                min_repeats=1, repeats=3)
+        else:
+            skipped.append({'name': 'train_model', 'crops': size, 'reason': 'max_train_crops'})
+
+        run('calculate_suitability_scores', size,
+            lambda: engine.calculate_suitability_scores(encoded, catalog=catalog))
+        run('predict', size, lambda: engine.predict(*single, catalog=catalog))
+
+        for batch_size in batch_sizes:
+            if batch_size * size > max_cells:
+                skipped.append({
+                    'name': 'predict_batch', 'crops': size, 'batch_size': batch_size,
+                    'reason': 'max_cells'
+                })
+                continue
+            batch = samples[:batch_size]
+            run('predict_batch', size, lambda: engine.predict_batch(batch, catalog=catalog),
+                batch_size=batch_size, items=batch_size)
+
+    return {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'sklearn': sklearn.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'seed': seed,
+            'catalog_sizes': list(catalog_sizes),
+            'batch_sizes': list(batch_sizes),
+        },
+        'results': results,
+        'skipped': skipped,
+    }
+
+
+def case_key(case):
+    return case['name'], case['crops'], case.get('batch_size')
+
+
+def format_case(case):
+    label = f'{case["name"]} crops={case["crops"]}'
+    if case.get('batch_size') is not None:
+        label += f' batch={case["batch_size"]}'
+    return (
+        f'{label:<52} p50 {case["p50_ms"]:>10.3f} ms  p99 {case["p99_ms"]:>10.3f} ms  '
+        f'{case["throughput_per_s"] or 0:>12.1f}/s  peak {case["peak_memory_mb"]:>8.2f} MB'
+    )
+
+
+def compare_runs(baseline, current, threshold=0.25):
+    """
+    Compare two run_suite results case by case
+    A metric regresses when it is worse than the baseline by more than
+    `threshold` (a fraction, 0.25 = 25%)
+    Returns a list of comparison dicts, with 'regressed' set per case
+    """
+    baseline_cases = {case_key(case): case for case in baseline['results']}
+
+    comparisons = []
+    for case in current['results']:
+        base = baseline_cases.get(case_key(case))
+        if base is None:
+            continue
+
+        changes = {}
+        regressed = []
+        for metric, lower_is_better in COMPARED_METRICS.items():
+            before, after = base[metric], case[metric]
+            if not before:
+                continue
+            change = (after - before) / before
+            changes[metric] = round(change, 4)
+            if (change if lower_is_better else -change) > threshold:
+                regressed.append(metric)
+
+        comparisons.append({
+            'name': case['name'],
+            'crops': case['crops'],
+            'batch_size': case.get('batch_size'),
+            'changes': changes,
+            'regressed': regressed,
+        })
+
+    return comparisons
@@ -0,0 +1,110 @@
+"""
+Compiled Decision Tree
+A trained DecisionTreeClassifier exported to flat NumPy arrays, with a small
+traversal that predicts exactly like scikit-learn without importing it
+"""
+
+import numpy as np
+
+# children_left/children_right value marking a leaf (sklearn's TREE_LEAF)
+LEAF = -1
+
+
+class CompiledTree:
+    """
+    Flat single-output classification tree
+
+    feature, threshold:            split of each node (ignored at leaves)
+    children_left, children_right: child node ids, LEAF at leaves
+    value:                         (nodes x classes) class probabilities
+    classes:                       class label of each probability column
+    Samples go left when X[feature] <= threshold, with X cast to float32
+    as scikit-learn does, so both give identical leaves and probabilities
+    """
+
+    def __init__(self, feature, threshold, children_left, children_right, value, classes):
+        self.feature = np.asarray(feature, dtype=np.intp)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.children_left = np.asarray(children_left, dtype=np.intp)
+        self.children_right = np.asarray(children_right, dtype=np.intp)
+        self.value = np.asarray(value, dtype=np.float64)
+        self.classes = np.asarray(classes)
+
+        # Python lists for the single-sample path, where NumPy indexing dominates
+        self._nodes = list(zip(
+            self.feature.tolist(), self.threshold.tolist(),
+            self.children_left.tolist(), self.children_right.tolist()
+        ))
+
+    @property
+    def node_count(self):
+        return self.feature.shape[0]
+
+    def apply(self, X):
+        """
+        Leaf node id reached by each row of X
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+
+        if X.shape[0] == 1:
+            return np.array([self._apply_one(X[0].tolist())], dtype=np.intp)
+
+        nodes = np.zeros(X.shape[0], dtype=np.intp)
+        active = np.flatnonzero(self.children_left[nodes] != LEAF)
+        # One step per tree level for all rows still at an internal node
+        while active.size:
+            current = nodes[active]
+            go_left = X[active, self.feature[current]] <= self.threshold[current]
+            nodes[active] = np.where(go_left, self.children_left[current], self.children_right[current])
+            active = active[self.children_left[nodes[active]] != LEAF]
+
+        return nodes
+
+    def _apply_one(self, x):
+        node = 0
+        feature, threshold, left, right = self._nodes[node]
+        while left != LEAF:
+            node = left if x[feature] <= threshold else right
+            feature, threshold, left, right = self._nodes[node]
+        return node
+
+    def predict_proba(self, X):
+        """
+        Class probabilities per row, columns in self.classes order
+        """
+        return self.value[self.apply(X)]
+
+    def predict(self, X):
+        """
+        Most probable class label per row (first class wins ties)
+        """
+        return self.classes.take(np.argmax(self.predict_proba(X), axis=1))
+
+
+def compile_tree(model, label_encoder=None):
+    """
+    Export a fitted DecisionTreeClassifier to a CompiledTree
+    With a label encoder, classes are decoded back to the original labels
+    """
+    tree = model.tree_
+    if tree.n_outputs != 1:
+        raise ValueError('Only single-output trees can be compiled')
+
+    # Since scikit-learn 1.4 classifier trees store class fractions, which
+    # predict_proba returns as they are
+    value = np.array(tree.value[:, 0, :model.n_classes_], dtype=np.float64)
+
+    classes = model.classes_
+    if label_encoder is not None:
+        classes = label_encoder.inverse_transform(classes)
+
+    return CompiledTree(
+        tree.feature,
+        tree.threshold,
+        tree.children_left,
+        tree.children_right,
+        value,
+        classes
+    )
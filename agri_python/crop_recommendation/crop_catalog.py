@@ -0,0 +1,274 @@
+"""
+Crop Catalog Matrix
+Holds crop requirement ranges as a (crops x 10) float matrix
+so the recommendation engine can score every crop in one array operation
+"""
+
+import hashlib
+import threading
+import time
+from functools import cached_property
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max
+from .models import Crop
+from .seasons import SEASON_NAMES
+
+# Column order of the requirement matrix: (min, max) pair per parameter
+RANGE_FIELDS = [
+    'min_ph', 'max_ph',
+    'min_nitrogen', 'max_nitrogen',
+    'min_phosphorus', 'max_phosphorus',
+    'min_potassium', 'max_potassium',
+    'min_rainfall', 'max_rainfall',
+]
+
+# Relative padding of the penalty windows, so float rounding at the window
+# edges can only add candidates, never drop one
+WINDOW_MARGIN = 1e-9
+
+# Absolute padding on top of it, so a value on a zero bound (min_nitrogen=0
+# and nitrogen=0 score 1.0) falls strictly inside the window too
+WINDOW_ABSOLUTE_MARGIN = 1e-9
+
+
+class PenaltyWindowIndex:
+    """
+    Sorted interval index over each parameter's penalty window
+
+    A parameter scores above 0 only for values inside [min, max] or strictly
+    inside (min * 0.5, max * 1.5); outside both _calculate_parameter_score
+    is 0. The padded windows cover both, including a value sitting on a
+    zero bound.
+    Windows are kept sorted by lower and by upper bound per parameter, so
+    the crops whose window contains a value are found by binary search on
+    the smaller side of the two.
+    """
+
+    def __init__(self, min_values, max_values):
+        # (parameters x crops), contiguous per parameter
+        self._lows = np.ascontiguousarray(
+            (min_values * 0.5 * (1 - WINDOW_MARGIN) - WINDOW_ABSOLUTE_MARGIN).T
+        )
+        self._highs = np.ascontiguousarray(
+            (max_values * 1.5 * (1 + WINDOW_MARGIN) + WINDOW_ABSOLUTE_MARGIN).T
+        )
+
+        self._low_order = np.argsort(self._lows, axis=1, kind='stable')
+        self._sorted_lows = np.take_along_axis(self._lows, self._low_order, axis=1)
+        self._high_order = np.argsort(self._highs, axis=1, kind='stable')
+        self._sorted_highs = np.take_along_axis(self._highs, self._high_order, axis=1)
+
+    def _bounds(self, param, value):
+        """
+        (crops with window low < value, first sorted position with high > value)
+        """
+        return (
+            np.searchsorted(self._sorted_lows[param], value, side='left'),
+            np.searchsorted(self._sorted_highs[param], value, side='right')
+        )
+
+    def _seed_params(self, values, min_hits):
+        """
+        The parameters with the fewest window hits (by the binary-search
+        bound), enough that any crop with min_hits hits has one among them
+        Returns (params, bound on their total hits)
+        """
+        size = self._lows.shape[1]
+        bounds = []
+        for param, value in enumerate(values):
+            low_count, high_start = self._bounds(param, value)
+            bounds.append((min(low_count, size - high_start), param))
+
+        seeds = sorted(bounds)[:len(bounds) - max(min_hits, 1) + 1]
+        return [param for _, param in seeds], sum(count for count, _ in seeds)
+
+    def prune_cost(self, values, min_hits=1):
+        """
+        Upper bound on the crops candidates() has to inspect, from the
+        binary searches alone
+        """
+        return self._seed_params(values, min_hits)[1]
+
+    def hits(self, param, value):
+        """
+        Catalog indices (unsorted) of the crops whose window for the
+        parameter contains value
+        """
+        size = self._lows.shape[1]
+        low_count, high_start = self._bounds(param, value)
+
+        if low_count <= size - high_start:
+            idx = self._low_order[param, :low_count]
+            return idx[self._highs[param, idx] > value]
+
+        idx = self._high_order[param, high_start:]
+        return idx[self._lows[param, idx] < value]
+
+    def candidates(self, values, min_hits=1):
+        """
+        Sorted catalog indices of the crops whose windows contain at least
+        min_hits of the parameter values
+
+        Such a crop has a hit among any (parameters - min_hits + 1) of the
+        parameters, so only the hits of the most selective ones are looked
+        up and then checked against every window.
+        """
+        seeds, _ = self._seed_params(values, min_hits)
+        idx = np.unique(np.concatenate([self.hits(param, values[param]) for param in seeds]))
+
+        values = np.asarray(values, dtype=np.float64)[:, np.newaxis]
+        inside = (self._lows[:, idx] < values) & (self._highs[:, idx] > values)
+        return idx[inside.sum(axis=0) >= min_hits]
+
+
+class CropCatalog:
+    """
+    Read-only matrix view of the crop requirements
+
+    ranges:       (crops x 10) float matrix, columns as in RANGE_FIELDS
+    season_bits:  per-crop season bitmask (Crop.season_mask)
+    season_mask:  (crops x seasons) bool matrix, columns as in SEASON_NAMES
+    season_crops: per season, the catalog indices of the crops grown in it
+    """
+
+    def __init__(self, crops):
+        self.crops = tuple(crops)
+
+        self.ranges = np.array(
+            [[getattr(crop, field) for field in RANGE_FIELDS] for crop in self.crops],
+            dtype=np.float64
+        ).reshape(len(self.crops), len(RANGE_FIELDS))
+
+        # Seasons come pre-parsed from the season_mask column
+        self.season_bits = np.array(
+            [crop.season_mask for crop in self.crops], dtype=np.uint8
+        )
+        self.season_mask = (
+            (self.season_bits[:, np.newaxis] >> np.arange(len(SEASON_NAMES), dtype=np.uint8)) & 1
+        ).astype(bool)
+        self.season_crops = tuple(
+            np.flatnonzero(self.season_mask[:, season]) for season in range(len(SEASON_NAMES))
+        )
+
+        for array in (self.ranges, self.season_bits, self.season_mask, *self.season_crops):
+            array.setflags(write=False)
+
+        self.version = self._fingerprint()
+
+    @classmethod
+    def from_database(cls):
+        """
+        Build a catalog from all crops currently in the database
+        """
+        return cls(Crop.objects.all())
+
+    def _fingerprint(self):
+        """
+        Short content hash identifying this catalog
+        Identical across workers for identical crop data
+        """
+        digest = hashlib.sha1()
+        for crop in self.crops:
+            digest.update(f'{crop.pk}:{crop.name};'.encode())
+        digest.update(self.ranges.tobytes())
+        digest.update(self.season_mask.tobytes())
+        return digest.hexdigest()[:12]
+
+    @cached_property
+    def window_index(self):
+        """
+        PenaltyWindowIndex over this catalog, built on first use
+        """
+        return PenaltyWindowIndex(self.min_values, self.max_values)
+
+    def crops_for_season(self, season):
+        """
+        Catalog indices of the crops grown in an encoded season
+        Empty for seasons outside SEASON_NAMES
+        """
+        if not 0 <= season < len(self.season_crops):
+            return np.array([], dtype=np.intp)
+        return self.season_crops[season]
+
+    @property
+    def min_values(self):
+        """(crops x 5) matrix of range minimums"""
+        return self.ranges[:, 0::2]
+
+    @property
+    def max_values(self):
+        """(crops x 5) matrix of range maximums"""
+        return self.ranges[:, 1::2]
+
+    def __len__(self):
+        return len(self.crops)
+
+
+class CropCatalogStore:
+    """
+    Process-wide snapshot of the crop catalog
+
+    The snapshot is built lazily and reused until invalidated by the Crop
+    post_save/post_delete signals. Writes made by other processes (other
+    workers, seed_crops) are picked up by a cheap count/updated_at check that
+    runs at most every CROP_CATALOG_REVALIDATE_SECONDS.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._catalog = None
+        self._db_marker = None
+        self._checked_at = 0.0
+        self._stale = True
+
+    def get(self):
+        """
+        Return the current catalog snapshot, rebuilding it if needed
+        """
+        catalog = self._catalog
+        if catalog is not None and not self._stale and not self._needs_revalidation():
+            return catalog
+
+        with self._lock:
+            if self._stale or self._catalog is None:
+                self._rebuild()
+            elif self._needs_revalidation():
+                self._checked_at = time.monotonic()
+                if self._current_db_marker() != self._db_marker:
+                    self._rebuild()
+            return self._catalog
+
+    def invalidate(self):
+        """
+        Mark the snapshot stale; the next get() rebuilds it
+        Waits for a rebuild in progress, which may have read older rows
+        """
+        with self._lock:
+            self._stale = True
+
+    @property
+    def version(self):
+        return self.get().version
+
+    def _rebuild(self):
+        self._stale = False
+        self._db_marker = self._current_db_marker()
+        self._checked_at = time.monotonic()
+        self._catalog = CropCatalog.from_database()
+
+    def _needs_revalidation(self):
+        interval = getattr(settings, 'CROP_CATALOG_REVALIDATE_SECONDS', 60)
+        if interval is None:
+            return False
+        return time.monotonic() - self._checked_at >= interval
+
+    @staticmethod
+    def _current_db_marker():
+        marker = Crop.objects.aggregate(count=Count('id'), last_updated=Max('updated_at'))
+        return marker['count'], marker['last_updated']
+
+
+# Global instance
+crop_catalog_store = CropCatalogStore()
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from crop_recommendation.models import CropRecommendation
+from crop_recommendation.persistence import recommendation_snapshot
+
+class Command(BaseCommand):
+    help = 'Stores the result snapshot on crop recommendations saved before snapshots existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Recommendations read and updated per batch'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        pending = CropRecommendation.objects.filter(snapshot__isnull=True)
+        self.stdout.write(f'Backfilling snapshots for {pending.count()} recommendations...')
+
+        updated = 0
+        last_pk = 0
+        while True:
+            # Keyset pagination, so each batch is an index range scan
+            batch = list(
+                pending.filter(pk__gt=last_pk)
+                .order_by('pk')
+                .select_related('soil_data__user')
+                .prefetch_related('recommendationscore_set__crop')[:batch_size]
+            )
+            if not batch:
+                break
+
+            for crop_recommendation in batch:
+                crop_recommendation.snapshot = recommendation_snapshot(
+                    crop_recommendation.soil_data,
+                    crop_recommendation.recommendationscore_set.all()
+                )
+            with transaction.atomic():
+                CropRecommendation.objects.bulk_update(batch, ['snapshot'])
+
+            updated += len(batch)
+            last_pk = batch[-1].pk
+            self.stdout.write(f'  {updated} done')
+
+        self.stdout.write(self.style.SUCCESS(f'Backfilled {updated} recommendation snapshots'))
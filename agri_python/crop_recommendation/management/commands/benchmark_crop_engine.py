@@ -0,0 +1,147 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from crop_recommendation.benchmarks import (
+    DEFAULT_BATCH_SIZES,
+    DEFAULT_CATALOG_SIZES,
+    compare_runs,
+    run_suite
+)
+
+
+def _sizes(value):
+    try:
+        sizes = [int(size) for size in value.split(',') if size.strip()]
+    except ValueError:
+        raise CommandError(f'Invalid size list: {value}')
+    if not sizes or min(sizes) < 1:
+        raise CommandError(f'Invalid size list: {value}')
+    return sizes
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the crop recommendation engine on synthetic catalogs and compares runs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            help='Write the results to this JSON file'
+        )
+        parser.add_argument(
+            '--catalog-sizes',
+            default=','.join(str(size) for size in DEFAULT_CATALOG_SIZES),
+            help='Comma-separated synthetic catalog sizes (crops)'
+        )
+        parser.add_argument(
+            '--batch-sizes',
+            default=','.join(str(size) for size in DEFAULT_BATCH_SIZES),
+            help='Comma-separated predict_batch sizes (samples)'
+        )
+        parser.add_argument(
+            '--repeats',
+            type=int,
+            default=200,
+            help='Maximum timed calls per case'
+        )
+        parser.add_argument(
+            '--time-budget',
+            type=float,
+            default=1.0,
+            help='Seconds per case after which no more calls are timed (min 3 calls)'
+        )
+        parser.add_argument(
+            '--max-cells',
+            type=int,
+            default=50_000_000,
+            help='Skip predict_batch cases above this many samples x crops'
+        )
+        parser.add_argument(
+            '--max-train-crops',
+            type=int,
+            default=1_000,
+            help='Skip training cases for catalogs larger than this'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Seed for the synthetic catalogs and samples'
+        )
+        parser.add_argument(
+            '--compare',
+            nargs='+',
+            metavar='RESULTS',
+            help='Compare against a baseline JSON file. With two files, '
+                 'compare BASELINE CURRENT without running the benchmark'
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=0.25,
+            help='Relative slowdown/memory growth flagged as a regression (0.25 = 25%%)'
+        )
+
+    def handle(self, *args, **options):
+        compare = options['compare'] or []
+        if len(compare) > 2:
+            raise CommandError('--compare takes BASELINE or BASELINE CURRENT')
+
+        if len(compare) == 2:
+            current = self._load(compare[1])
+        else:
+            if options['repeats'] < 1:
+                raise CommandError('--repeats must be at least 1')
+            self.stdout.write('Benchmarking crop recommendation engine...')
+            current = run_suite(
+                catalog_sizes=_sizes(options['catalog_sizes']),
+                batch_sizes=_sizes(options['batch_sizes']),
+                repeats=options['repeats'],
+                time_budget=options['time_budget'],
+                max_cells=options['max_cells'],
+                max_train_crops=options['max_train_crops'],
+                seed=options['seed'],
+                log=self.stdout.write
+            )
+            for case in current['skipped']:
+                self.stdout.write(
+                    f'  skipped {case["name"]} crops={case["crops"]}'
+                    f'{" batch=" + str(case["batch_size"]) if case.get("batch_size") else ""}'
+                    f' ({case["reason"]})'
+                )
+
+            if options['output']:
+                with open(options['output'], 'w') as output_file:
+                    json.dump(current, output_file, indent=2)
+                self.stdout.write(self.style.SUCCESS(f'\nResults saved to {options["output"]}'))
+
+        if compare:
+            self._compare(self._load(compare[0]), current, options['threshold'])
+
+    def _compare(self, baseline, current, threshold):
+        comparisons = compare_runs(baseline, current, threshold)
+        regressions = [comparison for comparison in comparisons if comparison['regressed']]
+
+        self.stdout.write(f'\nCompared {len(comparisons)} cases (threshold {threshold:.0%}):')
+        for comparison in comparisons:
+            label = f'{comparison["name"]} crops={comparison["crops"]}'
+            if comparison['batch_size'] is not None:
+                label += f' batch={comparison["batch_size"]}'
+            changes = '  '.join(
+                f'{metric} {change:+.1%}' for metric, change in comparison['changes'].items()
+            )
+            line = f'  {label:<52} {changes}'
+            if comparison['regressed']:
+                line = self.style.ERROR(f'{line}  REGRESSION')
+            self.stdout.write(line)
+
+        if regressions:
+            raise CommandError(f'{len(regressions)} case(s) regressed by more than {threshold:.0%}')
+        self.stdout.write(self.style.SUCCESS('\nNo regressions'))
+
+    @staticmethod
+    def _load(path):
+        try:
+            with open(path) as results_file:
+                return json.load(results_file)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not read benchmark results {path}: {e}')
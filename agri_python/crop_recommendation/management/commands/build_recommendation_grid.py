@@ -0,0 +1,90 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from crop_recommendation.crop_catalog import crop_catalog_store
+from crop_recommendation.recommendation_engine import crop_recommendation_engine
+from crop_recommendation.recommendation_grid import (
+    DEFAULT_GRID_AXES,
+    GRID_PARAMETERS,
+    build_grid,
+    grid_cells,
+    measure_accuracy,
+    parse_axis,
+    save_grid
+)
+
+class Command(BaseCommand):
+    help = 'Precomputes top-5 recommendations over a quantized soil grid for O(1) lookups'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            help='Grid path (defaults to settings.CROP_RECOMMENDATION_GRID_PATH)'
+        )
+        for name in GRID_PARAMETERS:
+            axis = DEFAULT_GRID_AXES[name]
+            parser.add_argument(
+                f'--{name}',
+                help=f'Grid axis as start:stop:step (default {axis.start:g}:{axis.stop:g}:{axis.step:g})'
+            )
+        parser.add_argument(
+            '--accuracy-samples',
+            type=int,
+            default=2000,
+            help='Random inputs compared against exact scoring (0 skips the check)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Seed for the accuracy check inputs'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            axes = {
+                name: parse_axis(options[name]) if options[name] else DEFAULT_GRID_AXES[name]
+                for name in GRID_PARAMETERS
+            }
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        catalog = crop_catalog_store.get()
+        if len(catalog) == 0:
+            raise CommandError('No crop data found. Run seed_crops first.')
+
+        self.stdout.write(
+            f'Building recommendation grid: {grid_cells(axes)} cells '
+            f'against catalog {catalog.version}...'
+        )
+
+        started = time.monotonic()
+        grid = build_grid(crop_recommendation_engine, catalog, axes, log=self.stdout.write)
+        build_seconds = time.monotonic() - started
+
+        path = save_grid(grid, options['output'])
+        self.stdout.write(self.style.SUCCESS(
+            f'\nGrid saved to {path} ({grid.cells} cells, '
+            f'{os.path.getsize(path) / 2 ** 20:.1f} MB, built in {build_seconds:.1f}s, '
+            f'{grid.boundary.mean():.1%} boundary cells)'
+        ))
+
+        if options['accuracy_samples'] > 0:
+            self.stdout.write(f'\nAccuracy on {options["accuracy_samples"]} random inputs:')
+            for label, exact_boundaries in (('lookup only', False), ('exact at boundaries', True)):
+                accuracy = measure_accuracy(
+                    crop_recommendation_engine,
+                    grid,
+                    catalog,
+                    samples=options['accuracy_samples'],
+                    seed=options['seed'],
+                    exact_boundaries=exact_boundaries
+                )
+                self.stdout.write(
+                    f'  {label:<20} top crop {accuracy["top_crop_agreement"]:.1%}, '
+                    f'full list {accuracy["full_list_agreement"]:.1%}, '
+                    f'mean score error {accuracy["mean_score_error"]:.3f}, '
+                    f'exact fallbacks {accuracy["exact_fallback_rate"]:.1%}, '
+                    f'{accuracy["lookup_us"]:.1f} us/lookup vs {accuracy["exact_us"]:.1f} us exact'
+                )
@@ -0,0 +1,348 @@
+import csv
+import io
+import json
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from agrinova_backend.bulk_files import file_format, read_records
+from authentication.models import CustomUser
+from crop_recommendation.crop_catalog import crop_catalog_store
+from crop_recommendation.models import Crop
+from crop_recommendation.persistence import save_recommendations
+from crop_recommendation.recommendation_engine import crop_recommendation_engine
+from crop_recommendation.scoring_backends import scoring_backends
+
+TOP_CROPS = 5
+NUMERIC_FIELDS = ['ph_level', 'nitrogen', 'phosphorus', 'potassium', 'rainfall']
+SEASONS = {value.lower(): value for value, _ in Crop.SEASONS}
+NO_CROPS_ERROR = 'No suitable crops found for the given parameters'
+
+# Catalog used by pool workers, set once per worker process
+_worker_catalog = None
+
+
+def _init_worker(catalog, algorithm, model_state):
+    global _worker_catalog
+    django.setup()
+    _worker_catalog = catalog
+    if model_state is not None:
+        crop_recommendation_engine.publish_model_state(algorithm, model_state)
+
+
+def _parse_float(record, field, required=True):
+    value = record.get(field)
+    if value is None or value == '':
+        if required:
+            raise ValueError(f'{field} is required')
+        return None
+    value = float(value)
+    # nan passes every range check below, and inf can't be stored
+    if not math.isfinite(value):
+        raise ValueError(f'{field} must be a number')
+    return value
+
+
+def parse_record(record):
+    """
+    Validate one input row with the same rules as the recommend endpoint
+    Raises ValueError describing the first problem found
+    """
+    data = {}
+    for field in NUMERIC_FIELDS:
+        try:
+            data[field] = _parse_float(record, field)
+        except (TypeError, ValueError):
+            raise ValueError(f'{field} must be a number')
+        if data[field] < 0:
+            raise ValueError(f'{field} must be at least 0')
+
+    if data['ph_level'] > 14:
+        raise ValueError('ph_level must be at most 14')
+
+    season = SEASONS.get(str(record.get('season') or '').strip().lower())
+    if season is None:
+        raise ValueError(f'season must be one of {", ".join(SEASONS.values())}')
+    data['season'] = season
+
+    try:
+        data['temperature'] = _parse_float(record, 'temperature', required=False)
+        data['humidity'] = _parse_float(record, 'humidity', required=False)
+    except (TypeError, ValueError):
+        raise ValueError('temperature and humidity must be numbers')
+
+    data['district'] = record.get('district') or ''
+    data['notes'] = record.get('notes') or ''
+    return data
+
+
+def csv_fieldnames(saving):
+    fieldnames = ['id', 'confidence_score']
+    for rank in range(1, TOP_CROPS + 1):
+        fieldnames += [f'crop_{rank}', f'score_{rank}']
+    if saving:
+        fieldnames.append('recommendation_id')
+    fieldnames.append('error')
+    return fieldnames
+
+
+def format_rows(rows, output_format, saving):
+    """
+    Render result rows as CSV (without header) or NDJSON text
+    """
+    if output_format == 'ndjson':
+        return ''.join(json.dumps(row) + '\n' for row in rows)
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=csv_fieldnames(saving))
+    for row in rows:
+        flat = {key: value for key, value in row.items() if key != 'recommendations'}
+        for rec in row['recommendations']:
+            flat[f'crop_{rec["ranking"]}'] = rec['crop']
+            flat[f'score_{rec["ranking"]}'] = rec['score']
+        writer.writerow(flat)
+    return buffer.getvalue()
+
+
+def process_chunk(records, first_row, output_format, saving, algorithm, catalog=None):
+    """
+    Parse, validate and score one chunk of input records
+
+    Returns (output_text, row_count, error_count, rows). When saving, output_text is
+    None and rows carry the validated data and crop ids, so the caller can
+    store them and render the output once recommendation ids are known.
+    Otherwise rows is None and the output is rendered here, which keeps the
+    per-row work in the pool workers.
+    """
+    catalog = catalog or _worker_catalog
+
+    rows = []
+    for row_number, record in enumerate(records, first_row):
+        row = {'id': record.get('id') or row_number, 'data': None, 'error': None}
+        try:
+            row['data'] = parse_record(record)
+        except ValueError as e:
+            row['error'] = str(e)
+        rows.append(row)
+
+    valid = [row for row in rows if row['data'] is not None]
+    predictions = scoring_backends.get(algorithm).predict_batch(
+        [
+            (row['data']['ph_level'], row['data']['nitrogen'], row['data']['phosphorus'],
+             row['data']['potassium'], row['data']['rainfall'], row['data']['season'])
+            for row in valid
+        ],
+        catalog=catalog
+    )
+
+    for row in rows:
+        row['recommendations'] = []
+    for row, recommendations in zip(valid, predictions):
+        row['recommendations'] = [
+            {'crop': rec['crop'].name, 'crop_id': rec['crop'].pk,
+             'score': rec['score'], 'ranking': rec['ranking']}
+            for rec in recommendations
+        ]
+        if not recommendations:
+            row['error'] = NO_CROPS_ERROR
+    errors = sum(1 for row in rows if row['error'] is not None)
+
+    if saving:
+        return None, len(rows), errors, rows
+
+    text = format_rows([_output_row(row) for row in rows], output_format, saving)
+    return text, len(rows), errors, None
+
+
+def _output_row(row, recommendation=None, saving=False):
+    output = {
+        'id': row['id'],
+        'confidence_score': crop_recommendation_engine.get_confidence_score(row['recommendations']),
+        'recommendations': [
+            {'crop': rec['crop'], 'score': rec['score'], 'ranking': rec['ranking']}
+            for rec in row['recommendations']
+        ],
+        'error': row['error'],
+    }
+    if saving:
+        output['recommendation_id'] = recommendation.pk if recommendation else None
+    return output
+
+
+class Command(BaseCommand):
+    help = 'Scores a CSV/NDJSON file of soil readings and streams recommendations to an output file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Input file (.csv, .ndjson or .jsonl)')
+        parser.add_argument('output', help='Output file (.csv, .ndjson or .jsonl)')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Rows scored per chunk'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Scoring processes (1 scores in this process)'
+        )
+        parser.add_argument(
+            '--save',
+            action='store_true',
+            help='Also store SoilData/CropRecommendation rows (requires --user)'
+        )
+        parser.add_argument('--user', help='Username that saved rows belong to')
+        parser.add_argument(
+            '--algorithm',
+            choices=scoring_backends.names(),
+            help='Scoring backend (defaults to settings.CROP_SCORING_BACKEND)'
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        workers = options['workers']
+        if chunk_size < 1 or workers < 1:
+            raise CommandError('--chunk-size and --workers must be at least 1')
+
+        user = None
+        if options['save']:
+            if not options['user']:
+                raise CommandError('--save requires --user')
+            try:
+                user = CustomUser.objects.get(username=options['user'])
+            except CustomUser.DoesNotExist:
+                raise CommandError(f'User {options["user"]} does not exist')
+        saving = user is not None
+
+        input_format = file_format(options['input'])
+        output_format = file_format(options['output'])
+
+        catalog = crop_catalog_store.get()
+        if len(catalog) == 0:
+            raise CommandError('No crop data found. Run seed_crops first.')
+        crops_by_id = {crop.pk: crop for crop in catalog.crops}
+
+        backend = scoring_backends.get(options['algorithm'])
+        algorithm = backend.name
+        model_state = None
+        if algorithm != 'range':
+            crop_recommendation_engine.load_model(algorithm=algorithm)
+            model_state = crop_recommendation_engine.get_model_state(catalog, algorithm)
+            if model_state is None:
+                raise CommandError(
+                    f'No {backend.algorithm_name} model for the current crop catalog. '
+                    f'Run train_crop_model --algorithm {algorithm} first.'
+                )
+
+        self.stdout.write(
+            f'Scoring {options["input"]} against catalog {catalog.version} '
+            f'with {backend.algorithm_name} and {workers} worker(s)...'
+        )
+
+        executor = None
+        if workers > 1:
+            # Workers never touch the database; don't hand them open connections
+            connections.close_all()
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(catalog, algorithm, model_state)
+            )
+
+        started = time.monotonic()
+        total_rows = 0
+        error_rows = 0
+
+        with open(options['input'], newline='') as input_file, \
+                open(options['output'], 'w', newline='') as output_file:
+            records = read_records(input_file, input_format)
+            if output_format == 'csv':
+                csv.DictWriter(output_file, fieldnames=csv_fieldnames(saving)).writeheader()
+
+            # Keep a bounded number of chunks in flight so memory stays constant
+            pending = deque()
+
+            def flush_oldest():
+                nonlocal total_rows, error_rows
+                result = pending.popleft()
+                if executor is not None:
+                    result = result.result()
+                text, row_count, errors, rows = result
+
+                if saving:
+                    text = self._save_rows(rows, crops_by_id, user, output_format, backend)
+                output_file.write(text)
+
+                total_rows += row_count
+                error_rows += errors
+
+                if options['verbosity'] >= 2:
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(f'  {total_rows} rows ({total_rows / elapsed:.0f} rows/sec)')
+
+            try:
+                first_row = 1
+                while True:
+                    chunk = list(islice(records, chunk_size))
+                    if not chunk:
+                        break
+
+                    if executor is not None:
+                        pending.append(executor.submit(
+                            process_chunk, chunk, first_row, output_format, saving, algorithm
+                        ))
+                    else:
+                        pending.append(process_chunk(
+                            chunk, first_row, output_format, saving, algorithm, catalog
+                        ))
+                    first_row += len(chunk)
+
+                    if len(pending) > workers * 2:
+                        flush_oldest()
+
+                while pending:
+                    flush_oldest()
+            finally:
+                if executor is not None:
+                    executor.shutdown(cancel_futures=True)
+
+        elapsed = time.monotonic() - started
+        rate = total_rows / elapsed if elapsed > 0 else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'\nScored {total_rows} rows ({error_rows} errors) in {elapsed:.1f}s '
+            f'({rate:.0f} rows/sec)'
+        ))
+
+
+    @staticmethod
+    def _save_rows(rows, crops_by_id, user, output_format, backend):
+        """
+        Store the valid rows of a scored chunk and render it with recommendation ids
+        """
+        valid = [row for row in rows if row['data'] is not None]
+        _, recommendation_rows = save_recommendations(
+            user,
+            [row['data'] for row in valid],
+            [
+                [
+                    {'crop': crops_by_id[rec['crop_id']], 'score': rec['score'], 'ranking': rec['ranking']}
+                    for rec in row['recommendations']
+                ]
+                for row in valid
+            ],
+            algorithm_used=backend.algorithm_name
+        )
+        recommendations = {id(row): rec for row, rec in zip(valid, recommendation_rows)}
+
+        return format_rows(
+            [_output_row(row, recommendations.get(id(row)), saving=True) for row in rows],
+            output_format,
+            saving=True
+        )
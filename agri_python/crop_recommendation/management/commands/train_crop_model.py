@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from crop_recommendation.recommendation_engine import (
+    DEFAULT_MODEL_ALGORITHM,
+    MODEL_ALGORITHMS,
+    crop_recommendation_engine
+)
+
+class Command(BaseCommand):
+    help = 'Trains a crop recommendation model (Decision Tree by default) and saves it as a model artifact'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--algorithm',
+            choices=list(MODEL_ALGORITHMS),
+            default=DEFAULT_MODEL_ALGORITHM,
+            help='Classifier to train'
+        )
+        parser.add_argument(
+            '--output',
+            help='Artifact path (defaults to settings.CROP_MODEL_ARTIFACT_PATH, '
+                 'suffixed with the algorithm for non-default algorithms)'
+        )
+        parser.add_argument(
+            '--samples-per-class',
+            type=int,
+            default=5,
+            help='Synthetic samples generated per (crop, season) pair'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for the synthetic training set'
+        )
+
+    def handle(self, *args, **options):
+        algorithm = options['algorithm']
+        self.stdout.write(f'Training crop model ({MODEL_ALGORITHMS[algorithm][0]})...')
+        
+        trained = crop_recommendation_engine.train_model(
+            samples_per_class=options['samples_per_class'],
+            seed=options['seed'],
+            algorithm=algorithm
+        )
+        if not trained:
+            raise CommandError('No crop data found. Run seed_crops first.')
+        
+        path = crop_recommendation_engine.save_model(options['output'], algorithm=algorithm)
+        state = crop_recommendation_engine.get_model_state(algorithm=algorithm)
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'\nModel saved to {path} '
+            f'(catalog version {state.catalog_version})'
+        ))
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+def populate_season_mask(apps, schema_editor):
+    from crop_recommendation.seasons import season_bitmask
+
+    Crop = apps.get_model('crop_recommendation', 'Crop')
+    crops = list(Crop.objects.all())
+    for crop in crops:
+        crop.season_mask = season_bitmask(crop.suitable_seasons)
+    Crop.objects.bulk_update(crops, ['season_mask'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crop_recommendation', '0003_soildata_humidity_soildata_temperature'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crop',
+            name='season_mask',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, help_text='Bitmask of suitable_seasons (bit i = seasons.SEASON_NAMES[i]), kept in sync on save'),
+        ),
+        migrations.RunPython(populate_season_mask, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crop_recommendation', '0005_soildata_reference_croprecommendation_reference'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='croprecommendation',
+            name='snapshot',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
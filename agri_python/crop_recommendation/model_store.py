@@ -0,0 +1,171 @@
+"""
+Model Artifact Storage
+Saves and loads trained crop models as versioned artifacts on disk
+"""
+
+import json
+import os
+import tempfile
+import zipfile
+from datetime import datetime, timezone
+
+import numpy as np
+from django.conf import settings
+from .compiled_tree import CompiledTree
+
+# Bump when the artifact layout changes; older artifacts are then refused
+ARTIFACT_FORMAT_VERSION = 1
+
+# Same for compiled tree files
+COMPILED_TREE_FORMAT_VERSION = 1
+
+COMPILED_TREE_ARRAYS = ('feature', 'threshold', 'children_left', 'children_right', 'value', 'classes')
+
+
+def default_artifact_path(algorithm='decision_tree'):
+    """
+    Artifact location from settings (CROP_MODEL_ARTIFACT_PATH)
+    Other algorithms are stored next to it, e.g. crop_model.random_forest.joblib
+    """
+    path = str(settings.CROP_MODEL_ARTIFACT_PATH)
+    if algorithm == 'decision_tree':
+        return path
+
+    root, extension = os.path.splitext(path)
+    return f'{root}.{algorithm}{extension}'
+
+
+def compiled_tree_path(artifact_path=None):
+    """
+    Compiled tree location next to a Decision Tree artifact,
+    e.g. crop_model.tree.npz for crop_model.joblib
+    """
+    root, _ = os.path.splitext(str(artifact_path or default_artifact_path()))
+    return f'{root}.tree.npz'
+
+
+def save_artifact(model, label_encoder, catalog_version, path=None, **metadata):
+    """
+    Write a trained model to disk (atomically, see dump_atomic)
+    Returns the artifact path
+    """
+    import sklearn
+
+    artifact = {
+        'format_version': ARTIFACT_FORMAT_VERSION,
+        'sklearn_version': sklearn.__version__,
+        'catalog_version': catalog_version,
+        'trained_at': datetime.now(timezone.utc).isoformat(),
+        'model': model,
+        'label_encoder': label_encoder,
+        **metadata,
+    }
+
+    return dump_atomic(artifact, path or default_artifact_path())
+
+
+def dump_atomic(obj, path):
+    """
+    joblib.dump obj to path (atomically, see write_atomic)
+    Returns the path
+    """
+    import joblib
+
+    return write_atomic(path, lambda tmp_file: joblib.dump(obj, tmp_file))
+
+
+def write_atomic(path, write):
+    """
+    Call write(file) on a temporary file, then move it to path
+    The file is written next to the target and renamed into place, so
+    readers never see a partially written file
+    Returns the path
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            write(tmp_file)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    return path
+
+
+def load_artifact(path=None):
+    """
+    Load a model artifact, memory-mapping its arrays
+    Returns None if the file is missing, unreadable, or was written by an
+    incompatible artifact format or scikit-learn version
+    """
+    path = path or default_artifact_path()
+    if not os.path.exists(path):
+        return None
+
+    # Unpickling the model imports scikit-learn anyway
+    import joblib
+    import sklearn
+
+    try:
+        artifact = joblib.load(path, mmap_mode='r')
+    except Exception:
+        # Not a joblib file, or pickled against classes this scikit-learn
+        # no longer has; unpickling can fail in many ways
+        return None
+
+    if not isinstance(artifact, dict):
+        return None
+    if artifact.get('format_version') != ARTIFACT_FORMAT_VERSION:
+        return None
+    if artifact.get('sklearn_version') != sklearn.__version__:
+        return None
+
+    return artifact
+
+
+def save_compiled_tree(tree, catalog_version, path=None, **metadata):
+    """
+    Write a CompiledTree as plain NumPy arrays (atomically)
+    Loading it needs neither scikit-learn nor pickle
+    Returns the path
+    """
+    arrays = {name: getattr(tree, name) for name in COMPILED_TREE_ARRAYS}
+    arrays['classes'] = arrays['classes'].astype(str)
+    info = {
+        'format_version': COMPILED_TREE_FORMAT_VERSION,
+        'catalog_version': catalog_version,
+        'compiled_at': datetime.now(timezone.utc).isoformat(),
+        **metadata,
+    }
+
+    return write_atomic(
+        path or compiled_tree_path(),
+        lambda tmp_file: np.savez(tmp_file, info=np.array(json.dumps(info)), **arrays)
+    )
+
+
+def load_compiled_tree(path=None):
+    """
+    Load a compiled tree file
+    Returns (CompiledTree, info dict), or None if the file is missing,
+    unreadable or has an incompatible format
+    """
+    path = path or compiled_tree_path()
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            info = json.loads(str(data['info']))
+            if info.get('format_version') != COMPILED_TREE_FORMAT_VERSION:
+                return None
+            tree = CompiledTree(*(data[name] for name in COMPILED_TREE_ARRAYS))
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        # Not a compiled tree file
+        return None
+
+    return tree, info
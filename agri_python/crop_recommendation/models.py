@@ -1,5 +1,21 @@
+import uuid
+
 from django.db import models
+from django.db.models import F
 from authentication.models import CustomUser
+from .seasons import SEASON_INDEX, season_bitmask
+
+class CropQuerySet(models.QuerySet):
+    def for_season(self, season):
+        """
+        Crops suitable for the given season, filtered in the database
+        """
+        idx = SEASON_INDEX.get(str(season).strip().lower())
+        if idx is None:
+            return self.none()
+        return self.annotate(
+            season_match=F('season_mask').bitand(1 << idx)
+        ).filter(season_match__gt=0)
 
 class Crop(models.Model):
     """
@@ -29,6 +45,11 @@ class Crop(models.Model):
         ('Winter', 'Winter'),
     ]
     suitable_seasons = models.CharField(max_length=200, help_text="Comma-separated seasons")
+    season_mask = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        help_text="Bitmask of suitable_seasons (bit i = seasons.SEASON_NAMES[i]), kept in sync on save"
+    )
     
     # Additional information
     growth_duration = models.IntegerField(help_text="Growth duration in days", null=True, blank=True)
@@ -38,6 +59,15 @@ class Crop(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = CropQuerySet.as_manager()
+    
+    def save(self, *args, **kwargs):
+        self.season_mask = season_bitmask(self.suitable_seasons)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'suitable_seasons' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'season_mask'}
+        super().save(*args, **kwargs)
+    
     def __str__(self):
         return self.name
     
@@ -66,6 +96,8 @@ class SoilData(models.Model):
     # Metadata
     test_date = models.DateTimeField(auto_now_add=True)
     notes = models.TextField(blank=True, help_text="Additional notes from farmer")
+    # Client-visible ID, known before the row is written (see write_behind)
+    reference = models.UUIDField(default=uuid.uuid4, null=True, editable=False, db_index=True)
     
     def __str__(self):
         return f"{self.user.username} - {self.district} - {self.test_date.date()}"
@@ -90,6 +122,11 @@ class CropRecommendation(models.Model):
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
+    # Client-visible ID, known before the row is written (see write_behind)
+    reference = models.UUIDField(default=uuid.uuid4, null=True, editable=False, db_index=True)
+    # Soil inputs and ranked crops as they were when the recommendation was made,
+    # written once on insert; history reads serve from it without joins
+    snapshot = models.JSONField(null=True, blank=True, editable=False)
     
     def __str__(self):
         return f"Recommendation for {self.user.username} - {self.created_at.date()}"
@@ -0,0 +1,145 @@
+"""
+Bulk persistence of recommendation results
+Shared by the recommendation endpoints and the recommend_bulk command
+"""
+
+from django.db import transaction
+from django.utils import timezone
+from .models import SoilData, CropRecommendation, RecommendationScore
+from .recommendation_engine import crop_recommendation_engine
+from .serializers import SoilDataSerializer, RecommendationScoreSerializer
+
+# Bump when the snapshot layout changes
+SNAPSHOT_VERSION = 1
+
+# SoilDataSerializer fields kept on the recommendation row instead of the snapshot
+SNAPSHOT_SOIL_DATA_EXCLUDED = ('id', 'user')
+
+
+def save_recommendations(user, samples, predictions, algorithm_used):
+    """
+    Store soil samples and their recommendations with one bulk insert per table
+    
+    samples:        validated recommendation request data (dicts)
+    predictions:    backend results, one list per sample
+    algorithm_used: algorithm name of the scoring backend that produced them
+    
+    Returns (soil_data_rows, recommendation_rows) aligned with samples;
+    the recommendation is None for samples without any recommended crop.
+    Each recommendation carries its inserted scores, so serializing it
+    does not query them again.
+    """
+    records = build_recommendation_records(user, samples, predictions, algorithm_used)
+    
+    with transaction.atomic():
+        insert_recommendation_records([records])
+    
+    soil_data_rows, recommendation_rows, _ = records
+    return soil_data_rows, recommendation_rows
+
+
+def build_recommendation_records(user, samples, predictions, algorithm_used):
+    """
+    Unsaved, linked SoilData, CropRecommendation and RecommendationScore
+    objects for samples (arguments as for save_recommendations)
+    
+    Returns (soil_data_rows, recommendation_rows, score_rows); rows can be
+    serialized before they are inserted, e.g. for a write-behind response
+    """
+    now = timezone.now()
+    soil_data_rows = [
+        SoilData(
+            user=user,
+            ph_level=data['ph_level'],
+            nitrogen=data['nitrogen'],
+            phosphorus=data['phosphorus'],
+            potassium=data['potassium'],
+            rainfall=data['rainfall'],
+            temperature=data.get('temperature'),
+            humidity=data.get('humidity'),
+            district=data.get('district') or 'Not Provided',
+            season=data['season'],
+            notes=data.get('notes', ''),
+            test_date=now
+        )
+        for data in samples
+    ]
+    
+    recommendation_rows = []
+    score_rows = []
+    for soil_data, recommendations in zip(soil_data_rows, predictions):
+        if not recommendations:
+            recommendation_rows.append(None)
+            continue
+        
+        crop_recommendation = CropRecommendation(
+            user=user,
+            soil_data=soil_data,
+            algorithm_used=algorithm_used,
+            confidence_score=crop_recommendation_engine.get_confidence_score(recommendations),
+            created_at=now
+        )
+        scores = [
+            RecommendationScore(
+                recommendation=crop_recommendation,
+                crop=rec['crop'],
+                score=rec['score'],
+                ranking=rec['ranking']
+            )
+            for rec in recommendations
+        ]
+        # Serve the scores we are inserting instead of re-querying them
+        crop_recommendation._prefetched_objects_cache = {'recommendationscore_set': scores}
+        recommendation_rows.append(crop_recommendation)
+        score_rows.extend(scores)
+    
+    return soil_data_rows, recommendation_rows, score_rows
+
+
+def insert_recommendation_records(batch):
+    """
+    Insert many build_recommendation_records results with one bulk insert
+    per table (call inside a transaction)
+    Foreign keys are filled in from the parent rows as they get their ids
+    """
+    SoilData.objects.bulk_create([
+        soil_data for soil_data_rows, _, _ in batch for soil_data in soil_data_rows
+    ])
+    recommendation_rows = [
+        crop_recommendation
+        for _, recommendation_rows, _ in batch
+        for crop_recommendation in recommendation_rows
+        if crop_recommendation is not None
+    ]
+    # After the SoilData insert, which sets the final test_date
+    for crop_recommendation in recommendation_rows:
+        crop_recommendation.snapshot = recommendation_snapshot(
+            crop_recommendation.soil_data,
+            crop_recommendation._prefetched_objects_cache['recommendationscore_set']
+        )
+    CropRecommendation.objects.bulk_create(recommendation_rows)
+    RecommendationScore.objects.bulk_create([
+        score for _, _, score_rows in batch for score in score_rows
+    ])
+
+
+def recommendation_snapshot(soil_data, scores):
+    """
+    JSON snapshot stored on CropRecommendation.snapshot: the soil inputs and
+    ranked crops exactly as CropRecommendationSerializer renders them
+    (see CropRecommendationSnapshotSerializer)
+    """
+    soil_data_details = SoilDataSerializer(soil_data).data
+    for name in SNAPSHOT_SOIL_DATA_EXCLUDED:
+        soil_data_details.pop(name)
+    
+    return {
+        'version': SNAPSHOT_VERSION,
+        'soil_data': dict(soil_data_details),
+        'crops': [
+            dict(score)
+            for score in RecommendationScoreSerializer(
+                sorted(scores, key=lambda score: score.ranking), many=True
+            ).data
+        ],
+    }
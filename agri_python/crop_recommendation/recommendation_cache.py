@@ -0,0 +1,94 @@
+"""
+Recommendation Result Cache
+Bounded LRU/TTL cache in front of CropRecommendationEngine.predict,
+keyed on quantized soil inputs and the crop catalog version
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+# Quantization step per input: pH, nitrogen, phosphorus, potassium (mg/kg), rainfall (mm)
+QUANTIZATION_STEPS = (0.1, 1.0, 1.0, 1.0, 10.0)
+
+
+def quantize_inputs(values):
+    """
+    Snap soil inputs to the cache grid
+    Rounded again to 6 places so e.g. pH 6.1 is stored as 6.1, not 6.1000000000000005
+    """
+    return tuple(
+        round(round(value / step) * step, 6)
+        for value, step in zip(values, QUANTIZATION_STEPS)
+    )
+
+
+class RecommendationCache:
+    """
+    Thread-safe LRU cache with per-entry expiry
+
+    Keep hit/miss/eviction/expiration counters so the size and TTL
+    can be tuned from real traffic (see stats()).
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def make_key(catalog_version, quantized_values, season_encoded):
+        return (catalog_version, season_encoded) + tuple(quantized_values)
+
+    def get(self, key):
+        """
+        Return the cached value, or None on a miss or expired entry
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            }
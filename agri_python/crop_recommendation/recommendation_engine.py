@@ -3,148 +3,561 @@ Decision Tree Algorithm for Crop Recommendation
 Based on soil pH, NPK values, rainfall, and season
 """
 
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.preprocessing import LabelEncoder
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
-import pandas as pd
-from .models import Crop
+from django.conf import settings
+from .crop_catalog import crop_catalog_store
+from .seasons import encode_season
+from .recommendation_cache import RecommendationCache, quantize_inputs
+from .compiled_tree import compile_tree
+from . import model_store
+
+# Weight of each parameter (pH, N, P, K, rainfall) in the overall score
+PARAMETER_WEIGHTS = (0.2, 0.2, 0.2, 0.2, 0.2)
+
+# Minimum score for a crop to be recommended (see _select_recommendations)
+RECOMMENDATION_CUTOFF = 0.3
+
+# Single predictions prune season candidates through the catalog's penalty
+# window index when there are at least PRUNE_MIN_CANDIDATES of them and the
+# index has to inspect at most PRUNE_MAX_FRACTION of the catalog; otherwise
+# scoring every candidate outright is cheaper
+PRUNE_MIN_CANDIDATES = 1_000
+PRUNE_MAX_FRACTION = 1.0
+
+# Upper bound on (samples x crops x parameters) elements scored at once in batch mode
+BATCH_CHUNK_ELEMENTS = 2_000_000
+
+# Everything a trained model needs, published as one immutable unit
+# compiled_tree: NumPy export of a Decision Tree (see compiled_tree.py); when
+# set, predictions use it, and model/label_encoder may be None if it was
+# loaded on its own
+ModelState = namedtuple(
+    'ModelState',
+    ['model', 'label_encoder', 'catalog_version', 'training_params', 'compiled_tree'],
+    defaults=(None,)
+)
+
+UNTRAINED = ModelState(None, None, None, {})
+
+# scikit-learn is imported on first training or artifact load only; it takes
+# about a second, which every manage.py command and worker would pay otherwise
+
+
+def _decision_tree():
+    from sklearn.tree import DecisionTreeClassifier
+    return DecisionTreeClassifier(
+        criterion='entropy',  # Use information gain
+        max_depth=10,
+        min_samples_split=5,
+        random_state=42
+    )
+
+
+def _random_forest():
+    from sklearn.ensemble import RandomForestClassifier
+    return RandomForestClassifier(
+        n_estimators=100,
+        criterion='entropy',
+        max_depth=10,
+        min_samples_split=5,
+        random_state=42
+    )
+
+
+def _gradient_boosting():
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    return HistGradientBoostingClassifier(
+        max_iter=100,
+        max_depth=10,
+        random_state=42
+    )
+
+
+def _label_encoder():
+    from sklearn.preprocessing import LabelEncoder
+    return LabelEncoder()
+
+
+def _compile_if_tree(model, label_encoder):
+    """
+    CompiledTree for a Decision Tree model, None for other classifiers
+    """
+    from sklearn.tree import DecisionTreeClassifier
+    if isinstance(model, DecisionTreeClassifier):
+        return compile_tree(model, label_encoder)
+    return None
+
+
+# Trainable classifiers: name -> (algorithm label, estimator factory)
+MODEL_ALGORITHMS = {
+    'decision_tree': ('Decision Tree', _decision_tree),
+    'random_forest': ('Random Forest', _random_forest),
+    'gradient_boosting': ('Gradient Boosting', _gradient_boosting),
+}
+
+DEFAULT_MODEL_ALGORITHM = 'decision_tree'
 
 class CropRecommendationEngine:
     """
     Crop Recommendation Engine using Decision Tree Algorithm
+    
+    Each trained model (one per MODEL_ALGORITHMS entry) lives in a single
+    ModelState reference. Training and loading build a complete new state off
+    to the side and publish it with one assignment, so concurrent requests
+    see either the old or the new model, never a mix of the two.
+    The model properties below refer to the default (Decision Tree) model.
     """
     
     def __init__(self):
-        self.model = None
-        self.label_encoder = LabelEncoder()
-        self.season_encoder = LabelEncoder()
-        self.is_trained = False
+        self._model_states = {}
+        self._publish_lock = threading.Lock()
+        self._retrain_lock = threading.Lock()
+        self._retrain_executor = None
+        self._retrain_futures = {}
+        
+        # Optional precomputed lookup grid (see load_lookup_grid)
+        self.lookup_grid = None
+        self.grid_exact_boundaries = getattr(settings, 'CROP_RECOMMENDATION_GRID_EXACT_BOUNDARIES', True)
+        
+        cache_size = getattr(settings, 'CROP_RECOMMENDATION_CACHE_SIZE', 0)
+        self.result_cache = RecommendationCache(
+            max_entries=cache_size,
+            ttl_seconds=getattr(settings, 'CROP_RECOMMENDATION_CACHE_TTL', 300)
+        ) if cache_size else None
+    
+    @property
+    def model_state(self):
+        return self._model_states.get(DEFAULT_MODEL_ALGORITHM, UNTRAINED)
+    
+    @property
+    def model(self):
+        return self.model_state.model
+    
+    @property
+    def label_encoder(self):
+        return self.model_state.label_encoder
+    
+    @property
+    def is_trained(self):
+        return self._has_model(self.model_state)
+    
+    @property
+    def model_catalog_version(self):
+        return self.model_state.catalog_version
+    
+    @property
+    def training_params(self):
+        return self.model_state.training_params
+    
+    @property
+    def trained_algorithms(self):
+        return list(self._model_states)
     
-    def prepare_training_data(self):
+    @staticmethod
+    def _has_model(state):
+        return state.model is not None or state.compiled_tree is not None
+    
+    def publish_model_state(self, algorithm, state):
+        """
+        Swap in a new ModelState for one algorithm
+        Writers are serialized; readers never lock and see a complete mapping
+        """
+        with self._publish_lock:
+            states = dict(self._model_states)
+            states[algorithm] = state
+            self._model_states = states
+    
+    def prepare_training_data(self, catalog=None, samples_per_class=5, seed=None, label_encoder=None):
         """
         Prepare training data from crop database
         Creates synthetic training samples based on crop requirements
+        Returns the full (X, y) matrices; see iter_training_data for chunks
         """
-        crops = Crop.objects.all()
+        chunks = list(self.iter_training_data(
+            catalog, samples_per_class, seed, label_encoder=label_encoder
+        ))
         
-        if not crops.exists():
+        if not chunks:
             return None, None
         
-        training_data = []
-        labels = []
+        return chunks[0]
+    
+    def iter_training_data(self, catalog=None, samples_per_class=5, seed=None, chunk_size=None,
+                           label_encoder=None):
+        """
+        Generate synthetic training samples in (X, y) chunks of up to chunk_size rows
         
-        for crop in crops:
-            # Get suitable seasons
-            seasons = [s.strip() for s in crop.suitable_seasons.split(',')]
-            
-            # Generate samples for each season
-            for season in seasons:
-                # Generate multiple samples with variations within optimal ranges
-                num_samples = 5
-                
-                for _ in range(num_samples):
-                    # Generate values within optimal ranges
-                    ph = np.random.uniform(crop.min_ph, crop.max_ph)
-                    n = np.random.uniform(crop.min_nitrogen, crop.max_nitrogen)
-                    p = np.random.uniform(crop.min_phosphorus, crop.max_phosphorus)
-                    k = np.random.uniform(crop.min_potassium, crop.max_potassium)
-                    rainfall = np.random.uniform(crop.min_rainfall, crop.max_rainfall)
-                    
-                    # Encode season
-                    season_encoded = self._encode_season(season)
-                    
-                    training_data.append([ph, n, p, k, rainfall, season_encoded])
-                    labels.append(crop.name)
-        
-        if not training_data:
-            return None, None
+        Every (crop, season) pair is one class block of samples_per_class rows,
+        with each parameter drawn uniformly from the crop's optimal range.
+        Rows are drawn from a single seeded generator in a fixed order, so the
+        same seed yields the same samples whatever the chunk size. The given
+        label encoder (a fresh one by default) is fitted up front, so
+        incremental learners can use np.arange(len(label_encoder.classes_))
+        as their class list.
+        """
+        if label_encoder is None:
+            label_encoder = _label_encoder()
+        if catalog is None:
+            catalog = crop_catalog_store.get()
         
-        X = np.array(training_data)
-        y = self.label_encoder.fit_transform(labels)
+        # One class block per (crop, season) pair, in catalog order
+        crop_idx, season_idx = np.nonzero(catalog.season_mask)
+        if crop_idx.size == 0 or samples_per_class <= 0:
+            return
         
-        return X, y
+        # Label per catalog row, for crops that have at least one season
+        labelled = np.unique(crop_idx)
+        labelled_names = [catalog.crops[idx].name for idx in labelled]
+        crop_labels = np.full(len(catalog), -1)
+        crop_labels[labelled] = label_encoder.fit_transform(labelled_names)
+        
+        rng = np.random.default_rng(seed)
+        total_rows = crop_idx.size * samples_per_class
+        chunk_size = chunk_size or total_rows
+        
+        for start in range(0, total_rows, chunk_size):
+            pair = np.arange(start, min(start + chunk_size, total_rows)) // samples_per_class
+            row_crops = crop_idx[pair]
+            
+            X = np.empty((pair.size, 6))
+            X[:, :5] = rng.uniform(catalog.min_values[row_crops], catalog.max_values[row_crops])
+            X[:, 5] = season_idx[pair]
+            
+            yield X, crop_labels[row_crops]
     
     def _encode_season(self, season):
         """
-        Encode season as numeric value
+        Encode season as numeric value (see seasons.SEASON_NAMES)
         """
-        season_map = {
-            'spring': 0,
-            'summer': 1,
-            'monsoon': 2,
-            'autumn': 3,
-            'winter': 4
-        }
-        return season_map.get(season.lower(), 0)
+        return encode_season(season)
     
-    def train_model(self):
+    def train_model(self, samples_per_class=5, seed=None, algorithm=DEFAULT_MODEL_ALGORITHM,
+                    catalog=None):
         """
-        Train the Decision Tree model
+        Train the given classifier (the Decision Tree by default)
+        on the given (or current) catalog
+        A fixed seed reproduces the same training set, and so the same model
+        The new model is only published once fully trained
         """
-        X, y = self.prepare_training_data()
+        _, make_estimator = MODEL_ALGORITHMS[algorithm]
+        
+        if catalog is None:
+            catalog = crop_catalog_store.get()
+        label_encoder = _label_encoder()
+        X, y = self.prepare_training_data(catalog, samples_per_class, seed, label_encoder)
         
         if X is None or y is None:
             return False
         
-        # Create and train Decision Tree classifier
-        self.model = DecisionTreeClassifier(
-            criterion='entropy',  # Use information gain
-            max_depth=10,
-            min_samples_split=5,
-            random_state=42
+        model = make_estimator()
+        model.fit(X, y)
+        
+        self.publish_model_state(algorithm, ModelState(
+            model,
+            label_encoder,
+            catalog.version,
+            {'samples_per_class': samples_per_class, 'seed': seed},
+            _compile_if_tree(model, label_encoder)
+        ))
+        
+        return True
+    
+    def retrain_async(self, samples_per_class=None, seed=None, algorithm=DEFAULT_MODEL_ALGORITHM):
+        """
+        Retrain on a background thread; requests keep using the current model
+        until the new one is published. Defaults to the current training params.
+        A retrain that is queued but not started yet is reused, since it will
+        train on the latest catalog anyway.
+        Returns a Future resolving to train_model's result
+        """
+        params = self._model_states.get(algorithm, UNTRAINED).training_params
+        if samples_per_class is None:
+            samples_per_class = params.get('samples_per_class', 5)
+        if seed is None:
+            seed = params.get('seed')
+        
+        with self._retrain_lock:
+            future = self._retrain_futures.get(algorithm)
+            if future is not None and not future.running() and not future.done():
+                return future
+            
+            if self._retrain_executor is None:
+                self._retrain_executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix='crop-model-retrain'
+                )
+            future = self._retrain_executor.submit(
+                self.train_model, samples_per_class, seed, algorithm
+            )
+            self._retrain_futures[algorithm] = future
+            return future
+    
+    def save_model(self, path=None, algorithm=DEFAULT_MODEL_ALGORITHM):
+        """
+        Save a trained model as an artifact for workers to load at startup
+        A compiled Decision Tree is also written next to it (.tree.npz)
+        Returns the artifact path
+        """
+        state = self._model_states.get(algorithm, UNTRAINED)
+        if state.model is None:
+            raise ValueError('Model has not been trained')
+        
+        path = model_store.save_artifact(
+            state.model,
+            state.label_encoder,
+            state.catalog_version,
+            path=path or model_store.default_artifact_path(algorithm),
+            algorithm=algorithm,
+            **state.training_params
         )
         
-        self.model.fit(X, y)
-        self.is_trained = True
+        if state.compiled_tree is not None:
+            model_store.save_compiled_tree(
+                state.compiled_tree,
+                state.catalog_version,
+                path=model_store.compiled_tree_path(path),
+                **state.training_params
+            )
+        
+        return path
+    
+    def load_model(self, path=None, algorithm=DEFAULT_MODEL_ALGORITHM):
+        """
+        Load a trained model artifact written by train_crop_model
+        Refuses (returns False) a missing, incompatible or stale artifact,
+        i.e. one trained against a different crop catalog, or one holding
+        a different algorithm
+        With CROP_MODEL_LOAD_COMPILED_TREE, the Decision Tree is served from
+        its compiled export when that is current, without unpickling the
+        scikit-learn model
+        """
+        if (algorithm == DEFAULT_MODEL_ALGORITHM
+                and getattr(settings, 'CROP_MODEL_LOAD_COMPILED_TREE', False)
+                and self.load_compiled_tree(model_store.compiled_tree_path(path))):
+            return True
+        
+        artifact = model_store.load_artifact(path or model_store.default_artifact_path(algorithm))
+        
+        if artifact is None:
+            return False
+        if artifact.get('algorithm', DEFAULT_MODEL_ALGORITHM) != algorithm:
+            return False
+        if artifact['catalog_version'] != crop_catalog_store.version:
+            return False
+        
+        model = artifact['model']
+        self.publish_model_state(algorithm, ModelState(
+            model,
+            artifact['label_encoder'],
+            artifact['catalog_version'],
+            {key: artifact[key] for key in ('samples_per_class', 'seed') if key in artifact},
+            _compile_if_tree(model, artifact['label_encoder'])
+        ))
         
         return True
     
-    def calculate_suitability_scores(self, input_data):
+    def load_compiled_tree(self, path=None):
+        """
+        Load only the compiled Decision Tree written by train_crop_model
+        Refuses (returns False) a missing, incompatible or stale file
+        """
+        loaded = model_store.load_compiled_tree(path)
+        if loaded is None:
+            return False
+        
+        tree, info = loaded
+        if info['catalog_version'] != crop_catalog_store.version:
+            return False
+        
+        self.publish_model_state(DEFAULT_MODEL_ALGORITHM, ModelState(
+            None,
+            None,
+            info['catalog_version'],
+            {key: info[key] for key in ('samples_per_class', 'seed') if key in info},
+            tree
+        ))
+        
+        return True
+    
+    def load_models(self):
+        """
+        Load the default artifact of every algorithm that has one
+        Returns the names of the algorithms loaded
+        """
+        return [algorithm for algorithm in MODEL_ALGORITHMS if self.load_model(algorithm=algorithm)]
+    
+    def load_lookup_grid(self, path=None):
+        """
+        Load the precomputed lookup grid written by build_recommendation_grid
+        Its arrays are memory-mapped, so workers share one copy
+        Refuses (returns False) a missing, incompatible or stale grid
+        """
+        from .recommendation_grid import load_grid
+        
+        grid = load_grid(path)
+        if grid is None or grid.catalog_version != crop_catalog_store.version:
+            return False
+        
+        self.lookup_grid = grid
+        return True
+    
+    def get_model(self, catalog=None, algorithm=DEFAULT_MODEL_ALGORITHM):
+        """
+        Return the trained model if it matches the given (or current) catalog
+        Returns None if untrained or if the catalog has changed since training
+        (and when only the compiled Decision Tree is loaded)
+        """
+        state = self.get_model_state(catalog, algorithm)
+        return state.model if state is not None else None
+    
+    def get_model_state(self, catalog=None, algorithm=DEFAULT_MODEL_ALGORITHM):
+        """
+        Return the current ModelState (model and its label encoder, read
+        together) if it matches the given (or current) catalog, else None
+        """
+        state = self._model_states.get(algorithm, UNTRAINED)
+        if not self._has_model(state):
+            return None
+        
+        if catalog is None:
+            catalog = crop_catalog_store.get()
+        if state.catalog_version != catalog.version:
+            return None
+        
+        return state
+    
+    def calculate_suitability_scores(self, input_data, catalog=None, top_k=None, prune_below=None):
         """
         Calculate suitability scores for all crops based on input parameters
-        Returns list of (crop_name, score, ranking)
+        All crops are scored in one array operation over the catalog matrix
+        With prune_below, large catalogs may skip the crops that cannot score
+        that high; the result then holds only crops scoring at least
+        prune_below, which are exactly the leading entries of the full ranking
+        Returns list of (crop_name, score, ranking), limited to top_k if given
         """
-        crops = Crop.objects.all()
-        scores = []
+        if catalog is None:
+            catalog = crop_catalog_store.get()
         
         ph, n, p, k, rainfall, season = input_data
+        season = int(season)
+        values = np.array([ph, n, p, k, rainfall], dtype=np.float64)
         
-        for crop in crops:
-            # Check if season is suitable
-            seasons = [s.strip().lower() for s in crop.suitable_seasons.split(',')]
-            season_names = ['spring', 'summer', 'monsoon', 'autumn', 'winter']
-            input_season = season_names[int(season)] if 0 <= season < len(season_names) else 'unknown'
-            
-            if input_season not in seasons:
-                continue
-            
-            # Calculate individual parameter scores (0-1 scale)
-            ph_score = self._calculate_parameter_score(ph, crop.min_ph, crop.max_ph)
-            n_score = self._calculate_parameter_score(n, crop.min_nitrogen, crop.max_nitrogen)
-            p_score = self._calculate_parameter_score(p, crop.min_phosphorus, crop.max_phosphorus)
-            k_score = self._calculate_parameter_score(k, crop.min_potassium, crop.max_potassium)
-            rain_score = self._calculate_parameter_score(rainfall, crop.min_rainfall, crop.max_rainfall)
-            
-            # Overall score (weighted average)
-            overall_score = (ph_score * 0.2 + 
-                           n_score * 0.2 + 
-                           p_score * 0.2 + 
-                           k_score * 0.2 + 
-                           rain_score * 0.2)
-            
-            scores.append({
-                'crop': crop,
-                'score': round(overall_score, 3)
-            })
+        # Only the crops grown in this season are scored
+        candidates = catalog.crops_for_season(season)
+        pruned = False
+        if prune_below is not None and candidates.size >= PRUNE_MIN_CANDIDATES:
+            # Crops need min_hits parameters inside their penalty window to reach prune_below
+            index = catalog.window_index
+            min_hits = self._min_window_hits(prune_below)
+            if index.prune_cost(values, min_hits) <= PRUNE_MAX_FRACTION * len(catalog):
+                reachable = index.candidates(values, min_hits)
+                candidates = reachable[catalog.season_mask[reachable, season]]
+                pruned = True
+        if candidates.size == 0:
+            return []
         
-        # Sort by score descending
-        scores.sort(key=lambda x: x['score'], reverse=True)
+        overall_scores = self._calculate_overall_scores(
+            values,
+            catalog.min_values[candidates],
+            catalog.max_values[candidates]
+        )
         
-        # Add ranking
-        for idx, item in enumerate(scores, 1):
-            item['ranking'] = idx
+        if pruned:
+            keep = overall_scores >= prune_below
+            candidates = candidates[keep]
+            overall_scores = overall_scores[keep]
         
-        return scores
+        # Sort by score descending (ties keep catalog order)
+        order = self._top_k_indices(overall_scores, top_k)
+        
+        return [
+            {
+                'crop': catalog.crops[candidates[idx]],
+                'score': float(overall_scores[idx]),
+                'ranking': ranking
+            }
+            for ranking, idx in enumerate(order, 1)
+        ]
+    
+    @staticmethod
+    def _min_window_hits(min_score):
+        """
+        Fewest parameters that must score above 0 for a crop to reach min_score
+        Each parameter scores at most 1, and scores are rounded to 3 decimals
+        """
+        reachable = np.cumsum(sorted(PARAMETER_WEIGHTS, reverse=True))
+        return int(np.searchsorted(reachable, min_score - 0.0005)) + 1
+    
+    def _calculate_overall_scores(self, values, min_values, max_values):
+        """
+        Calculate overall (weighted average) scores for a block of crops
+        values broadcasts against the (crops x 5) range matrices
+        """
+        parameter_scores = self._calculate_parameter_scores(values, min_values, max_values)
+        
+        # Accumulate term by term so results match the scalar weighted average
+        overall_scores = np.zeros(parameter_scores.shape[:-1])
+        for idx, weight in enumerate(PARAMETER_WEIGHTS):
+            overall_scores += parameter_scores[..., idx] * weight
+        
+        return self._round_scores(overall_scores)
+    
+    @staticmethod
+    def _round_scores(scores, decimals=3):
+        """
+        Round scores exactly like the builtin round()
+        np.round scales before rounding, which can flip values that sit
+        on a half step, so those few are rounded individually
+        """
+        scaled = scores * 10 ** decimals
+        rounded = np.rint(scaled) / 10 ** decimals
+        
+        halfway = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+        if halfway.any():
+            rounded[halfway] = [round(float(score), decimals) for score in scores[halfway]]
+        
+        return rounded
+    
+    @staticmethod
+    def _calculate_parameter_scores(values, min_values, max_values):
+        """
+        Array version of _calculate_parameter_score
+        1.0 inside the optimal range, decreasing linearly to 0 at 50% deviation
+        """
+        below = values < min_values
+        above = values > max_values
+        
+        distance = np.where(below, min_values - values, values - max_values)
+        penalty_factor = np.where(below, min_values, max_values) * 0.5
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = np.maximum(0.0, 1.0 - distance / penalty_factor)
+        scores = np.where(penalty_factor == 0, 0.0, scores)
+        
+        return np.where(below | above, scores, 1.0)
+    
+    @staticmethod
+    def _top_k_indices(scores, top_k=None):
+        """
+        Indices of the top_k scores, highest first
+        Ties are broken by position so results match a stable sort
+        """
+        size = scores.shape[0]
+        if top_k is None or top_k >= size:
+            candidates = np.arange(size)
+        elif top_k <= 0:
+            return np.array([], dtype=np.intp)
+        else:
+            # k-th largest score; keep everything above it plus the earliest ties
+            threshold = np.partition(scores, size - top_k)[size - top_k]
+            above = np.flatnonzero(scores > threshold)
+            ties = np.flatnonzero(scores == threshold)[:top_k - above.size]
+            candidates = np.concatenate([above, ties])
+        
+        return candidates[np.lexsort((candidates, -scores[candidates]))]
     
     def _calculate_parameter_score(self, value, min_val, max_val):
         """
@@ -170,32 +583,226 @@ class CropRecommendationEngine:
         score = max(0.0, 1.0 - (distance / penalty_factor))
         return score
     
-    def predict(self, ph_level, nitrogen, phosphorus, potassium, rainfall, season):
+    def predict(self, ph_level, nitrogen, phosphorus, potassium, rainfall, season, catalog=None):
         """
         Predict suitable crops for given soil parameters
+        Uses the shared catalog snapshot unless a specific catalog is passed
+        With a lookup grid loaded, inputs inside it are answered from the
+        nearest grid point (boundary cells are scored exactly if configured)
+        When the result cache is enabled, inputs are quantized to the cache
+        grid first so cached and fresh results are identical
         Returns list of recommended crops with scores
         """
+        if catalog is None:
+            catalog = crop_catalog_store.get()
+        
         # Encode season
         season_encoded = self._encode_season(season)
         
+        grid = self.lookup_grid
+        if grid is not None:
+            recommended = self.grid_recommendations(
+                grid,
+                (ph_level, nitrogen, phosphorus, potassium, rainfall),
+                season_encoded,
+                catalog,
+                self.grid_exact_boundaries
+            )
+            if recommended is not None:
+                return recommended
+        
+        cache_key = None
+        if self.result_cache is not None:
+            ph_level, nitrogen, phosphorus, potassium, rainfall = quantize_inputs(
+                (ph_level, nitrogen, phosphorus, potassium, rainfall)
+            )
+            cache_key = self.result_cache.make_key(
+                catalog.version,
+                (ph_level, nitrogen, phosphorus, potassium, rainfall),
+                season_encoded
+            )
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                return [dict(rec) for rec in cached]
+        
         # Prepare input
         input_features = np.array([[ph_level, nitrogen, phosphorus, potassium, 
                                    rainfall, season_encoded]])
         
-        # Calculate detailed suitability scores
+        recommended = self.score_recommendations(
+            [ph_level, nitrogen, phosphorus, potassium, rainfall, season_encoded],
+            catalog
+        )
+        
+        if cache_key is not None:
+            self.result_cache.set(cache_key, [dict(rec) for rec in recommended])
+        
+        return recommended
+    
+    def score_recommendations(self, input_data, catalog):
+        """
+        Exact recommendations for (ph, n, p, k, rainfall, encoded season)
+        """
+        # Calculate detailed suitability scores (only the top 5 are ever returned);
+        # large catalogs may skip crops that cannot reach the cutoff
         scores = self.calculate_suitability_scores(
-            [ph_level, nitrogen, phosphorus, potassium, rainfall, season_encoded]
+            input_data,
+            catalog=catalog,
+            top_k=5,
+            prune_below=RECOMMENDATION_CUTOFF
+        )
+        recommended = self._select_recommendations(scores)
+        
+        if not recommended:
+            # Nothing reached the cutoff after pruning; rank every crop for the top 3
+            scores = self.calculate_suitability_scores(input_data, catalog=catalog, top_k=5)
+            recommended = self._select_recommendations(scores)
+        
+        return recommended
+    
+    def grid_recommendations(self, grid, values, season_encoded, catalog, exact_boundaries=False):
+        """
+        Recommendations read from a lookup grid at the nearest grid point
+        Returns None when the grid cannot answer (stale for the catalog,
+        inputs outside the grid, or a boundary cell with exact_boundaries)
+        """
+        if grid.catalog_version != catalog.version:
+            return None
+        
+        looked_up = grid.lookup(values, season_encoded, exact_boundaries)
+        if looked_up is None:
+            return None
+        
+        return self._select_recommendations([
+            {
+                'crop': catalog.crops[idx],
+                'score': score,
+                'ranking': ranking
+            }
+            for ranking, (idx, score) in enumerate(looked_up, 1)
+        ])
+    
+    def predict_batch(self, samples, catalog=None):
+        """
+        Predict suitable crops for many soil samples at once
+        samples: iterable of (ph_level, nitrogen, phosphorus, potassium, rainfall, season)
+        Samples are grouped by season and each group is scored only against
+        the crops grown in that season, as an (N samples x C crops) matrix in
+        row chunks so memory stays bounded for large catalogs
+        Returns one recommendation list per sample, same format as predict()
+        """
+        if catalog is None:
+            catalog = crop_catalog_store.get()
+        
+        samples = list(samples)
+        if not samples:
+            return []
+        
+        values = np.array([sample[:5] for sample in samples], dtype=np.float64)
+        seasons = np.array([self._encode_season(sample[5]) for sample in samples])
+        results = [[] for _ in samples]
+        
+        for season in np.unique(seasons):
+            candidates = catalog.crops_for_season(season)
+            if candidates.size == 0:
+                continue
+            
+            rows = np.flatnonzero(seasons == season)
+            candidate_crops = [catalog.crops[idx] for idx in candidates.tolist()]
+            min_values = catalog.min_values[candidates][np.newaxis, :, :]
+            max_values = catalog.max_values[candidates][np.newaxis, :, :]
+            chunk_rows = max(1, BATCH_CHUNK_ELEMENTS // (candidates.size * len(PARAMETER_WEIGHTS)))
+            
+            for start in range(0, rows.size, chunk_rows):
+                chunk = rows[start:start + chunk_rows]
+                chunk_scores = self._calculate_overall_scores(
+                    values[chunk][:, np.newaxis, :], min_values, max_values
+                )
+                
+                # Stable sort per row so ties keep catalog order, as in predict()
+                top_indices = np.argsort(-chunk_scores, axis=1, kind='stable')[:, :5]
+                top_scores = np.take_along_axis(chunk_scores, top_indices, axis=1)
+                
+                for row, row_indices, row_scores in zip(
+                        chunk.tolist(), top_indices.tolist(), top_scores.tolist()):
+                    scores = [
+                        {
+                            'crop': candidate_crops[idx],
+                            'score': score,
+                            'ranking': ranking
+                        }
+                        for ranking, (idx, score) in enumerate(zip(row_indices, row_scores), 1)
+                    ]
+                    results[row] = self._select_recommendations(scores)
+        
+        return results
+    
+    def predict_with_model(self, samples, catalog=None, algorithm=DEFAULT_MODEL_ALGORITHM):
+        """
+        Predict suitable crops with a trained classifier instead of range scoring
+        samples: iterable of (ph_level, nitrogen, phosphorus, potassium, rainfall, season)
+        Each crop's score is the classifier's probability for it
+        Returns one recommendation list per sample, same format as predict(),
+        or None if the model is untrained or stale for the catalog
+        """
+        if catalog is None:
+            catalog = crop_catalog_store.get()
+        
+        state = self.get_model_state(catalog, algorithm)
+        if state is None:
+            return None
+        
+        samples = list(samples)
+        if not samples:
+            return []
+        
+        features = np.array(
+            [[*sample[:5], self._encode_season(sample[5])] for sample in samples],
+            dtype=np.float64
         )
+        if state.compiled_tree is not None:
+            probabilities = state.compiled_tree.predict_proba(features)
+            class_names = state.compiled_tree.classes
+        else:
+            probabilities = state.model.predict_proba(features)
+            # Probability columns follow model.classes_ (encoded crop names)
+            class_names = state.label_encoder.inverse_transform(state.model.classes_)
+        probabilities = self._round_scores(probabilities)
+        
+        crops_by_name = {crop.name: crop for crop in catalog.crops}
+        class_crops = [crops_by_name[name] for name in class_names]
         
+        top_indices = np.argsort(-probabilities, axis=1, kind='stable')[:, :5]
+        top_scores = np.take_along_axis(probabilities, top_indices, axis=1)
+        
+        results = []
+        for row_indices, row_scores in zip(top_indices.tolist(), top_scores.tolist()):
+            scores = [
+                {
+                    'crop': class_crops[idx],
+                    'score': score,
+                    'ranking': ranking
+                }
+                for ranking, (idx, score) in enumerate(zip(row_indices, row_scores), 1)
+                if score > 0
+            ]
+            results.append(self._select_recommendations(scores))
+        
+        return results
+    
+    def _select_recommendations(self, scores):
+        """
+        Apply the recommendation cutoff to a ranked top-5 score list
+        """
         # Filter out crops with very low scores (< 0.3)
-        recommended = [s for s in scores if s['score'] >= 0.3]
+        recommended = [s for s in scores if s['score'] >= RECOMMENDATION_CUTOFF]
         
         if not recommended:
             # If no good matches, return top 3 anyway
-            recommended = scores[:3] if len(scores) >= 3 else scores
+            recommended = scores[:3]
         
         # Return top 5 recommendations
-        return recommended[:5]
+        return recommended
     
     def get_confidence_score(self, recommendations):
         """
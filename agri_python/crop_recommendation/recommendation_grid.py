@@ -0,0 +1,294 @@
+"""
+Recommendation Lookup Grid
+Precomputed top-5 crops for every point of a quantized soil grid, stored as a
+memory-mapped artifact so all workers share one copy through the page cache
+"""
+
+import logging
+import os
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+from django.conf import settings
+from . import model_store
+from .models import Crop
+from .recommendation_engine import RECOMMENDATION_CUTOFF
+from .seasons import SEASON_NAMES, encode_season
+
+logger = logging.getLogger(__name__)
+
+# Bump when the grid layout changes; older grids are then refused
+GRID_FORMAT_VERSION = 1
+
+# One grid axis: points start, start + step, ..., stop
+GridAxis = namedtuple('GridAxis', ['start', 'stop', 'step'])
+
+GRID_PARAMETERS = ['ph', 'nitrogen', 'phosphorus', 'potassium', 'rainfall']
+
+# About 2.4M cells (with 5 seasons), ~50 MB on disk
+DEFAULT_GRID_AXES = {
+    'ph': GridAxis(3.0, 10.0, 0.5),
+    'nitrogen': GridAxis(0.0, 300.0, 25.0),
+    'phosphorus': GridAxis(0.0, 150.0, 15.0),
+    'potassium': GridAxis(0.0, 300.0, 25.0),
+    'rainfall': GridAxis(0.0, 4000.0, 250.0),
+}
+
+TOP_CROPS = 5
+
+# Scores have 3 decimals and are stored as integer thousandths
+SCORE_SCALE = 1000
+
+# Upper bound on (points x crops x parameters) elements scored at once while building
+BUILD_CHUNK_ELEMENTS = 2_000_000
+
+
+def default_grid_path():
+    """
+    Grid location from settings (CROP_RECOMMENDATION_GRID_PATH)
+    """
+    return str(settings.CROP_RECOMMENDATION_GRID_PATH)
+
+
+def axis_points(axis):
+    return axis.start + axis.step * np.arange(int(round((axis.stop - axis.start) / axis.step)) + 1)
+
+
+class RecommendationGrid:
+    """
+    Read-only lookup table
+
+    crop_index: (seasons, *axis points, 5) int catalog indices, -1 = none
+    scores:     same shape, uint16 scores in thousandths
+    boundary:   (seasons, *axis points) bool, True where the recommended crops
+                differ from a neighbouring grid point
+    """
+
+    def __init__(self, axes, catalog_version, crop_index, scores, boundary):
+        self.axes = [GridAxis(*axis) for axis in axes]
+        self.catalog_version = catalog_version
+        self.crop_index = crop_index
+        self.scores = scores
+        self.boundary = boundary
+        self.shape = crop_index.shape[1:-1]
+
+    @property
+    def cells(self):
+        return int(np.prod(self.boundary.shape))
+
+    def cell(self, values, season):
+        """
+        Index of the grid point nearest to the inputs, or None outside the grid
+        """
+        if not 0 <= season < len(SEASON_NAMES):
+            return None
+
+        cell = [season]
+        for value, axis, size in zip(values, self.axes, self.shape):
+            idx = int(np.floor((value - axis.start) / axis.step + 0.5))
+            if not 0 <= idx < size:
+                return None
+            cell.append(idx)
+        return tuple(cell)
+
+    def lookup(self, values, season, exact_boundaries=False):
+        """
+        Ranked (catalog index, score) pairs at the nearest grid point
+        Returns None outside the grid, or at boundary cells when
+        exact_boundaries is set, so the caller scores those exactly
+        """
+        cell = self.cell(values, season)
+        if cell is None:
+            return None
+        if exact_boundaries and self.boundary[cell]:
+            return None
+
+        return [
+            (idx, score / SCORE_SCALE)
+            for idx, score in zip(self.crop_index[cell].tolist(), self.scores[cell].tolist())
+            if idx >= 0
+        ]
+
+
+def build_grid(engine, catalog, axes=None, log=None):
+    """
+    Score every grid point exactly with the engine and return a RecommendationGrid
+    axes: {parameter: GridAxis}, defaults to DEFAULT_GRID_AXES
+    """
+    axes = [GridAxis(*(axes or DEFAULT_GRID_AXES)[name]) for name in GRID_PARAMETERS]
+    points = [axis_points(axis) for axis in axes]
+    shape = tuple(len(p) for p in points)
+
+    index_type = np.int16 if len(catalog) < np.iinfo(np.int16).max else np.int32
+    crop_index = np.full((len(SEASON_NAMES), *shape, TOP_CROPS), -1, dtype=index_type)
+    scores = np.zeros(crop_index.shape, dtype=np.uint16)
+
+    # All grid points of one season, as rows of (ph, n, p, k, rainfall)
+    values = np.stack(np.meshgrid(*points, indexing='ij'), axis=-1).reshape(-1, len(points))
+
+    for season, name in enumerate(SEASON_NAMES):
+        candidates = catalog.crops_for_season(season)
+        if log:
+            log(f'  {name}: {len(values)} points x {candidates.size} crops')
+        if candidates.size == 0:
+            continue
+
+        top = min(TOP_CROPS, candidates.size)
+        season_index = crop_index[season].reshape(-1, TOP_CROPS)
+        season_scores = scores[season].reshape(-1, TOP_CROPS)
+        min_values = catalog.min_values[candidates][np.newaxis, :, :]
+        max_values = catalog.max_values[candidates][np.newaxis, :, :]
+        chunk_rows = max(1, BUILD_CHUNK_ELEMENTS // (candidates.size * len(GRID_PARAMETERS)))
+
+        for start in range(0, len(values), chunk_rows):
+            chunk = values[start:start + chunk_rows]
+            chunk_scores = engine._calculate_overall_scores(
+                chunk[:, np.newaxis, :], min_values, max_values
+            )
+            # Stable sort so ties keep catalog order, as in predict()
+            order = np.argsort(-chunk_scores, axis=1, kind='stable')[:, :top]
+            season_index[start:start + len(chunk), :top] = candidates[order]
+            season_scores[start:start + len(chunk), :top] = np.rint(
+                np.take_along_axis(chunk_scores, order, axis=1) * SCORE_SCALE
+            )
+
+    return RecommendationGrid(
+        axes, catalog.version, crop_index, scores, _boundary_cells(crop_index, scores)
+    )
+
+
+def _boundary_cells(crop_index, scores):
+    """
+    Cells whose recommended crops (after the cutoff) differ from a
+    neighbouring grid point along any axis
+    """
+    # Recommended crops per cell: those above the cutoff, else the top 3
+    above = scores >= RECOMMENDATION_CUTOFF * SCORE_SCALE
+    keep = above | (~above.any(axis=-1, keepdims=True) & (np.arange(TOP_CROPS) < 3))
+    selected = np.where(keep & (crop_index >= 0), crop_index, -1)
+
+    boundary = np.zeros(selected.shape[:-1], dtype=bool)
+    for axis in range(1, selected.ndim - 1):
+        lower = [slice(None)] * (selected.ndim - 1)
+        upper = list(lower)
+        lower[axis] = slice(None, -1)
+        upper[axis] = slice(1, None)
+        differs = (selected[tuple(lower)] != selected[tuple(upper)]).any(axis=-1)
+        boundary[tuple(lower)] |= differs
+        boundary[tuple(upper)] |= differs
+    return boundary
+
+
+def save_grid(grid, path=None):
+    """
+    Write a grid artifact (atomically)
+    Returns the path
+    """
+    return model_store.dump_atomic({
+        'format_version': GRID_FORMAT_VERSION,
+        'catalog_version': grid.catalog_version,
+        'built_at': datetime.now(timezone.utc).isoformat(),
+        'axes': [tuple(axis) for axis in grid.axes],
+        'crop_index': grid.crop_index,
+        'scores': grid.scores,
+        'boundary': grid.boundary,
+    }, path or default_grid_path())
+
+
+def load_grid(path=None):
+    """
+    Load a grid artifact with its arrays memory-mapped
+    Returns None if the file is missing, unreadable or has an incompatible format
+    """
+    path = path or default_grid_path()
+    if not os.path.exists(path):
+        return None
+
+    try:
+        artifact = joblib.load(path, mmap_mode='r')
+    except Exception:
+        # Truncated or not a joblib file; workers then score exactly
+        logger.exception('Could not read recommendation grid %s', path)
+        return None
+    if not isinstance(artifact, dict) or artifact.get('format_version') != GRID_FORMAT_VERSION:
+        return None
+
+    return RecommendationGrid(
+        artifact['axes'],
+        artifact['catalog_version'],
+        artifact['crop_index'],
+        artifact['scores'],
+        artifact['boundary']
+    )
+
+
+def measure_accuracy(engine, grid, catalog, samples=2000, seed=0, exact_boundaries=False):
+    """
+    Compare grid lookups with exact scoring on random inputs inside the grid,
+    in the seasons requests can name (Crop.SEASONS)
+    Returns agreement rates, mean score error and per-call timings
+    """
+    rng = np.random.default_rng(seed)
+    values = np.column_stack([
+        rng.uniform(axis.start, axis.stop, samples) for axis in grid.axes
+    ])
+    seasons = rng.choice([encode_season(value) for value, _ in Crop.SEASONS], samples)
+
+    same_top = same_list = fallbacks = 0
+    score_errors = []
+    lookup_seconds = exact_seconds = 0.0
+
+    for row, season in zip(values.tolist(), seasons.tolist()):
+        started = time.perf_counter()
+        looked_up = engine.grid_recommendations(grid, row, season, catalog, exact_boundaries)
+        lookup_seconds += time.perf_counter() - started
+
+        started = time.perf_counter()
+        exact = engine.score_recommendations([*row, season], catalog)
+        exact_seconds += time.perf_counter() - started
+
+        if looked_up is None:
+            fallbacks += 1
+            looked_up = exact
+
+        exact_scores = {rec['crop'].pk: rec['score'] for rec in exact}
+        # Both empty (no crops in the season) also agrees
+        same_top += [rec['crop'].pk for rec in looked_up[:1]] == [rec['crop'].pk for rec in exact[:1]]
+        same_list += [rec['crop'].pk for rec in looked_up] == [rec['crop'].pk for rec in exact]
+        score_errors += [
+            abs(rec['score'] - exact_scores[rec['crop'].pk])
+            for rec in looked_up if rec['crop'].pk in exact_scores
+        ]
+
+    return {
+        'samples': samples,
+        'top_crop_agreement': round(same_top / samples, 4),
+        'full_list_agreement': round(same_list / samples, 4),
+        'mean_score_error': round(float(np.mean(score_errors)), 4) if score_errors else 0.0,
+        'exact_fallback_rate': round(fallbacks / samples, 4),
+        'lookup_us': round(lookup_seconds / samples * 1e6, 2),
+        'exact_us': round(exact_seconds / samples * 1e6, 2),
+    }
+
+
+def parse_axis(value):
+    """
+    GridAxis from a 'start:stop:step' string
+    """
+    try:
+        start, stop, step = (float(part) for part in value.split(':'))
+    except ValueError:
+        raise ValueError(f'Invalid grid axis {value!r}, expected start:stop:step')
+    if step <= 0 or stop < start:
+        raise ValueError(f'Invalid grid axis {value!r}, expected start <= stop and step > 0')
+    return GridAxis(start, stop, step)
+
+
+def grid_cells(axes):
+    """
+    Number of cells of a grid with the given axes (all seasons)
+    """
+    return len(SEASON_NAMES) * int(np.prod([len(axis_points(axes[name])) for name in GRID_PARAMETERS]))
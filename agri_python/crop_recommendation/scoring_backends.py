@@ -0,0 +1,173 @@
+"""
+Scoring Backends
+Interchangeable ways of turning soil parameters into ranked crop
+recommendations, selectable by name per request
+"""
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from django.conf import settings
+from .recommendation_engine import MODEL_ALGORITHMS, crop_recommendation_engine
+
+# Number of recent calls kept per backend for latency percentiles
+LATENCY_WINDOW = 1000
+
+
+class LatencyStats:
+    """
+    Thread-safe inference latency counters for one backend
+    Percentiles are computed over the most recent LATENCY_WINDOW calls
+    """
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=window)
+        self.calls = 0
+        self.samples = 0
+        self.total_seconds = 0.0
+
+    def record(self, seconds, samples=1):
+        with self._lock:
+            self._recent.append(seconds)
+            self.calls += 1
+            self.samples += samples
+            self.total_seconds += seconds
+
+    def stats(self):
+        with self._lock:
+            recent = np.array(self._recent)
+            calls, samples, total = self.calls, self.samples, self.total_seconds
+
+        if recent.size == 0:
+            p50 = p99 = 0.0
+        else:
+            p50, p99 = np.percentile(recent, [50, 99]) * 1000
+
+        return {
+            'calls': calls,
+            'samples': samples,
+            'mean_ms_per_call': round(total / calls * 1000, 3) if calls else 0.0,
+            'mean_ms_per_sample': round(total / samples * 1000, 3) if samples else 0.0,
+            'p50_ms': round(float(p50), 3),
+            'p99_ms': round(float(p99), 3),
+        }
+
+
+class ScoringBackend:
+    """
+    Base class for scoring backends
+
+    name:           identifier used to select the backend
+    algorithm_name: stored as CropRecommendation.algorithm_used
+    Subclasses implement _predict_batch; predictions return None when the
+    backend cannot serve the catalog (e.g. its model is not trained)
+    """
+    name = None
+    algorithm_name = None
+
+    def __init__(self):
+        self.latency = LatencyStats()
+
+    def is_available(self, catalog=None):
+        return True
+
+    def predict(self, ph_level, nitrogen, phosphorus, potassium, rainfall, season, catalog=None):
+        """
+        Recommend crops for one soil sample, recording the latency
+        """
+        started = time.perf_counter()
+        recommendations = self._predict(
+            (ph_level, nitrogen, phosphorus, potassium, rainfall, season), catalog
+        )
+        self.latency.record(time.perf_counter() - started)
+        return recommendations
+
+    def predict_batch(self, samples, catalog=None):
+        """
+        Recommend crops for many soil samples, recording the latency
+        """
+        samples = list(samples)
+        started = time.perf_counter()
+        results = self._predict_batch(samples, catalog)
+        self.latency.record(time.perf_counter() - started, len(samples))
+        return results
+
+    def _predict(self, sample, catalog):
+        results = self._predict_batch([sample], catalog)
+        return None if results is None else results[0]
+
+    def _predict_batch(self, samples, catalog):
+        raise NotImplementedError
+
+
+class RangeScoringBackend(ScoringBackend):
+    """
+    Rule-based scoring against each crop's optimal parameter ranges
+    Needs no training; single predictions go through the result cache
+    """
+    name = 'range'
+    algorithm_name = 'Range Scoring'
+
+    def _predict(self, sample, catalog):
+        return crop_recommendation_engine.predict(*sample, catalog=catalog)
+
+    def _predict_batch(self, samples, catalog):
+        return crop_recommendation_engine.predict_batch(samples, catalog=catalog)
+
+
+class ModelScoringBackend(ScoringBackend):
+    """
+    Class probabilities of a trained classifier (see MODEL_ALGORITHMS)
+    Only available once the model is trained or loaded for the current catalog
+    """
+
+    def __init__(self, algorithm):
+        super().__init__()
+        self.name = algorithm
+        self.algorithm_name = MODEL_ALGORITHMS[algorithm][0]
+
+    def is_available(self, catalog=None):
+        return crop_recommendation_engine.get_model_state(catalog, self.name) is not None
+
+    def _predict_batch(self, samples, catalog):
+        return crop_recommendation_engine.predict_with_model(samples, catalog, self.name)
+
+
+class ScoringBackendRegistry:
+    """
+    Name -> backend mapping with a server default (CROP_SCORING_BACKEND)
+    """
+
+    def __init__(self):
+        self._backends = {}
+
+    def register(self, backend):
+        self._backends[backend.name] = backend
+        return backend
+
+    def get(self, name=None):
+        """
+        Return the named backend, or the server default if no name is given
+        Raises KeyError for unknown names
+        """
+        return self._backends[name or self.default_name]
+
+    @property
+    def default_name(self):
+        return getattr(settings, 'CROP_SCORING_BACKEND', RangeScoringBackend.name)
+
+    def names(self):
+        return list(self._backends)
+
+    def __iter__(self):
+        return iter(self._backends.values())
+
+
+# Global instance
+scoring_backends = ScoringBackendRegistry()
+scoring_backends.register(RangeScoringBackend())
+for _algorithm in MODEL_ALGORITHMS:
+    scoring_backends.register(ModelScoringBackend(_algorithm))
@@ -0,0 +1,31 @@
+"""
+Season Encoding
+Single source of the season order used by the models, the crop catalog
+and the recommendation engine
+"""
+
+# Season order used for encoding (index = encoded season value, bit in masks)
+SEASON_NAMES = ['spring', 'summer', 'monsoon', 'autumn', 'winter']
+
+SEASON_INDEX = {name: idx for idx, name in enumerate(SEASON_NAMES)}
+
+
+def encode_season(season, default=0):
+    """
+    Encode a season name (any case) as its index in SEASON_NAMES
+    Unknown seasons map to `default`
+    """
+    return SEASON_INDEX.get(str(season).strip().lower(), default)
+
+
+def season_bitmask(suitable_seasons):
+    """
+    Convert a comma-separated season string into a bitmask
+    Bit i is set when SEASON_NAMES[i] is listed; unknown names are ignored
+    """
+    mask = 0
+    for name in suitable_seasons.split(','):
+        idx = SEASON_INDEX.get(name.strip().lower())
+        if idx is not None:
+            mask |= 1 << idx
+    return mask
@@ -1,5 +1,7 @@
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
 from .models import Crop, SoilData, CropRecommendation, RecommendationScore
+from .scoring_backends import scoring_backends
 
 class CropSerializer(serializers.ModelSerializer):
     class Meta:
@@ -12,8 +14,17 @@ class SoilDataSerializer(serializers.ModelSerializer):
     class Meta:
         model = SoilData
         fields = ['id', 'user', 'ph_level', 'nitrogen', 'phosphorus', 'potassium', 
-                  'rainfall', 'temperature', 'humidity', 'district', 'season', 'test_date', 'notes']
-        read_only_fields = ['id', 'test_date']
+                  'rainfall', 'temperature', 'humidity', 'district', 'season', 'test_date', 'notes',
+                  'reference']
+        read_only_fields = ['id', 'test_date', 'reference']
+
+class RecommendationScoreListSerializer(serializers.ListSerializer):
+    def get_attribute(self, instance):
+        # A recommendation queued for a write-behind insert has no id yet, so its
+        # reverse manager can't be used; serve the scores it was built with
+        if instance.pk is None:
+            return instance._prefetched_objects_cache['recommendationscore_set']
+        return super().get_attribute(instance)
 
 class RecommendationScoreSerializer(serializers.ModelSerializer):
     crop_name = serializers.ReadOnlyField(source='crop.name')
@@ -22,6 +33,7 @@ class RecommendationScoreSerializer(serializers.ModelSerializer):
     class Meta:
         model = RecommendationScore
         fields = ['crop_name', 'crop_description', 'score', 'ranking']
+        list_serializer_class = RecommendationScoreListSerializer
 
 class CropRecommendationSerializer(serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source='user.username')
@@ -36,8 +48,77 @@ class CropRecommendationSerializer(serializers.ModelSerializer):
         model = CropRecommendation
         fields = ['id', 'user', 'soil_data', 'soil_data_details', 
                   'recommended_crops_details', 'algorithm_used', 
-                  'confidence_score', 'created_at', 'is_active']
-        read_only_fields = ['id', 'created_at']
+                  'confidence_score', 'created_at', 'is_active', 'reference']
+        read_only_fields = ['id', 'created_at', 'reference']
+
+# Related rows CropRecommendationSerializer reads, fetched in bulk
+CROP_RECOMMENDATION_PREFETCH = [
+    'user',
+    'soil_data__user',
+    Prefetch(
+        'recommendationscore_set',
+        queryset=RecommendationScore.objects.select_related('crop')
+    ),
+]
+
+class CropRecommendationSnapshotListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Rows without a snapshot are rendered from the related tables; fetch
+        # those for all of them at once (a constant 4 queries) instead of per row
+        rows = list(data.all() if hasattr(data, 'all') else data)
+        prefetch_related_objects(
+            [row for row in rows if not row.snapshot], *CROP_RECOMMENDATION_PREFETCH
+        )
+        return super().to_representation(rows)
+
+class CropRecommendationSnapshotSerializer(CropRecommendationSerializer):
+    """
+    Same output as CropRecommendationSerializer, rendered from the row's
+    snapshot so no soil data, score or crop rows are read
+    Rows without a snapshot (not backfilled yet) use the related tables.
+    """
+    # Read from the row itself; everything else comes from the snapshot
+    ROW_FIELDS = ['id', 'algorithm_used', 'confidence_score', 'created_at', 'is_active', 'reference']
+    
+    def to_representation(self, instance):
+        snapshot = instance.snapshot
+        if not snapshot:
+            # No-op for rows the list serializer already prefetched
+            prefetch_related_objects([instance], *CROP_RECOMMENDATION_PREFETCH)
+            return super().to_representation(instance)
+        
+        username = self._username(instance)
+        row = {}
+        for name in self.ROW_FIELDS:
+            value = getattr(instance, name)
+            row[name] = None if value is None else self.fields[name].to_representation(value)
+        
+        return {
+            'id': row['id'],
+            'user': username,
+            'soil_data': instance.soil_data_id,
+            'soil_data_details': {
+                'id': instance.soil_data_id,
+                'user': username,
+                **snapshot['soil_data']
+            },
+            'recommended_crops_details': snapshot['crops'],
+            'algorithm_used': row['algorithm_used'],
+            'confidence_score': row['confidence_score'],
+            'created_at': row['created_at'],
+            'is_active': row['is_active'],
+            'reference': row['reference'],
+        }
+    
+    class Meta(CropRecommendationSerializer.Meta):
+        list_serializer_class = CropRecommendationSnapshotListSerializer
+    
+    def _username(self, instance):
+        # History only lists the requesting user's rows, so skip the user lookup
+        request = self.context.get('request')
+        if request is not None and request.user.pk == instance.user_id:
+            return request.user.username
+        return instance.user.username
 
 class CropRecommendationRequestSerializer(serializers.Serializer):
     """
@@ -52,3 +133,24 @@ class CropRecommendationRequestSerializer(serializers.Serializer):
     humidity = serializers.FloatField(min_value=0, max_value=100, required=False, allow_null=True)
     season = serializers.ChoiceField(choices=Crop.SEASONS)
     notes = serializers.CharField(required=False, allow_blank=True)
+    algorithm = serializers.ChoiceField(
+        choices=scoring_backends.names(),
+        required=False,
+        help_text='Scoring backend (defaults to the server setting)'
+    )
+
+class CropRecommendationBatchRequestSerializer(serializers.Serializer):
+    """
+    Serializer for batch crop recommendation request
+    Each sample is validated separately with CropRecommendationRequestSerializer
+    """
+    samples = serializers.ListField(
+        child=serializers.DictField(),
+        min_length=1,
+        max_length=1000
+    )
+    algorithm = serializers.ChoiceField(
+        choices=scoring_backends.names(),
+        required=False,
+        help_text='Scoring backend for all samples (defaults to the server setting)'
+    )
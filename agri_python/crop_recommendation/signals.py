@@ -0,0 +1,33 @@
+"""
+Signal handlers for the crop recommendation app
+Keeps the in-memory crop catalog snapshot in sync with the database
+"""
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Crop
+from .crop_catalog import crop_catalog_store
+from .recommendation_engine import crop_recommendation_engine
+
+
+@receiver(post_save, sender=Crop)
+@receiver(post_delete, sender=Crop)
+def invalidate_crop_catalog(sender, **kwargs):
+    """
+    Drop the cached catalog snapshot whenever a crop changes
+    Optionally retrain the loaded models in the background, since they no
+    longer match the catalog
+    Both happen once the transaction commits, so a rebuild never caches
+    uncommitted rows and a rolled-back save changes nothing
+    """
+    transaction.on_commit(catalog_changed)
+
+
+def catalog_changed():
+    crop_catalog_store.invalidate()
+
+    if getattr(settings, 'CROP_MODEL_RETRAIN_ON_CATALOG_CHANGE', False):
+        for algorithm in crop_recommendation_engine.trained_algorithms:
+            crop_recommendation_engine.retrain_async(algorithm=algorithm)
@@ -1,3 +1,1222 @@
-from django.test import TestCase
+import csv
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.apps import apps
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from agrinova_backend.idempotency import idempotency_store
+from agrinova_backend.write_behind import WriteBehindQueue
+from . import model_store
+from .benchmarks import compare_runs
+from .crop_catalog import RANGE_FIELDS, CropCatalog, crop_catalog_store
+from .models import Crop, CropRecommendation, RecommendationScore, SoilData
+from .recommendation_cache import RecommendationCache
+from .recommendation_engine import RECOMMENDATION_CUTOFF, CropRecommendationEngine
+from .recommendation_grid import GridAxis, build_grid, load_grid, measure_accuracy, save_grid
+from .scoring_backends import LatencyStats, scoring_backends
+from .seasons import SEASON_NAMES, season_bitmask
+from .serializers import CropRecommendationSerializer
+
+# Seconds allowed for django.setup() plus URLconf loading in a fresh interpreter
+# (about 0.8s here; about 1.9s while scikit-learn and pandas loaded eagerly)
+IMPORT_TIME_BUDGET = float(os.environ.get('IMPORT_TIME_BUDGET', 1.5))
+
+# Only loaded once a training or model artifact path needs them
+LAZY_MODULES = ('sklearn', 'pandas', 'joblib')
+
+STARTUP_SCRIPT = '''
+import sys, time
+started = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(time.perf_counter() - started)
+print(','.join(name for name in {modules!r} if name in sys.modules))
+'''
+
+
+def in_memory_crop(pk, name, ranges, seasons='Summer'):
+    """
+    Unsaved Crop with the given (min, max, ...) ranges, in RANGE_FIELDS order
+    """
+    return Crop(
+        pk=pk,
+        name=name,
+        suitable_seasons=seasons,
+        season_mask=season_bitmask(seasons),
+        **dict(zip(RANGE_FIELDS, (float(value) for value in ranges)))
+    )
+
+
+def random_catalog(rng, size, zero_fraction=0.0, seasons=('Summer', 'Summer,Winter', 'Winter'), decimals=1):
+    """
+    In-memory catalog of random ranges rounded to `decimals`; zero_fraction
+    of the range bounds (pH excluded) are set to 0
+    """
+    minimums = rng.uniform([4, 0, 0, 0, 0], [7, 120, 60, 120, 1500], (size, 5)).round(decimals)
+    maximums = minimums + rng.uniform([0.5, 5, 5, 5, 100], [2, 80, 40, 80, 1500], (size, 5)).round(decimals)
+    minimums[:, 1:][rng.random((size, 4)) < zero_fraction] = 0
+    maximums[:, 1:][rng.random((size, 4)) < zero_fraction / 4] = 0
+    maximums = np.maximum(minimums, maximums)
+
+    ranges = np.empty((size, 10))
+    ranges[:, 0::2] = minimums
+    ranges[:, 1::2] = maximums
+    return CropCatalog(
+        in_memory_crop(idx + 1, f'Crop {idx + 1}', row, seasons[idx % len(seasons)])
+        for idx, row in enumerate(ranges.tolist())
+    )
+
+
+def random_inputs(rng, count, zero_fraction=0.0):
+    """
+    Random (ph, n, p, k, rainfall, encoded season) inputs, some values 0
+    """
+    values = rng.uniform([3, 0, 0, 0, 0], [10, 250, 120, 250, 3000], (count, 5)).round(1)
+    values[:, 1:][rng.random((count, 4)) < zero_fraction] = 0
+    seasons = rng.choice([1, 4], count)
+    return [[*row, season] for row, season in zip(values.tolist(), seasons.tolist())]
+
+
+def create_sample_crops():
+    crops = (('Rice', 60, 'Summer,Monsoon'), ('Wheat', 60, 'Winter'), ('Maize', 100, 'Summer'))
+    created = [
+        Crop.objects.create(
+            name=name,
+            min_ph=5.5, max_ph=7.0,
+            min_nitrogen=min_nitrogen, max_nitrogen=150,
+            min_phosphorus=30, max_phosphorus=60,
+            min_potassium=30, max_potassium=60,
+            min_rainfall=800, max_rainfall=2000,
+            suitable_seasons=seasons
+        )
+        for name, min_nitrogen, seasons in crops
+    ]
+    # The signals invalidate the catalog on commit, which test transactions never do
+    crop_catalog_store.invalidate()
+    return created
+
+
+def ranked(recommendations):
+    return [(rec['crop'].name, rec['score'], rec['ranking']) for rec in recommendations]
+
+
+class ImportTimeTests(SimpleTestCase):
+    def run_startup(self):
+        result = subprocess.run(
+            [sys.executable, '-c', STARTUP_SCRIPT.format(modules=LAZY_MODULES)],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True
+        )
+        seconds, loaded = result.stdout.split('\n')[:2]
+        return float(seconds), [name for name in loaded.split(',') if name]
+
+    def test_startup_does_not_load_heavy_dependencies(self):
+        _, loaded = self.run_startup()
+        self.assertEqual(loaded, [])
+
+    def test_startup_within_budget(self):
+        # Best of three, so one slow start on a busy machine doesn't fail the test
+        seconds = min(self.run_startup()[0] for _ in range(3))
+        self.assertLess(
+            seconds, IMPORT_TIME_BUDGET,
+            f'django.setup() + URLconf took {seconds:.2f}s (budget {IMPORT_TIME_BUDGET}s)'
+        )
+
+
+@override_settings(CROP_CATALOG_REVALIDATE_SECONDS=None, CROP_SCORING_BACKEND='range')
+class CropRecommendationViewTests(TestCase):
+    def setUp(self):
+        create_sample_crops()
+        # Build the catalog snapshot up front, as a warm worker would have it
+        crop_catalog_store.get()
+
+        self.user = get_user_model().objects.create_user(username='farmer', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.payload = {
+            'ph_level': 6.5,
+            'nitrogen': 90,
+            'phosphorus': 45,
+            'potassium': 40,
+            'rainfall': 1200,
+            'season': 'Summer',
+        }
+
+    def test_recommend_write_path_query_count(self):
+        # Savepoint, SoilData insert, CropRecommendation insert, one bulk
+        # insert for the scores, release; the response needs no queries
+        with self.assertNumQueries(5):
+            response = self.client.post(reverse('crop_recommendation:recommend'), self.payload, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        details = response.data['recommendation']['recommended_crops_details']
+        self.assertEqual([crop['crop_name'] for crop in details], ['Rice', 'Maize'])
+        self.assertEqual(response.data['recommendation']['user'], 'farmer')
+        self.assertEqual(RecommendationScore.objects.count(), 2)
+
+    def test_recommend_retry_with_idempotency_key_is_replayed(self):
+        idempotency_store.clear()
+        url = reverse('crop_recommendation:recommend')
+        first = self.client.post(url, self.payload, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+
+        # Only the key lookup; nothing is scored or written again
+        with self.assertNumQueries(1):
+            retry = self.client.post(url, self.payload, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data['recommendation']['id'], first.data['recommendation']['id'])
+        self.assertEqual(CropRecommendation.objects.count(), 1)
+
+        changed = self.client.post(
+            url, {**self.payload, 'ph_level': 6.0}, format='json', HTTP_IDEMPOTENCY_KEY='retry-1'
+        )
+        self.assertEqual(changed.status_code, 422)
+
+    def test_recommend_with_write_behind_returns_references(self):
+        queue = WriteBehindQueue(enabled=True, flush_interval=60)
+        self.addCleanup(queue.close)
+        url = reverse('crop_recommendation:recommend')
+
+        with mock.patch('crop_recommendation.views.write_behind_queue', queue):
+            with self.assertNumQueries(0):
+                response = self.client.post(url, self.payload, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['queued'])
+        recommendation = response.data['recommendation']
+        self.assertIsNone(recommendation['id'])
+        self.assertIsNone(recommendation['soil_data'])
+        self.assertFalse(CropRecommendation.objects.exists())
+
+        self.assertEqual(queue.flush(), 1)
+        stored = CropRecommendation.objects.get(reference=recommendation['reference'])
+        self.assertEqual(str(stored.soil_data.reference), recommendation['soil_data_details']['reference'])
+        self.assertEqual(stored.recommendationscore_set.count(), 2)
+
+    def test_recommend_writes_synchronously_when_queue_is_full(self):
+        queue = WriteBehindQueue(enabled=True, flush_interval=60, max_pending=0)
+
+        with mock.patch('crop_recommendation.views.write_behind_queue', queue):
+            response = self.client.post(reverse('crop_recommendation:recommend'), self.payload, format='json')
+
+        self.assertFalse(response.data['queued'])
+        self.assertTrue(CropRecommendation.objects.filter(pk=response.data['recommendation']['id']).exists())
+
+    def test_recommend_without_suitable_crops_keeps_soil_data(self):
+        payload = {**self.payload, 'season': 'Spring'}
+
+        response = self.client.post(reverse('crop_recommendation:recommend'), payload, format='json')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertTrue(SoilData.objects.filter(pk=response.data['soil_data_id']).exists())
+        self.assertFalse(CropRecommendation.objects.exists())
+
+    def test_batch_reports_invalid_samples_in_place(self):
+        samples = [
+            self.payload,
+            {**self.payload, 'ph_level': 20},
+            {**self.payload, 'season': 'Spring'},
+            {**self.payload, 'season': 'Winter', 'nitrogen': 70},
+        ]
+
+        response = self.client.post(
+            reverse('crop_recommendation:recommend-batch'), {'samples': samples}, format='json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([result['index'] for result in results], [0, 1, 2, 3])
+        self.assertEqual(
+            [crop['crop_name'] for crop in results[0]['recommendation']['recommended_crops_details']],
+            ['Rice', 'Maize']
+        )
+        self.assertIn('ph_level', results[1]['error'])
+        self.assertNotIn('recommendation', results[1])
+        self.assertEqual(results[2]['error'], 'No suitable crops found for the given parameters')
+        self.assertTrue(SoilData.objects.filter(pk=results[2]['soil_data_id']).exists())
+        self.assertEqual(
+            [crop['crop_name'] for crop in results[3]['recommendation']['recommended_crops_details']],
+            ['Wheat']
+        )
+        self.assertEqual(response.data['message'], 'Generated 2 of 4 recommendations')
+        self.assertEqual(SoilData.objects.count(), 3)
+        self.assertEqual(CropRecommendation.objects.count(), 2)
+
+    def test_batch_insert_query_count_is_constant(self):
+        url = reverse('crop_recommendation:recommend-batch')
+
+        # Savepoint, one bulk insert per table, release
+        for count in (2, 20):
+            samples = [{**self.payload, 'nitrogen': 60 + idx} for idx in range(count)]
+            with self.assertNumQueries(5):
+                response = self.client.post(url, {'samples': samples}, format='json')
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(CropRecommendation.objects.count(), 22)
+        self.assertEqual(RecommendationScore.objects.count(), 44)
+
+    def test_history_served_from_snapshot(self):
+        url = reverse('crop_recommendation:recommend')
+        self.client.post(url, self.payload, format='json')
+        self.client.post(url, {**self.payload, 'nitrogen': 120}, format='json')
+        expected = CropRecommendationSerializer(CropRecommendation.objects.all(), many=True).data
+
+        with self.assertNumQueries(1):
+            history = self.client.get(reverse('crop_recommendation:recommendation-history'))
+
+        self.assertEqual(history.json(), expected)
+
+        with self.assertNumQueries(1):
+            detail = self.client.get(
+                reverse('crop_recommendation:recommendation-detail', args=[expected[0]['id']])
+            )
+        self.assertEqual(detail.json(), expected[0])
+
+    def test_backfill_recommendation_snapshots(self):
+        url = reverse('crop_recommendation:recommend')
+        for nitrogen in (90, 100, 120):
+            self.client.post(url, {**self.payload, 'nitrogen': nitrogen}, format='json')
+        stored = dict(CropRecommendation.objects.values_list('pk', 'snapshot'))
+        CropRecommendation.objects.update(snapshot=None)
+
+        call_command('backfill_recommendation_snapshots', batch_size=2, stdout=StringIO())
+
+        self.assertEqual(dict(CropRecommendation.objects.values_list('pk', 'snapshot')), stored)
+
+    def test_history_without_snapshots_has_constant_query_count(self):
+        url = reverse('crop_recommendation:recommend')
+        history_url = reverse('crop_recommendation:recommendation-history')
+        for nitrogen in (90, 100, 120):
+            self.client.post(url, {**self.payload, 'nitrogen': nitrogen}, format='json')
+        CropRecommendation.objects.update(snapshot=None)
+
+        # The recommendations, then their users, soil data, soil data users
+        # and scores with crops, however many rows there are
+        with self.assertNumQueries(5):
+            history = self.client.get(history_url)
+        self.assertEqual(len(history.data), 3)
+
+        for nitrogen in (110, 130, 140):
+            self.client.post(url, {**self.payload, 'nitrogen': nitrogen}, format='json')
+        CropRecommendation.objects.update(snapshot=None)
+        with self.assertNumQueries(5):
+            history = self.client.get(history_url)
+        self.assertEqual(len(history.data), 6)
+
+        with self.assertNumQueries(5):
+            detail = self.client.get(
+                reverse('crop_recommendation:recommendation-detail', args=[history.data[0]['id']])
+            )
+        self.assertEqual(detail.json(), history.json()[0])
+
+
+class PenaltyWindowPruningTests(SimpleTestCase):
+    def setUp(self):
+        self.engine = CropRecommendationEngine()
+
+    def assertPruningExact(self, catalog, input_data):
+        exhaustive = self.engine.calculate_suitability_scores(input_data, catalog=catalog, top_k=5)
+        pruned = self.engine.calculate_suitability_scores(
+            input_data, catalog=catalog, top_k=5, prune_below=RECOMMENDATION_CUTOFF
+        )
+        self.assertEqual(
+            ranked(pruned),
+            ranked(rec for rec in exhaustive if rec['score'] >= RECOMMENDATION_CUTOFF),
+            input_data
+        )
+        self.assertEqual(
+            ranked(self.engine.score_recommendations(input_data, catalog)),
+            ranked(self.engine._select_recommendations(exhaustive)),
+            input_data
+        )
+
+    def test_value_on_zero_bound_counts_as_hit(self):
+        # Nitrogen 0 scores 1.0 against min_nitrogen=0; without that hit the
+        # 'Zero' crops would be pruned and the lower-scoring 'Other' crops returned
+        unreachable = (500, 600, 500, 600, 5000, 6000)
+        catalog = CropCatalog(
+            [in_memory_crop(idx + 1, f'Zero {idx}', (5.5, 7, 0, 50, *unreachable)) for idx in range(1500)]
+            + [in_memory_crop(1501 + idx, f'Other {idx}', (5.5, 7, 20, 50, 11, 60, *unreachable[2:]))
+               for idx in range(5)]
+        )
+        input_data = [6.0, 0, 10, 10, 100, 1]
+
+        recommended = self.engine.score_recommendations(input_data, catalog)
+
+        self.assertEqual([rec['crop'].name for rec in recommended], [f'Zero {idx}' for idx in range(5)])
+        self.assertEqual({rec['score'] for rec in recommended}, {0.4})
+        self.assertPruningExact(catalog, input_data)
+
+    def test_pruned_matches_exhaustive_on_random_catalogs(self):
+        rng = np.random.default_rng(12)
+        for zero_fraction in (0.0, 0.2, 0.6):
+            catalog = random_catalog(rng, 1500, zero_fraction)
+            for input_data in random_inputs(rng, 150, zero_fraction):
+                self.assertPruningExact(catalog, input_data)
+
+
+class VectorizedScoringTests(SimpleTestCase):
+    """
+    The vectorized scorer against the original per-crop loop over
+    _calculate_parameter_score
+    """
+
+    def setUp(self):
+        self.engine = CropRecommendationEngine()
+
+    def scalar_scores(self, catalog, input_data):
+        *values, season = input_data
+        scores = []
+        for crop in catalog.crops:
+            seasons = [name.strip().lower() for name in crop.suitable_seasons.split(',')]
+            if SEASON_NAMES[season] not in seasons:
+                continue
+            overall_score = 0.0
+            for value, idx in zip(values, range(0, len(RANGE_FIELDS), 2)):
+                overall_score += self.engine._calculate_parameter_score(
+                    value, getattr(crop, RANGE_FIELDS[idx]), getattr(crop, RANGE_FIELDS[idx + 1])
+                ) * 0.2
+            scores.append({'crop': crop, 'score': round(overall_score, 3), 'unrounded': overall_score})
+
+        scores.sort(key=lambda item: item['score'], reverse=True)
+        for ranking, item in enumerate(scores, 1):
+            item['ranking'] = ranking
+        return scores
+
+    def test_round_scores_matches_builtin_round_on_half_steps(self):
+        scores = np.array([idx / 1000 + 0.0005 for idx in range(1000)] + [0.0625, 0.1875, 0.9995])
+
+        rounded = CropRecommendationEngine._round_scores(scores)
+
+        self.assertEqual(rounded.tolist(), [round(score, 3) for score in scores.tolist()])
+
+    def test_matches_scalar_scoring_on_random_catalogs(self):
+        rng = np.random.default_rng(1)
+        half_steps = fallbacks = 0
+        for _ in range(5):
+            # Inputs on a 1/8 grid against whole-number ranges land on many
+            # half steps of the third decimal, and many crops tie at 1.0
+            catalog = random_catalog(rng, 60, zero_fraction=0.1, decimals=0)
+            inputs = [[*(np.round(np.array(values) * 8) / 8).tolist(), season]
+                      for *values, season in random_inputs(rng, 60, zero_fraction=0.1)]
+            inputs.append([14, 2000, 2000, 2000, 50000, 1])
+
+            for input_data in inputs:
+                expected = self.scalar_scores(catalog, input_data)
+                for top_k in (None, 1, 3, 5, 200):
+                    self.assertEqual(
+                        ranked(self.engine.calculate_suitability_scores(input_data, catalog=catalog, top_k=top_k)),
+                        ranked(expected[:top_k]),
+                        (input_data, top_k)
+                    )
+
+                selected = [item for item in expected[:5] if item['score'] >= RECOMMENDATION_CUTOFF]
+                if not selected:
+                    selected = expected[:3]
+                    fallbacks += 1
+                self.assertEqual(ranked(self.engine.score_recommendations(input_data, catalog)), ranked(selected))
+
+                half_steps += sum(1 for item in expected if abs(item['unrounded'] * 1000 % 1 - 0.5) < 1e-6)
+
+        # The comparisons above covered the interesting cases
+        self.assertGreater(half_steps, 0)
+        self.assertGreater(fallbacks, 0)
+
+    def test_ties_keep_catalog_order(self):
+        ranges = (5.5, 7, 50, 100, 30, 60, 30, 60, 800, 2000)
+        catalog = CropCatalog(in_memory_crop(pk, name, ranges) for pk, name in enumerate('DBECA', 1))
+
+        scores = self.engine.calculate_suitability_scores([6.5, 80, 40, 40, 1000, 1], catalog=catalog, top_k=3)
+
+        self.assertEqual(ranked(scores), [('D', 1.0, 1), ('B', 1.0, 2), ('E', 1.0, 3)])
+
+
+@override_settings(CROP_CATALOG_REVALIDATE_SECONDS=None, CROP_MODEL_LOAD_COMPILED_TREE=False)
+class ModelArtifactTests(TestCase):
+    def setUp(self):
+        self.crops = create_sample_crops()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'crop_model.joblib')
+
+        self.engine = CropRecommendationEngine()
+        self.engine.train_model(seed=7)
+        self.engine.save_model(self.path)
+
+    def test_current_artifact_is_loaded(self):
+        engine = CropRecommendationEngine()
+
+        self.assertTrue(engine.load_model(self.path))
+        self.assertTrue(engine.is_trained)
+        self.assertEqual(engine.model_catalog_version, crop_catalog_store.version)
+        self.assertEqual(engine.training_params, {'samples_per_class': 5, 'seed': 7})
+
+        self.assertTrue(engine.load_compiled_tree(model_store.compiled_tree_path(self.path)))
+
+    def test_missing_artifact_is_refused(self):
+        engine = CropRecommendationEngine()
+
+        self.assertFalse(engine.load_model(self.path + '.missing'))
+        self.assertFalse(engine.load_compiled_tree(self.path + '.missing.npz'))
+        self.assertFalse(engine.is_trained)
+
+    def test_stale_artifact_is_refused(self):
+        self.crops[0].max_ph = 7.5
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crops[0].save()
+        engine = CropRecommendationEngine()
+
+        self.assertFalse(engine.load_model(self.path))
+        self.assertFalse(engine.load_compiled_tree(model_store.compiled_tree_path(self.path)))
+        with override_settings(CROP_MODEL_LOAD_COMPILED_TREE=True):
+            self.assertFalse(engine.load_model(self.path))
+        self.assertFalse(engine.is_trained)
+
+    def test_artifact_of_other_algorithm_is_refused(self):
+        engine = CropRecommendationEngine()
+
+        self.assertFalse(engine.load_model(self.path, algorithm='random_forest'))
+        self.assertEqual(engine.trained_algorithms, [])
+
+    def test_incompatible_artifact_is_refused(self):
+        import sklearn
+
+        with mock.patch.object(sklearn, '__version__', '0.0'):
+            self.assertIsNone(model_store.load_artifact(self.path))
+        with mock.patch.object(model_store, 'ARTIFACT_FORMAT_VERSION', model_store.ARTIFACT_FORMAT_VERSION + 1):
+            self.assertIsNone(model_store.load_artifact(self.path))
+        with mock.patch.object(
+                model_store, 'COMPILED_TREE_FORMAT_VERSION', model_store.COMPILED_TREE_FORMAT_VERSION + 1):
+            self.assertIsNone(model_store.load_compiled_tree(model_store.compiled_tree_path(self.path)))
+
+
+        # Files that aren't artifacts at all
+        self.assertIsNone(model_store.load_artifact(model_store.compiled_tree_path(self.path)))
+        self.assertIsNone(model_store.load_compiled_tree(self.path))
+
+
+class RecommendationCacheTests(SimpleTestCase):
+    def test_lru_eviction(self):
+        cache = RecommendationCache(max_entries=2, ttl_seconds=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+
+        cache.set('c', 3)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_entries_expire_after_ttl(self):
+        cache = RecommendationCache(max_entries=2, ttl_seconds=60)
+        with mock.patch('crop_recommendation.recommendation_cache.time.monotonic', return_value=1000.0):
+            cache.set('a', 1)
+        with mock.patch('crop_recommendation.recommendation_cache.time.monotonic', return_value=1059.0):
+            self.assertEqual(cache.get('a'), 1)
+        with mock.patch('crop_recommendation.recommendation_cache.time.monotonic', return_value=1060.0):
+            self.assertIsNone(cache.get('a'))
+
+        self.assertEqual(cache.stats()['expirations'], 1)
+        self.assertEqual(cache.stats()['size'], 0)
+
+    @override_settings(CROP_RECOMMENDATION_CACHE_SIZE=8)
+    def test_predict_hits_and_catalog_version(self):
+        engine = CropRecommendationEngine()
+        ranges = [5.5, 7, 60, 150, 30, 60, 30, 60, 800, 2000]
+        catalog = CropCatalog([in_memory_crop(1, 'Rice', ranges), in_memory_crop(2, 'Maize', ranges)])
+
+        first = engine.predict(6.51, 90.2, 45, 40, 1201, 'Summer', catalog=catalog)
+        # Same cell of the quantization grid
+        second = engine.predict(6.49, 89.8, 45, 40, 1199, 'Summer', catalog=catalog)
+
+        self.assertEqual(ranked(second), ranked(first))
+        self.assertEqual(engine.result_cache.stats()['hits'], 1)
+
+        # An edited crop changes the catalog version, so nothing stale is served
+        ranges[0] = 6.8
+        edited = CropCatalog([in_memory_crop(1, 'Rice', ranges), in_memory_crop(2, 'Maize', [5.5, *ranges[1:]])])
+        self.assertNotEqual(edited.version, catalog.version)
+
+        third = engine.predict(6.5, 90, 45, 40, 1200, 'Summer', catalog=edited)
+
+        self.assertEqual(ranked(third), [('Maize', 1.0, 1), ('Rice', 0.982, 2)])
+        self.assertEqual(engine.result_cache.stats()['hits'], 1)
+
+    def test_cache_is_off_by_default(self):
+        self.assertEqual(settings.CROP_RECOMMENDATION_CACHE_SIZE, 0)
+        self.assertIsNone(CropRecommendationEngine().result_cache)
+
+
+@override_settings(CROP_CATALOG_REVALIDATE_SECONDS=None, CROP_SCORING_BACKEND='range')
+class RecommendBulkCommandTests(TestCase):
+    RECORDS = [
+        {'id': 'a', 'ph_level': '6.5', 'nitrogen': '90', 'phosphorus': '45', 'potassium': '40',
+         'rainfall': '1200', 'season': 'summer'},
+        {'id': 'b', 'ph_level': 'nan', 'nitrogen': '90', 'phosphorus': '45', 'potassium': '40',
+         'rainfall': '1200', 'season': 'Summer'},
+        {'id': 'c', 'ph_level': '6.5', 'nitrogen': 'inf', 'phosphorus': '45', 'potassium': '40',
+         'rainfall': '1200', 'season': 'Summer'},
+        {'id': 'd', 'ph_level': '15', 'nitrogen': '90', 'phosphorus': '45', 'potassium': '40',
+         'rainfall': '1200', 'season': 'Summer'},
+        {'id': 'e', 'ph_level': '6.5', 'nitrogen': '90', 'phosphorus': '45', 'potassium': '40',
+         'rainfall': '1200', 'season': 'Spring'},
+        {'id': 'f', 'ph_level': '6.5', 'nitrogen': '70', 'phosphorus': '45', 'potassium': '40',
+         'rainfall': '1200', 'season': 'Winter'},
+    ]
+
+    EXPECTED = {
+        'a': ([('Rice', 1.0), ('Maize', 0.96)], None),
+        'b': ([], 'ph_level must be a number'),
+        'c': ([], 'nitrogen must be a number'),
+        'd': ([], 'ph_level must be at most 14'),
+        'e': ([], 'No suitable crops found for the given parameters'),
+        'f': ([('Wheat', 1.0)], None),
+    }
+
+    def setUp(self):
+        create_sample_crops()
+        self.user = get_user_model().objects.create_user(username='farmer', password='secret')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write_input(self, name):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', newline='') as input_file:
+            if name.endswith('.csv'):
+                writer = csv.DictWriter(input_file, fieldnames=list(self.RECORDS[0]))
+                writer.writeheader()
+                writer.writerows(self.RECORDS)
+            else:
+                input_file.writelines(json.dumps(record) + '\n' for record in self.RECORDS)
+        return path
+
+    def run_command(self, input_name, output_name, **options):
+        output_path = os.path.join(self.directory, output_name)
+        call_command(
+            'recommend_bulk', self.write_input(input_name), output_path,
+            chunk_size=2, stdout=StringIO(), **{'workers': 1, **options}
+        )
+        with open(output_path, newline='') as output_file:
+            if output_name.endswith('.csv'):
+                return list(csv.DictReader(output_file))
+            return [json.loads(line) for line in output_file]
+
+    def assertResults(self, rows):
+        self.assertEqual([str(row['id']) for row in rows], list(self.EXPECTED))
+        for row in rows:
+            crops, error = self.EXPECTED[row['id']]
+            if 'recommendations' in row:
+                found = [(rec['crop'], rec['score']) for rec in row['recommendations']]
+            else:
+                found = [
+                    (row[f'crop_{rank}'], float(row[f'score_{rank}']))
+                    for rank in range(1, 6) if row[f'crop_{rank}']
+                ]
+            self.assertEqual(found, crops, row['id'])
+            self.assertEqual(row['error'] or None, error, row['id'])
+
+    def test_csv_to_ndjson(self):
+        self.assertResults(self.run_command('in.csv', 'out.ndjson'))
+        self.assertFalse(SoilData.objects.exists())
+
+    def test_ndjson_to_csv(self):
+        self.assertResults(self.run_command('in.ndjson', 'out.csv'))
+
+    def test_save_stores_valid_rows_only(self):
+        rows = self.run_command('in.csv', 'out.ndjson', save=True, user='farmer')
+
+        self.assertResults(rows)
+        saved = {row['id']: row['recommendation_id'] for row in rows}
+        self.assertEqual(
+            set(CropRecommendation.objects.values_list('pk', flat=True)), {saved['a'], saved['f']}
+        )
+        self.assertEqual([saved[key] for key in 'bcde'], [None] * 4)
+        # Rows scored without any suitable crop still keep their soil data
+        self.assertEqual(SoilData.objects.count(), 3)
+
+    def test_workers_match_single_process(self):
+        single = self.run_command('in.csv', 'single.ndjson')
+        pooled = self.run_command('in.csv', 'pooled.ndjson', workers=2)
+
+        self.assertEqual(pooled, single)
+
+
+@override_settings(CROP_CATALOG_REVALIDATE_SECONDS=None)
+class BackgroundRetrainTests(TestCase):
+    def setUp(self):
+        self.crops = create_sample_crops()
+        self.engine = CropRecommendationEngine()
+        self.engine.train_model(seed=3)
+
+    def test_retrain_publishes_new_state_for_edited_catalog(self):
+        old_state = self.engine.model_state
+        self.crops[0].max_ph = 7.5
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crops[0].save()
+        # Rebuilt here, so the retrain thread doesn't need the test transaction
+        catalog = crop_catalog_store.get()
+        self.assertIsNone(self.engine.get_model())
+
+        future = self.engine.retrain_async()
+
+        self.assertTrue(future.result(timeout=30))
+        state = self.engine.model_state
+        self.assertIsNot(state, old_state)
+        self.assertEqual(state.catalog_version, catalog.version)
+        self.assertEqual(state.training_params, {'samples_per_class': 5, 'seed': 3})
+        self.assertIs(self.engine.get_model(), state.model)
+
+    def test_queued_retrain_is_reused(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def blocking_train(*args):
+            started.set()
+            release.wait(timeout=30)
+            return True
+
+        with mock.patch.object(self.engine, 'train_model', side_effect=blocking_train) as train_model:
+            running = self.engine.retrain_async()
+            started.wait(timeout=30)
+            queued = self.engine.retrain_async()
+            again = self.engine.retrain_async()
+            release.set()
+
+            self.assertIsNot(queued, running)
+            self.assertIs(again, queued)
+            self.assertTrue(queued.result(timeout=30))
+            self.assertEqual(train_model.call_count, 2)
+
+    def test_publish_swaps_one_algorithm_only(self):
+        states = self.engine._model_states
+        tree_state = self.engine.model_state
+        other = tree_state._replace(training_params={'seed': 9})
+
+        self.engine.publish_model_state('random_forest', other)
+
+        # Readers holding the old mapping keep a complete, unchanged view
+        self.assertEqual(list(states), ['decision_tree'])
+        self.assertIs(self.engine.model_state, tree_state)
+        self.assertIs(self.engine._model_states['random_forest'], other)
+
+
+class CropSeasonMaskTests(TestCase):
+    def setUp(self):
+        self.crops = create_sample_crops()
+
+    def test_mask_follows_suitable_seasons_on_save(self):
+        rice = self.crops[0]
+        self.assertEqual(rice.season_mask, season_bitmask('Summer,Monsoon'))
+
+        rice.suitable_seasons = 'Winter, spring'
+        rice.save(update_fields=['suitable_seasons'])
+
+        rice.refresh_from_db()
+        self.assertEqual(rice.season_mask, season_bitmask('spring,winter'))
+
+        # Saving other fields leaves the mask alone
+        rice.max_ph = 7.5
+        rice.save(update_fields=['max_ph'])
+        rice.refresh_from_db()
+        self.assertEqual(rice.season_mask, season_bitmask('Winter,Spring'))
+
+    def test_migration_backfills_masks(self):
+        populate_season_mask = importlib.import_module(
+            'crop_recommendation.migrations.0004_crop_season_mask'
+        ).populate_season_mask
+        Crop.objects.update(season_mask=0)
+
+        populate_season_mask(apps, None)
+
+        self.assertEqual(
+            dict(Crop.objects.values_list('name', 'season_mask')),
+            {crop.name: season_bitmask(crop.suitable_seasons) for crop in self.crops}
+        )
+
+    def test_for_season(self):
+        self.assertEqual(list(Crop.objects.for_season('summer').values_list('name', flat=True)), ['Maize', 'Rice'])
+        self.assertEqual(list(Crop.objects.for_season(' Monsoon ').values_list('name', flat=True)), ['Rice'])
+        self.assertFalse(Crop.objects.for_season('Spring').exists())
+        self.assertFalse(Crop.objects.for_season('dry').exists())
+
+    def test_search_by_season(self):
+        url = reverse('crop_recommendation:crop-search')
+
+        response = self.client.get(url, {'season': 'Winter'})
+        self.assertEqual([crop['name'] for crop in response.json()], ['Wheat'])
+
+        response = self.client.get(url, {'season': 'Summer', 'search': 'ric'})
+        self.assertEqual([crop['name'] for crop in response.json()], ['Rice'])
+
+
+class CompiledTreeTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        catalog = random_catalog(rng, 40, seasons=('Summer', 'Winter,Spring', 'Monsoon'))
+        self.engine = CropRecommendationEngine()
+        self.engine.train_model(samples_per_class=20, seed=5, catalog=catalog)
+        self.state = self.engine.model_state
+
+        self.X = np.array([[*values, season] for *values, season in random_inputs(rng, 500)])
+        # Rows sitting exactly on split thresholds go left in both
+        tree = self.state.compiled_tree
+        internal = np.flatnonzero(tree.children_left != -1)[:50]
+        on_threshold = self.X[:internal.size].copy()
+        on_threshold[np.arange(internal.size), tree.feature[internal]] = tree.threshold[internal]
+        self.X = np.vstack([self.X, on_threshold])
+
+    def assertMatchesSklearn(self, tree):
+        model, label_encoder = self.state.model, self.state.label_encoder
+
+        np.testing.assert_array_equal(tree.predict_proba(self.X), model.predict_proba(self.X))
+        np.testing.assert_array_equal(tree.predict(self.X), label_encoder.inverse_transform(model.predict(self.X)))
+        np.testing.assert_array_equal(tree.classes, label_encoder.inverse_transform(model.classes_))
+        for row in self.X[:50]:
+            np.testing.assert_array_equal(tree.predict_proba(row), model.predict_proba(row[np.newaxis, :]))
+            np.testing.assert_array_equal(tree.predict(row[np.newaxis, :]),
+                                          label_encoder.inverse_transform(model.predict(row[np.newaxis, :])))
+
+    def test_matches_sklearn(self):
+        self.assertMatchesSklearn(self.state.compiled_tree)
+
+    def test_save_load_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = model_store.save_compiled_tree(
+                self.state.compiled_tree, 'abc123', path=os.path.join(directory, 'crop_model.tree.npz'), seed=5
+            )
+            tree, info = model_store.load_compiled_tree(path)
+
+        self.assertEqual(info['catalog_version'], 'abc123')
+        self.assertEqual(info['seed'], 5)
+        self.assertEqual(tree.node_count, self.state.compiled_tree.node_count)
+        self.assertMatchesSklearn(tree)
+
+
+@override_settings(CROP_CATALOG_REVALIDATE_SECONDS=None, CROP_SCORING_BACKEND='range')
+class CropCatalogInvalidationTests(TestCase):
+    def setUp(self):
+        self.rice, self.wheat, self.maize = create_sample_crops()
+        self.engine = CropRecommendationEngine()
+
+    def recommend(self):
+        return [(rec['crop'].name, rec['score']) for rec in self.engine.predict(6.5, 90, 45, 40, 1200, 'Summer')]
+
+    def test_saved_crop_changes_next_recommendation(self):
+        self.assertEqual(self.recommend(), [('Rice', 1.0), ('Maize', 0.96)])
+
+        self.maize.min_nitrogen = 80
+        with self.captureOnCommitCallbacks(execute=True):
+            self.maize.save()
+
+        self.assertEqual(self.recommend(), [('Maize', 1.0), ('Rice', 1.0)])
+
+    def test_deleted_crop_changes_next_recommendation(self):
+        self.recommend()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rice.delete()
+
+        self.assertEqual(self.recommend(), [('Maize', 0.96)])
+
+    def test_invalidates_only_on_commit(self):
+        catalog = crop_catalog_store.get()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.maize.min_nitrogen = 80
+            self.maize.save()
+            # Not committed yet: the snapshot stays
+            self.assertIs(crop_catalog_store.get(), catalog)
+        self.assertEqual(len(callbacks), 1)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            try:
+                with transaction.atomic():
+                    self.wheat.delete()
+                    raise DatabaseError('rolled back')
+            except DatabaseError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertIs(crop_catalog_store.get(), catalog)
+
+
+@override_settings(CROP_CATALOG_REVALIDATE_SECONDS=None, CROP_MODEL_LOAD_COMPILED_TREE=False)
+class SeededTrainingTests(TestCase):
+    def setUp(self):
+        create_sample_crops()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.X = np.array(random_inputs(np.random.default_rng(2), 200))
+
+    def train(self, name, **options):
+        path = os.path.join(self.directory, name)
+        call_command('train_crop_model', output=path, samples_per_class=20, stdout=StringIO(), **options)
+        engine = CropRecommendationEngine()
+        self.assertTrue(engine.load_model(path))
+        return engine.model.predict_proba(self.X)
+
+    def test_same_seed_trains_same_model(self):
+        first = self.train('first.joblib', seed=11)
+
+        np.testing.assert_array_equal(self.train('second.joblib', seed=11), first)
+        self.assertFalse(np.array_equal(self.train('other.joblib', seed=12), first))
+
+    def test_samples_do_not_depend_on_chunk_size(self):
+        engine = CropRecommendationEngine()
+        X, y = engine.prepare_training_data(samples_per_class=7, seed=4)
+
+        for chunk_size in (1, 5, 16, len(y) + 3):
+            chunks = list(engine.iter_training_data(samples_per_class=7, seed=4, chunk_size=chunk_size))
+            self.assertTrue(all(len(chunk_y) <= chunk_size for _, chunk_y in chunks))
+            np.testing.assert_array_equal(np.vstack([chunk_X for chunk_X, _ in chunks]), X)
+            np.testing.assert_array_equal(np.concatenate([chunk_y for _, chunk_y in chunks]), y)
+
+
+class ScoringBackendTests(TestCase):
+    def setUp(self):
+        create_sample_crops()
+        # A private engine, so trained models don't leak into other tests
+        self.engine = CropRecommendationEngine()
+        patcher = mock.patch('crop_recommendation.scoring_backends.crop_recommendation_engine', self.engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = get_user_model().objects.create_user(username='farmer', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.payload = {
+            'ph_level': 6.5,
+            'nitrogen': 90,
+            'phosphorus': 45,
+            'potassium': 40,
+            'rainfall': 1200,
+            'season': 'Summer',
+        }
+
+    def post(self, name, data):
+        return self.client.post(reverse(f'crop_recommendation:{name}'), data, format='json')
+
+    def test_algorithm_selects_backend_and_is_stored(self):
+        self.engine.train_model(seed=5)
+
+        default = self.post('recommend', self.payload)
+        tree = self.post('recommend', {**self.payload, 'algorithm': 'decision_tree'})
+
+        self.assertEqual(default.data['recommendation']['algorithm_used'], 'Range Scoring')
+        self.assertEqual(tree.status_code, 200)
+        self.assertEqual(tree.data['recommendation']['algorithm_used'], 'Decision Tree')
+        stored = CropRecommendation.objects.get(pk=tree.data['recommendation']['id'])
+        self.assertEqual(stored.algorithm_used, 'Decision Tree')
+        # Scores are the classifier's probabilities, not range scores
+        expected = self.engine.predict_with_model([(6.5, 90, 45, 40, 1200, 'Summer')])[0]
+        self.assertEqual(
+            [(crop['crop_name'], crop['score']) for crop in tree.data['recommendation']['recommended_crops_details']],
+            [(rec['crop'].name, rec['score']) for rec in expected]
+        )
+
+        batch = self.post('recommend-batch', {'samples': [self.payload], 'algorithm': 'decision_tree'})
+        self.assertEqual(batch.data['results'][0]['recommendation']['algorithm_used'], 'Decision Tree')
+
+    def test_untrained_model_is_unavailable(self):
+        single = self.post('recommend', {**self.payload, 'algorithm': 'random_forest'})
+        batch = self.post('recommend-batch', {'samples': [self.payload], 'algorithm': 'random_forest'})
+
+        for response in (single, batch):
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(
+                response.data['error'], 'Random Forest model is not trained for the current crop catalog'
+            )
+        self.assertFalse(SoilData.objects.exists())
+
+    def test_model_going_stale_after_check_is_unavailable(self):
+        # Available when checked, then stale by the time it predicts
+        with mock.patch.object(scoring_backends.get('decision_tree'), 'is_available', return_value=True):
+            single = self.post('recommend', {**self.payload, 'algorithm': 'decision_tree'})
+            batch = self.post('recommend-batch', {'samples': [self.payload], 'algorithm': 'decision_tree'})
+
+        self.assertEqual((single.status_code, batch.status_code), (503, 503))
+        self.assertFalse(SoilData.objects.exists())
+
+    def test_backend_list(self):
+        self.engine.train_model(seed=5)
+        calls = scoring_backends.get('decision_tree').latency.stats()['calls']
+        self.post('recommend-batch', {'samples': [self.payload] * 3, 'algorithm': 'decision_tree'})
+
+        response = self.client.get(reverse('crop_recommendation:recommend-backends'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['default'], 'range')
+        backends = {entry['name']: entry for entry in response.data['backends']}
+        self.assertEqual(list(backends), ['range', 'decision_tree', 'random_forest', 'gradient_boosting'])
+        self.assertEqual(
+            {name: entry['available'] for name, entry in backends.items()},
+            {'range': True, 'decision_tree': True, 'random_forest': False, 'gradient_boosting': False}
+        )
+        self.assertEqual(backends['decision_tree']['algorithm'], 'Decision Tree')
+        # One call for the whole batch
+        self.assertEqual(backends['decision_tree']['latency']['calls'], calls + 1)
+
+        with override_settings(CROP_SCORING_BACKEND='decision_tree'):
+            response = self.client.get(reverse('crop_recommendation:recommend-backends'))
+        self.assertEqual(response.data['default'], 'decision_tree')
+
+
+class LatencyStatsTests(SimpleTestCase):
+    def test_stats(self):
+        latency = LatencyStats()
+        self.assertEqual(latency.stats(), {
+            'calls': 0, 'samples': 0, 'mean_ms_per_call': 0.0, 'mean_ms_per_sample': 0.0,
+            'p50_ms': 0.0, 'p99_ms': 0.0,
+        })
+
+        for seconds in (0.001, 0.002, 0.003):
+            latency.record(seconds)
+        latency.record(0.010, samples=5)
+
+        stats = latency.stats()
+        self.assertEqual((stats['calls'], stats['samples']), (4, 8))
+        self.assertEqual((stats['mean_ms_per_call'], stats['mean_ms_per_sample']), (4.0, 2.0))
+        self.assertEqual(stats['p50_ms'], 2.5)
+        self.assertEqual(stats['p99_ms'], 9.79)
+
+    def test_percentiles_cover_recent_window(self):
+        latency = LatencyStats(window=2)
+        for seconds in (1.0, 0.002, 0.004):
+            latency.record(seconds)
+
+        stats = latency.stats()
+        # Counters cover every call, percentiles only the last two
+        self.assertEqual((stats['calls'], stats['mean_ms_per_call']), (3, 335.333))
+        self.assertEqual(stats['p50_ms'], 3.0)
+
+
+class BenchmarkTests(SimpleTestCase):
+    def run_result(self, *cases):
+        return {'results': [
+            {'name': name, 'crops': 20, 'batch_size': batch_size, 'p50_ms': p50, 'peak_memory_mb': peak}
+            for name, batch_size, p50, peak in cases
+        ]}
+
+    def test_compare_runs_flags_regressions(self):
+        baseline = self.run_result(
+            ('predict', None, 1.0, 2.0),
+            ('predict_batch', 10, 4.0, 8.0),
+            ('predict_batch', 100, 40.0, 80.0),
+            ('train_model', None, 0.0, 1.0),
+        )
+        current = self.run_result(
+            ('predict', None, 1.2, 2.0),
+            ('predict_batch', 10, 5.2, 8.0),
+            ('predict_batch', 100, 20.0, 120.0),
+            ('train_model', None, 5.0, 1.0),
+            ('predict_batch', 1000, 400.0, 800.0),
+        )
+
+        comparisons = compare_runs(baseline, current, threshold=0.25)
+
+        # Cases missing from the baseline are not compared
+        self.assertEqual(
+            [(c['name'], c['batch_size'], c['regressed']) for c in comparisons],
+            [
+                ('predict', None, []),
+                ('predict_batch', 10, ['p50_ms']),
+                ('predict_batch', 100, ['peak_memory_mb']),
+                ('train_model', None, []),
+            ]
+        )
+        self.assertEqual(comparisons[1]['changes'], {'p50_ms': 0.3, 'peak_memory_mb': 0.0})
+        self.assertEqual(comparisons[2]['changes'], {'p50_ms': -0.5, 'peak_memory_mb': 0.5})
+        # A zero baseline has no relative change
+        self.assertEqual(comparisons[3]['changes'], {'peak_memory_mb': 0.0})
+        self.assertEqual(compare_runs(baseline, current, threshold=0.6)[2]['regressed'], [])
+
+    def test_benchmark_command(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        baseline = os.path.join(directory.name, 'baseline.json')
+        stdout = StringIO()
+
+        call_command(
+            'benchmark_crop_engine', catalog_sizes='5,50', batch_sizes='1,10', repeats=2,
+            time_budget=0, max_cells=100, max_train_crops=5, output=baseline, stdout=stdout
+        )
+
+        with open(baseline) as results_file:
+            results = json.load(results_file)
+        self.assertEqual(
+            [(case['name'], case['crops'], case['batch_size']) for case in results['results']],
+            [
+                ('prepare_training_data', 5, None), ('train_model', 5, None),
+                ('calculate_suitability_scores', 5, None), ('predict', 5, None),
+                ('predict_batch', 5, 1), ('predict_batch', 5, 10),
+                ('prepare_training_data', 50, None),
+                ('calculate_suitability_scores', 50, None), ('predict', 50, None),
+                ('predict_batch', 50, 1),
+            ]
+        )
+        self.assertEqual(
+            [(case['name'], case['crops'], case['reason']) for case in results['skipped']],
+            [('train_model', 50, 'max_train_crops'), ('predict_batch', 50, 'max_cells')]
+        )
+        self.assertIn('skipped predict_batch crops=50 batch=10 (max_cells)', stdout.getvalue())
+
+        # Comparing two saved runs doesn't benchmark again
+        slower = os.path.join(directory.name, 'slower.json')
+        for case in results['results']:
+            case['p50_ms'] *= 2
+        with open(slower, 'w') as results_file:
+            json.dump(results, results_file)
+
+        stdout = StringIO()
+        call_command('benchmark_crop_engine', compare=[baseline, baseline], stdout=stdout)
+        self.assertIn('No regressions', stdout.getvalue())
+        with self.assertRaisesMessage(CommandError, '10 case(s) regressed by more than 25%'):
+            call_command('benchmark_crop_engine', compare=[baseline, slower], stdout=StringIO())
+
+
+GRID_TEST_AXES = {
+    'ph': GridAxis(4.0, 9.0, 0.5),
+    'nitrogen': GridAxis(0.0, 200.0, 20.0),
+    'phosphorus': GridAxis(0.0, 100.0, 20.0),
+    'potassium': GridAxis(0.0, 100.0, 20.0),
+    'rainfall': GridAxis(0.0, 2500.0, 250.0),
+}
+
+
+class RecommendationGridTests(SimpleTestCase):
+    def setUp(self):
+        # The sample crops, so that some areas of the grid are flat
+        self.catalog = CropCatalog([
+            in_memory_crop(1, 'Maize', (5.5, 7, 100, 150, 30, 60, 30, 60, 800, 2000), 'Summer'),
+            in_memory_crop(2, 'Rice', (5.5, 7, 60, 150, 30, 60, 30, 60, 800, 2000), 'Summer,Monsoon'),
+            in_memory_crop(3, 'Wheat', (5.5, 7, 60, 150, 30, 60, 30, 60, 800, 2000), 'Winter'),
+        ])
+        self.engine = CropRecommendationEngine()
+        self.engine.result_cache = None
+        self.grid = build_grid(self.engine, self.catalog, GRID_TEST_AXES)
+
+    def grid_point(self, cell):
+        season, *indices = cell
+        return [axis.start + axis.step * idx for axis, idx in zip(self.grid.axes, indices)], season
+
+    def test_lookup_in_inner_cell_matches_engine(self):
+        summer = SEASON_NAMES.index('summer')
+        cells = np.argwhere(~self.grid.boundary[summer])
+        self.assertGreater(len(cells), 0)
+
+        for cell in cells[::7].tolist():
+            values, season = self.grid_point([summer, *cell])
+            # Off the grid point, but nearest to it
+            jittered = [value + axis.step * 0.3 for value, axis in zip(values, self.grid.axes)]
+
+            looked_up = self.engine.grid_recommendations(self.grid, jittered, season, self.catalog, True)
+            self.assertEqual(looked_up, self.engine.score_recommendations([*values, season], self.catalog))
+
+    def test_boundary_cell_is_scored_exactly(self):
+        cells = np.argwhere(self.grid.boundary)
+        values, season = self.grid_point(cells[len(cells) // 2].tolist())
+        jittered = [value + axis.step * 0.3 for value, axis in zip(values, self.grid.axes)]
+        exact = self.engine.score_recommendations([*jittered, season], self.catalog)
+
+        self.assertIsNone(self.engine.grid_recommendations(self.grid, jittered, season, self.catalog, True))
+        self.assertIsNotNone(self.engine.grid_recommendations(self.grid, jittered, season, self.catalog))
+
+        self.engine.lookup_grid = self.grid
+        self.assertTrue(self.engine.grid_exact_boundaries)
+        self.assertEqual(
+            self.engine.predict(*jittered, SEASON_NAMES[season].title(), catalog=self.catalog), exact
+        )
+
+    def test_outside_grid_or_stale_is_not_looked_up(self):
+        self.assertIsNone(self.grid.lookup([9.5, 100, 50, 50, 1000], 1))
+        self.assertIsNone(self.grid.lookup([6.5, 100, 50, 50, 1000], len(SEASON_NAMES)))
+        other = random_catalog(np.random.default_rng(6), 3)
+        self.assertIsNone(self.engine.grid_recommendations(self.grid, [6.5, 100, 50, 50, 1000], 1, other))
+
+    def test_save_load_round_trip(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = save_grid(self.grid, os.path.join(directory.name, 'grid.joblib'))
+
+        loaded = load_grid(path)
+
+        self.assertEqual(loaded.catalog_version, self.catalog.version)
+        self.assertEqual(loaded.axes, [GRID_TEST_AXES[name] for name in GRID_TEST_AXES])
+        for name in ('crop_index', 'scores', 'boundary'):
+            self.assertIsInstance(getattr(loaded, name), np.memmap)
+            np.testing.assert_array_equal(getattr(loaded, name), getattr(self.grid, name))
+        self.assertIsNone(load_grid(os.path.join(directory.name, 'missing.joblib')))
+
+    def test_unreadable_grid_is_refused(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        corrupt = os.path.join(directory.name, 'corrupt.joblib')
+        with open(corrupt, 'wb') as grid_file:
+            grid_file.write(b'not a grid')
+        old_format = model_store.dump_atomic(
+            {'format_version': 0}, os.path.join(directory.name, 'old.joblib')
+        )
+
+        with self.assertLogs('crop_recommendation.recommendation_grid', 'ERROR'):
+            self.assertIsNone(load_grid(corrupt))
+        self.assertIsNone(load_grid(old_format))
+
+    def test_accuracy_samples_request_seasons_only(self):
+        with mock.patch.object(
+            self.engine, 'score_recommendations', wraps=self.engine.score_recommendations
+        ) as score_recommendations:
+            accuracy = measure_accuracy(self.engine, self.grid, self.catalog, samples=200, exact_boundaries=True)
+
+        seasons = {call.args[0][5] for call in score_recommendations.call_args_list}
+        self.assertEqual(seasons, {SEASON_NAMES.index(name) for name in ('spring', 'summer', 'autumn', 'winter')})
+        # Spring and autumn have no crops; empty on both sides agrees
+        self.assertEqual(accuracy['top_crop_agreement'], 1.0)
+
+
+@override_settings(CROP_CATALOG_REVALIDATE_SECONDS=None)
+class BuildRecommendationGridCommandTests(TestCase):
+    def test_builds_loadable_grid(self):
+        create_sample_crops()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'grid.joblib')
+        stdout = StringIO()
+
+        call_command(
+            'build_recommendation_grid', output=path, ph='5:8:1', nitrogen='0:200:50', phosphorus='0:90:30',
+            potassium='0:90:30', rainfall='500:2500:500', accuracy_samples=50, stdout=stdout
+        )
+
+        output = stdout.getvalue()
+        self.assertIn('Building recommendation grid: 8000 cells', output)
+        self.assertIn('exact at boundaries', output)
+        engine = CropRecommendationEngine()
+        self.assertTrue(engine.load_lookup_grid(path))
+        self.assertEqual(engine.lookup_grid.shape, (4, 5, 4, 4, 5))
+
+    def test_rejects_invalid_axis(self):
+        create_sample_crops()
+
+        with self.assertRaisesMessage(CommandError, "Invalid grid axis '8:5:1'"):
+            call_command('build_recommendation_grid', ph='8:5:1', stdout=StringIO())
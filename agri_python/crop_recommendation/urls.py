@@ -4,6 +4,9 @@ from .views import (
     CropViewSet,
     SoilDataViewSet,
     CropRecommendationView,
+    CropRecommendationBatchView,
+    RecommendationCacheStatsView,
+    ScoringBackendListView,
     CropRecommendationHistoryView,
     CropRecommendationDetailView,
     CropSearchView
@@ -18,6 +21,9 @@ router.register(r'soil-data', SoilDataViewSet, basename='soil-data')
 urlpatterns = [
     path('', include(router.urls)),
     path('recommend/', CropRecommendationView.as_view(), name='recommend'),
+    path('recommend/batch/', CropRecommendationBatchView.as_view(), name='recommend-batch'),
+    path('recommend/cache-stats/', RecommendationCacheStatsView.as_view(), name='recommend-cache-stats'),
+    path('recommend/backends/', ScoringBackendListView.as_view(), name='recommend-backends'),
     path('recommendations/', CropRecommendationHistoryView.as_view(), name='recommendation-history'),
     path('recommendations/<int:pk>/', CropRecommendationDetailView.as_view(), name='recommendation-detail'),
     path('search/', CropSearchView.as_view(), name='crop-search'),
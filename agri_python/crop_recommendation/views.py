@@ -10,9 +10,28 @@ from .serializers import (
     CropSerializer, 
     SoilDataSerializer, 
     CropRecommendationSerializer,
-    CropRecommendationRequestSerializer
+    CropRecommendationSnapshotSerializer,
+    CropRecommendationRequestSerializer,
+    CropRecommendationBatchRequestSerializer
 )
 from .recommendation_engine import crop_recommendation_engine
+from .persistence import (
+    build_recommendation_records,
+    insert_recommendation_records,
+    save_recommendations
+)
+from .crop_catalog import crop_catalog_store
+from .scoring_backends import scoring_backends
+from agrinova_backend.idempotency import IDEMPOTENCY_KEY_PARAMETER, idempotent
+from agrinova_backend.write_behind import write_behind_queue
+
+def model_unavailable(backend):
+    """
+    503 response for a model backend not trained for the current crop catalog
+    """
+    return Response({
+        'error': f'{backend.algorithm_name} model is not trained for the current crop catalog'
+    }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
 class CropViewSet(viewsets.ModelViewSet):
     """
@@ -61,7 +80,8 @@ class CropRecommendationView(APIView):
     """
     Get AI-powered crop recommendations based on soil parameters.
     
-    Uses Decision Tree algorithm to analyze soil conditions and recommend suitable crops.
+    Scores crops with the selected backend (range scoring, Decision Tree,
+    Random Forest or Gradient Boosting) and records which one was used.
     """
     permission_classes = [permissions.IsAuthenticated]
     
@@ -78,8 +98,13 @@ class CropRecommendationView(APIView):
         - Season
         
         Returns top 5 recommended crops with suitability scores.
+        `algorithm` selects the scoring backend; see `GET /recommend/backends/`.
+        With write-behind enabled on the server, the records are stored just
+        after responding: `queued` is true, ids are null and `reference`
+        identifies the recommendation in the history.
         """,
         request_body=CropRecommendationRequestSerializer,
+        manual_parameters=[IDEMPOTENCY_KEY_PARAMETER],
         responses={
             200: openapi.Response(
                 description="Recommendation generated successfully",
@@ -94,94 +119,279 @@ class CropRecommendationView(APIView):
                                     "score": 0.95,
                                     "ranking": 1
                                 }
-                            ]
+                            ],
+                            "algorithm_used": "Range Scoring",
+                            "reference": "6f1d2c3b-8a4e-4f5a-9b7c-1d2e3f4a5b6c"
                         },
+                        "catalog_version": "3f9a1c2b7d4e",
+                        "queued": False,
                         "message": "Crop recommendation generated successfully"
                     }
                 }
             ),
             404: "No suitable crops found",
-            500: "Error generating recommendation"
+            500: "Error generating recommendation",
+            503: "Selected model is not trained for the current crop catalog",
+            409: "A request with the same Idempotency-Key is still being processed",
+            422: "Idempotency-Key was already used for a different request"
         }
     )
-    @transaction.atomic
+    @idempotent('recommend')
     def post(self, request):
         serializer = CropRecommendationRequestSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
         data = serializer.validated_data
         
-        # Save soil data
-        soil_data = SoilData.objects.create(
-            user=request.user,
-            ph_level=data['ph_level'],
-            nitrogen=data['nitrogen'],
-            phosphorus=data['phosphorus'],
-            potassium=data['potassium'],
-            rainfall=data['rainfall'],
-            temperature=data.get('temperature'),
-            humidity=data.get('humidity'),
-            district='Not Provided',
-            season=data['season'],
-            notes=data.get('notes', '')
-        )
+        catalog = crop_catalog_store.get()
+        backend = scoring_backends.get(data.get('algorithm'))
+        if not backend.is_available(catalog):
+            return model_unavailable(backend)
         
-        # Get recommendations from engine
+        # Score before opening the transaction, so the database write lock
+        # is only held for the inserts
+        error = None
         try:
-            recommendations = crop_recommendation_engine.predict(
+            recommendations = backend.predict(
                 data['ph_level'],
                 data['nitrogen'],
                 data['phosphorus'],
                 data['potassium'],
                 data['rainfall'],
-                data['season']
+                data['season'],
+                catalog=catalog
             )
-            
-            if not recommendations:
-                return Response({
-                    'error': 'No suitable crops found for the given parameters',
-                    'soil_data_id': soil_data.id
-                }, status=status.HTTP_404_NOT_FOUND)
-            
-            # Calculate confidence score
-            confidence = crop_recommendation_engine.get_confidence_score(recommendations)
-            
-            # Create recommendation record
-            crop_recommendation = CropRecommendation.objects.create(
-                user=request.user,
-                soil_data=soil_data,
-                algorithm_used='Decision Tree',
-                confidence_score=confidence
-            )
-            
-            # Save recommended crops with scores
-            for rec in recommendations:
-                RecommendationScore.objects.create(
-                    recommendation=crop_recommendation,
-                    crop=rec['crop'],
-                    score=rec['score'],
-                    ranking=rec['ranking']
-                )
-            
-            # Return response
+        except Exception as e:
+            recommendations, error = [], e
+        
+        if recommendations is None:
+            # The model went stale (e.g. a retrain finished) since is_available()
+            return model_unavailable(backend)
+        
+        # Soil data is kept even without recommendations
+        records = build_recommendation_records(
+            request.user,
+            [data],
+            [recommendations],
+            algorithm_used=backend.algorithm_name
+        )
+        (soil_data,), (crop_recommendation,), _ = records
+        
+        # With write-behind the rows are queued after the response is built,
+        # so clients get references (ids are null) without waiting for the insert
+        queued = write_behind_queue.accepting()
+        if not queued:
+            with transaction.atomic():
+                insert_recommendation_records([records])
+        
+        if error is not None:
+            response = Response({
+                'error': f'Error generating recommendation: {str(error)}',
+                'soil_data_id': soil_data.id,
+                'soil_data_reference': str(soil_data.reference)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        elif crop_recommendation is None:
+            response = Response({
+                'error': 'No suitable crops found for the given parameters',
+                'soil_data_id': soil_data.id,
+                'soil_data_reference': str(soil_data.reference)
+            }, status=status.HTTP_404_NOT_FOUND)
+        else:
+            # Serialized from the objects in memory (user, soil data, scores
+            # and crops), without further queries
             recommendation_serializer = CropRecommendationSerializer(crop_recommendation)
-            
-            return Response({
+            response = Response({
                 'recommendation': recommendation_serializer.data,
+                'catalog_version': catalog.version,
+                'queued': queued,
                 'message': 'Crop recommendation generated successfully'
             }, status=status.HTTP_200_OK)
-            
-        except Exception as e:
-            return Response({
-                'error': f'Error generating recommendation: {str(e)}',
-                'soil_data_id': soil_data.id
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        if queued and not write_behind_queue.submit(insert_recommendation_records, records):
+            # The queue filled up or shut down since accepting()
+            with transaction.atomic():
+                insert_recommendation_records([records])
+        
+        return response
+
+class CropRecommendationBatchView(APIView):
+    """
+    Get crop recommendations for many soil samples in one request.
+    
+    All valid samples are scored together and stored with bulk inserts.
+    Invalid samples are reported individually without failing the batch.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    @swagger_auto_schema(
+        operation_description="""
+        Get crop recommendations for up to 1000 soil samples at once.
+        
+        Each entry in `samples` takes the same fields as `POST /recommend/`.
+        `algorithm` selects the scoring backend for the whole batch.
+        Results are returned in input order; entries that fail validation or
+        have no suitable crops carry an `error` instead of a `recommendation`.
+        """,
+        request_body=CropRecommendationBatchRequestSerializer,
+        responses={
+            200: openapi.Response(
+                description="Batch processed",
+                examples={
+                    "application/json": {
+                        "results": [
+                            {
+                                "index": 0,
+                                "recommendation": {
+                                    "id": 1,
+                                    "confidence_score": 0.95,
+                                    "recommended_crops_details": [
+                                        {
+                                            "crop_name": "Rice",
+                                            "score": 0.95,
+                                            "ranking": 1
+                                        }
+                                    ]
+                                }
+                            },
+                            {
+                                "index": 1,
+                                "error": {"ph_level": ["Ensure this value is less than or equal to 14."]}
+                            }
+                        ],
+                        "catalog_version": "3f9a1c2b7d4e",
+                        "message": "Generated 1 of 2 recommendations"
+                    }
+                }
+            ),
+            503: "Selected model is not trained for the current crop catalog"
+        }
+    )
+    def post(self, request):
+        batch_serializer = CropRecommendationBatchRequestSerializer(data=request.data)
+        batch_serializer.is_valid(raise_exception=True)
+        samples = batch_serializer.validated_data['samples']
+        
+        catalog = crop_catalog_store.get()
+        backend = scoring_backends.get(batch_serializer.validated_data.get('algorithm'))
+        if not backend.is_available(catalog):
+            return model_unavailable(backend)
+        
+        # Validate each sample on its own so one bad entry doesn't fail the batch
+        results = [{'index': index} for index in range(len(samples))]
+        valid = []
+        for index, sample in enumerate(samples):
+            serializer = CropRecommendationRequestSerializer(data=sample)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index]['error'] = serializer.errors
+        
+        # Score all valid samples together before touching the database
+        predictions = backend.predict_batch(
+            [
+                (data['ph_level'], data['nitrogen'], data['phosphorus'],
+                 data['potassium'], data['rainfall'], data['season'])
+                for _, data in valid
+            ],
+            catalog=catalog
+        )
+        if predictions is None:
+            # The model went stale (e.g. a retrain finished) since is_available()
+            return model_unavailable(backend)
+        
+        soil_data_rows, recommendation_rows = save_recommendations(
+            request.user,
+            [data for _, data in valid],
+            predictions,
+            algorithm_used=backend.algorithm_name
+        )
+        
+        generated = 0
+        for (index, _), soil_data, crop_recommendation in zip(valid, soil_data_rows, recommendation_rows):
+            if crop_recommendation is None:
+                results[index]['error'] = 'No suitable crops found for the given parameters'
+                results[index]['soil_data_id'] = soil_data.id
+            else:
+                results[index]['recommendation'] = CropRecommendationSerializer(crop_recommendation).data
+                generated += 1
+        
+        return Response({
+            'results': results,
+            'catalog_version': catalog.version,
+            'message': f'Generated {generated} of {len(samples)} recommendations'
+        }, status=status.HTTP_200_OK)
+
+class RecommendationCacheStatsView(APIView):
+    """
+    Hit/miss/eviction counters of the recommendation result cache (this worker only).
+    """
+    permission_classes = [permissions.IsAdminUser]
+    
+    @swagger_auto_schema(
+        operation_description="Get recommendation cache counters for sizing the cache (admin only)"
+    )
+    def get(self, request):
+        cache = crop_recommendation_engine.result_cache
+        if cache is None:
+            return Response({'enabled': False}, status=status.HTTP_200_OK)
+        
+        return Response({'enabled': True, **cache.stats()}, status=status.HTTP_200_OK)
+
+class ScoringBackendListView(APIView):
+    """
+    List the scoring backends with their availability and inference latency (this worker only).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    @swagger_auto_schema(
+        operation_description="List scoring backends selectable via `algorithm`, with latency counters",
+        responses={
+            200: openapi.Response(
+                description="Scoring backends",
+                examples={
+                    "application/json": {
+                        "default": "range",
+                        "backends": [
+                            {
+                                "name": "range",
+                                "algorithm": "Range Scoring",
+                                "available": True,
+                                "latency": {
+                                    "calls": 120,
+                                    "samples": 120,
+                                    "mean_ms_per_call": 0.41,
+                                    "mean_ms_per_sample": 0.41,
+                                    "p50_ms": 0.35,
+                                    "p99_ms": 1.2
+                                }
+                            }
+                        ]
+                    }
+                }
+            )
+        }
+    )
+    def get(self, request):
+        catalog = crop_catalog_store.get()
+        
+        return Response({
+            'default': scoring_backends.default_name,
+            'backends': [
+                {
+                    'name': backend.name,
+                    'algorithm': backend.algorithm_name,
+                    'available': backend.is_available(catalog),
+                    'latency': backend.latency.stats()
+                }
+                for backend in scoring_backends
+            ]
+        }, status=status.HTTP_200_OK)
 
 class CropRecommendationHistoryView(generics.ListAPIView):
     """
     View history of crop recommendations for the authenticated user.
     """
-    serializer_class = CropRecommendationSerializer
+    serializer_class = CropRecommendationSnapshotSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     @swagger_auto_schema(
@@ -191,33 +401,41 @@ class CropRecommendationHistoryView(generics.ListAPIView):
         return super().get(request, *args, **kwargs)
     
     def get_queryset(self):
+        # One query on the recommendation table; details come from the snapshot
         return CropRecommendation.objects.filter(user=self.request.user)
 
 class CropRecommendationDetailView(generics.RetrieveAPIView):
     """
     View details of a specific crop recommendation.
     """
-    serializer_class = CropRecommendationSerializer
+    serializer_class = CropRecommendationSnapshotSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
+        # One query on the recommendation table; details come from the snapshot
         return CropRecommendation.objects.filter(user=self.request.user)
 
 class CropSearchView(generics.ListAPIView):
     """
-    Search crops by name.
+    Search crops by name and/or growing season.
     """
     serializer_class = CropSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     
     @swagger_auto_schema(
-        operation_description="Search crops by name",
+        operation_description="Search crops by name and/or growing season",
         manual_parameters=[
             openapi.Parameter(
                 'search',
                 openapi.IN_QUERY,
                 description="Search term for crop name",
                 type=openapi.TYPE_STRING
+            ),
+            openapi.Parameter(
+                'season',
+                openapi.IN_QUERY,
+                description="Only crops grown in this season (e.g. Summer)",
+                type=openapi.TYPE_STRING
             )
         ]
     )
@@ -229,4 +447,7 @@ class CropSearchView(generics.ListAPIView):
         search = self.request.query_params.get('search', None)
         if search:
             queryset = queryset.filter(name__icontains=search)
+        season = self.request.query_params.get('season', None)
+        if season:
+            queryset = queryset.for_season(season)
         return queryset
@@ -0,0 +1,548 @@
+"""
+Geo Utilities
+Haversine distances, scalar and vectorized, and an in-memory array of active
+market coordinates that nearest-market searches scan in one NumPy pass
+"""
+
+import bisect
+import math
+import threading
+import time
+from functools import cached_property
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from .models import Market
+
+# Earth's radius in kilometers
+EARTH_RADIUS_KM = 6371.0
+
+# Distances are reported (and ranked) in hundredths of a kilometer
+DISTANCE_DECIMALS = 2
+
+# Upper bound on (points x markets) distances computed at once by bulk lookups
+MATRIX_CHUNK_ELEMENTS = 2_000_000
+
+# From this many active markets on, queries go through the KD-tree instead of
+# scanning every market (a full NumPy scan is faster below it)
+INDEX_MIN_MARKETS = 512
+
+# Relative widening of KD-tree ball queries, so float rounding can only add
+# candidates (filtered out afterwards by the exact distance), never drop one
+RADIUS_SLACK = 1e-9
+
+# Boolean Market fields searches can filter on
+FACILITY_FIELDS = (
+    'has_cold_storage', 'has_grading_facility', 'has_packaging_facility', 'transportation_available'
+)
+
+MARKET_ROW_FIELDS = ('id', 'latitude', 'longitude', 'district', 'name', 'market_type', *FACILITY_FIELDS)
+
+# Half the Earth's circumference: no two points are farther apart
+MAX_DISTANCE_KM = math.pi * EARTH_RADIUS_KM
+
+# Factor the database search radius grows by while too few markets are in it
+RADIUS_GROWTH = 4
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Great circle distance in kilometers between two points in decimal degrees
+
+    d = 2r × arcsin(√(sin²(Δlat/2) + cos(lat1) × cos(lat2) × sin²(Δlon/2)))
+    """
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    dlat = lat2_rad - lat1_rad
+    dlon = math.radians(lon2) - math.radians(lon1)
+
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def haversine_km_radians(lat1, lon1, lat2, lon2, cos_lat2=None):
+    """
+    Vectorized haversine over arrays of coordinates in radians (broadcast
+    like any NumPy operation), in kilometers
+    cos_lat2 can pass precomputed cos(lat2)
+    """
+    if cos_lat2 is None:
+        cos_lat2 = np.cos(lat2)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * cos_lat2 * np.sin((lon2 - lon1) / 2) ** 2
+    # Rounding can push a slightly above 1 for antipodal points
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def distance_matrix_km(latitudes, longitudes, target_latitudes, target_longitudes):
+    """
+    (points x targets) distances in kilometers between two sets of
+    points in decimal degrees
+    """
+    lat1 = np.radians(np.asarray(latitudes, dtype=np.float64))[:, np.newaxis]
+    lon1 = np.radians(np.asarray(longitudes, dtype=np.float64))[:, np.newaxis]
+    lat2 = np.radians(np.asarray(target_latitudes, dtype=np.float64))[np.newaxis, :]
+    lon2 = np.radians(np.asarray(target_longitudes, dtype=np.float64))[np.newaxis, :]
+    return haversine_km_radians(lat1, lon1, lat2, lon2)
+
+
+class MarketCoordinates:
+    """
+    Read-only arrays over the active markets, in Market's default order
+
+    ids:          market primary keys
+    latitude:     latitudes in radians (longitude likewise)
+    cos_latitude: precomputed cos(latitude)
+    districts:    lower-cased district names, for the district filter
+    market_types: Market.market_type values
+    facilities:   {facility field: bool array}, for FACILITY_FIELDS
+    rows:         the MARKET_ROW_FIELDS rows they were built from
+
+    Queries scan every market in one NumPy pass, or from INDEX_MIN_MARKETS
+    markets on use the KD-tree in `index`. Both give the same results.
+    """
+
+    def __init__(self, rows):
+        self.rows = tuple(rows)
+        self.ids = np.array([row[0] for row in self.rows], dtype=np.int64)
+        self.latitude = np.radians(np.array([row[1] for row in self.rows], dtype=np.float64))
+        self.longitude = np.radians(np.array([row[2] for row in self.rows], dtype=np.float64))
+        self.cos_latitude = np.cos(self.latitude)
+        self.districts = np.array([row[3].lower() for row in self.rows], dtype=str)
+        self.market_types = np.array([row[5] for row in self.rows], dtype=str)
+        self.facilities = {
+            field: np.array([row[column] for row in self.rows], dtype=bool)
+            for column, field in enumerate(MARKET_ROW_FIELDS)
+            if field in FACILITY_FIELDS
+        }
+
+        for array in (self.ids, self.latitude, self.longitude, self.cos_latitude, self.districts,
+                      self.market_types, *self.facilities.values()):
+            array.setflags(write=False)
+
+    @classmethod
+    def from_database(cls):
+        """
+        Coordinates of all markets currently active in the database
+        """
+        return cls(Market.objects.filter(is_active=True).values_list(*MARKET_ROW_FIELDS))
+
+    def __len__(self):
+        return len(self.ids)
+
+    @cached_property
+    def index(self):
+        """
+        KD-tree over the markets as 3D unit vectors, built on first use
+
+        Straight-line (chord) distance between unit vectors grows with the
+        great circle distance, so its nearest neighbours and balls are the
+        haversine ones, at O(log n) per query.
+        """
+        # scipy comes with scikit-learn; imported here so startup doesn't pay for it
+        from scipy.spatial import cKDTree
+
+        return cKDTree(unit_vectors(self.latitude, self.longitude))
+
+    @property
+    def uses_index(self):
+        return len(self) >= INDEX_MIN_MARKETS
+
+    def with_market(self, market):
+        """
+        Copy with one market's row replaced, added (if active) or removed
+        (if inactive), kept in Market's default order
+        """
+        rows = [row for row in self.rows if row[0] != market.pk]
+        if market.is_active:
+            row = tuple(getattr(market, field) for field in MARKET_ROW_FIELDS)
+            position = bisect.bisect_right([_order_key(other) for other in rows], _order_key(row))
+            rows.insert(position, row)
+        return MarketCoordinates(rows)
+
+    def without_market(self, market_id):
+        """
+        Copy without the given market
+        """
+        return MarketCoordinates(row for row in self.rows if row[0] != market_id)
+
+    def district_indices(self, district):
+        """
+        Indices of the markets whose district contains the given text
+        (case-insensitive, like district__icontains)
+        """
+        return np.flatnonzero(np.char.find(self.districts, district.lower()) >= 0)
+
+    def distances(self, latitudes, longitudes, indices=None):
+        """
+        (points x markets) distances in kilometers from points in decimal
+        degrees to every market, or to the markets at indices
+        """
+        lat = np.radians(np.asarray(latitudes, dtype=np.float64)).reshape(-1, 1)
+        lon = np.radians(np.asarray(longitudes, dtype=np.float64)).reshape(-1, 1)
+        if indices is None:
+            return haversine_km_radians(lat, lon, self.latitude, self.longitude, self.cos_latitude)
+        return haversine_km_radians(
+            lat, lon, self.latitude[indices], self.longitude[indices], self.cos_latitude[indices]
+        )
+
+    def nearest(self, latitudes, longitudes, k, district=None):
+        """
+        The k nearest markets to each point
+
+        Returns (indices, distances): (points x k) arrays of market indices
+        and distances in kilometers, nearest first; fewer than k columns
+        when fewer markets match. Ranking is on distances rounded to
+        DISTANCE_DECIMALS, and markets at the same rounded distance keep
+        Market's default order.
+        District searches scan the district's markets.
+        """
+        latitudes = np.atleast_1d(np.asarray(latitudes, dtype=np.float64))
+        longitudes = np.atleast_1d(np.asarray(longitudes, dtype=np.float64))
+        if district is None and self.uses_index:
+            return self._nearest_indexed(latitudes, longitudes, min(k, len(self)))
+
+        candidates = np.arange(len(self)) if district is None else self.district_indices(district)
+        k = min(k, candidates.size)
+
+        indices = np.zeros((latitudes.size, k), dtype=np.intp)
+        distances = np.zeros((latitudes.size, k), dtype=np.float64)
+        if k == 0:
+            return indices, distances
+
+        chunk_rows = max(1, MATRIX_CHUNK_ELEMENTS // candidates.size)
+        for start in range(0, latitudes.size, chunk_rows):
+            rows = slice(start, start + chunk_rows)
+            chunk = self.distances(latitudes[rows], longitudes[rows], candidates)
+            top = top_k(chunk, k)
+            indices[rows] = candidates[top]
+            distances[rows] = np.take_along_axis(chunk, top, axis=1)
+
+        return indices, distances
+
+    def _nearest_indexed(self, latitudes, longitudes, k):
+        indices = np.zeros((latitudes.size, k), dtype=np.intp)
+        distances = np.zeros((latitudes.size, k), dtype=np.float64)
+        if k == 0:
+            return indices, distances
+
+        points = unit_vectors(np.radians(latitudes), np.radians(longitudes))
+        _, nearest = self.index.query(points, k=k)
+        nearest = np.asarray(nearest).reshape(latitudes.size, k)
+
+        # Markets at the same rounded distance as the k-th nearest can still
+        # outrank it, so take everything up to that rounded distance
+        last = nearest[:, -1]
+        kth = haversine_km_radians(
+            np.radians(latitudes), np.radians(longitudes),
+            self.latitude[last], self.longitude[last], self.cos_latitude[last]
+        )
+        balls = self.index.query_ball_point(points, chord_length(_rounding_bound(kth)) * (1 + RADIUS_SLACK))
+
+        for row, ball in enumerate(balls):
+            candidates = np.sort(np.asarray(ball, dtype=np.intp))
+            row_distances = self.distances(latitudes[row], longitudes[row], candidates)
+            top = top_k(row_distances, k)[0]
+            indices[row] = candidates[top]
+            distances[row] = row_distances[0, top]
+
+        return indices, distances
+
+    def within(self, latitude, longitude, radius_km, district=None, market_type=None, facilities=None):
+        """
+        Markets within radius_km of a point
+
+        Optionally only those in a district (as in nearest()), of a
+        market_type, or with the given {facility field: bool} values.
+        Returns (indices, distances) sorted like nearest(); markets exactly
+        radius_km away are included
+        """
+        if self.uses_index:
+            point = unit_vectors(np.radians(latitude), np.radians(longitude))[0]
+            candidates = np.sort(np.asarray(
+                self.index.query_ball_point(point, chord_length(radius_km) * (1 + RADIUS_SLACK)),
+                dtype=np.intp
+            ))
+        else:
+            candidates = np.arange(len(self))
+
+        keep = np.ones(candidates.size, dtype=bool)
+        if district is not None:
+            keep &= np.char.find(self.districts[candidates], district.lower()) >= 0
+        if market_type is not None:
+            keep &= self.market_types[candidates] == market_type
+        for field, value in (facilities or {}).items():
+            keep &= self.facilities[field][candidates] == value
+        candidates = candidates[keep]
+
+        row_distances = self.distances(latitude, longitude, candidates)[0]
+        inside = row_distances <= radius_km
+        candidates, row_distances = candidates[inside], row_distances[inside]
+
+        order = top_k(row_distances[np.newaxis, :], candidates.size)[0]
+        return candidates[order], row_distances[order]
+
+
+def unit_vectors(latitude, longitude):
+    """
+    (points x 3) unit vectors for coordinates in radians
+    """
+    latitude = np.atleast_1d(latitude)
+    longitude = np.atleast_1d(longitude)
+    cos_latitude = np.cos(latitude)
+    return np.column_stack([
+        cos_latitude * np.cos(longitude),
+        cos_latitude * np.sin(longitude),
+        np.sin(latitude)
+    ])
+
+
+def chord_length(distance_km):
+    """
+    Straight-line distance between unit vectors a great circle distance apart
+    """
+    angle = np.minimum(np.asarray(distance_km, dtype=np.float64) / EARTH_RADIUS_KM, np.pi)
+    return 2 * np.sin(angle / 2)
+
+
+def _order_key(row):
+    # Market's default ordering: district, then name
+    return row[3], row[4]
+
+
+def top_k(distances, k):
+    """
+    Column indices of the k nearest distances of each row after rounding to
+    DISTANCE_DECIMALS, nearest first, ties broken by column (matching a
+    stable sort of the whole row)
+    Uses argpartition, so the full rows are never sorted
+    """
+    columns = distances.shape[1]
+    # Unique integer keys: rounded distance in hundredths, then column
+    keys = np.rint(distances * 10 ** DISTANCE_DECIMALS).astype(np.int64) * columns + np.arange(columns)
+    if k < columns:
+        selected = np.argpartition(keys, k - 1, axis=1)[:, :k]
+    else:
+        selected = np.broadcast_to(np.arange(columns), keys.shape)
+    order = np.argsort(np.take_along_axis(keys, selected, axis=1), axis=1)
+    return np.take_along_axis(selected, order, axis=1)
+
+
+def bounding_boxes(latitude, longitude, radius_km):
+    """
+    (min_lat, max_lat, min_lon, max_lon) boxes in decimal degrees that
+    together contain every point within radius_km of the given one
+    Two boxes when the circle crosses the antimeridian; all longitudes when
+    it reaches a pole.
+    """
+    angle = radius_km / EARTH_RADIUS_KM * (1 + RADIUS_SLACK)
+    min_lat = latitude - math.degrees(angle)
+    max_lat = latitude + math.degrees(angle)
+    if min_lat <= -90 or max_lat >= 90:
+        return [(max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0)]
+
+    # Widest longitude offset on the circle (reached north/south of the point)
+    ratio = math.sin(angle) / math.cos(math.radians(latitude))
+    if ratio >= 1:
+        return [(min_lat, max_lat, -180.0, 180.0)]
+    lon_delta = math.degrees(math.asin(ratio))
+
+    min_lon = longitude - lon_delta
+    max_lon = longitude + lon_delta
+    if min_lon < -180:
+        return [(min_lat, max_lat, min_lon + 360, 180.0), (min_lat, max_lat, -180.0, max_lon)]
+    if max_lon > 180:
+        return [(min_lat, max_lat, min_lon, 180.0), (min_lat, max_lat, -180.0, max_lon - 360)]
+    return [(min_lat, max_lat, min_lon, max_lon)]
+
+
+def filter_within_box(queryset, latitude, longitude, radius_km):
+    """
+    Markets of queryset inside the bounding boxes of the circle (a cheap
+    superset of the markets within radius_km, served by the
+    (is_active, latitude, longitude) index)
+    """
+    condition = Q()
+    for min_lat, max_lat, min_lon, max_lon in bounding_boxes(latitude, longitude, radius_km):
+        condition |= Q(latitude__range=(min_lat, max_lat), longitude__range=(min_lon, max_lon))
+    return queryset.filter(condition)
+
+
+def nearest_markets_from_database(latitude, longitude, k, district=None, radius_km=None):
+    """
+    The k nearest active markets, read straight from the database, for
+    processes without a coordinates snapshot
+
+    Only the markets inside the bounding box of a search radius are
+    fetched. The radius starts at radius_km (default
+    MARKET_SEARCH_INITIAL_RADIUS_KM) and grows RADIUS_GROWTH-fold until
+    it holds k markets.
+    Returns [(market, distance_km)], ranked like MarketCoordinates.nearest()
+    """
+    markets = Market.objects.filter(is_active=True)
+    if district:
+        markets = markets.filter(district__icontains=district)
+    if radius_km is None:
+        radius_km = getattr(settings, 'MARKET_SEARCH_INITIAL_RADIUS_KM', 25.0)
+
+    while True:
+        everywhere = radius_km >= MAX_DISTANCE_KM
+        rows = list(markets if everywhere else filter_within_box(markets, latitude, longitude, radius_km))
+        distances = haversine_km_radians(
+            math.radians(latitude), math.radians(longitude),
+            np.radians([market.latitude for market in rows]),
+            np.radians([market.longitude for market in rows])
+        )
+        # Box corners lie outside the circle
+        inside = np.flatnonzero(distances <= radius_km)
+
+        if inside.size >= k or everywhere:
+            top = top_k(distances[np.newaxis, inside], min(k, inside.size))[0]
+            chosen = inside[top]
+            # Done unless a market just outside the radius could tie with the
+            # k-th after rounding
+            if everywhere or chosen.size == 0 or _rounding_bound(distances[chosen[-1]]) <= radius_km:
+                return [(rows[i], float(distances[i])) for i in chosen]
+
+        radius_km *= RADIUS_GROWTH
+
+
+def markets_within_from_database(latitude, longitude, radius_km, **filters):
+    """
+    (market ids, distances) of the active markets within radius_km, read
+    through the bounding-box prefilter, for processes without a coordinates
+    snapshot
+    filters are extra Market lookups (e.g. market_type='wholesale')
+    Sorted like MarketCoordinates.within()
+    """
+    markets = Market.objects.filter(is_active=True, **filters)
+    if radius_km < MAX_DISTANCE_KM:
+        markets = filter_within_box(markets, latitude, longitude, radius_km)
+    rows = np.array(list(markets.values_list('id', 'latitude', 'longitude')), dtype=np.float64).reshape(-1, 3)
+
+    distances = haversine_km_radians(
+        math.radians(latitude), math.radians(longitude), np.radians(rows[:, 1]), np.radians(rows[:, 2])
+    )
+    inside = np.flatnonzero(distances <= radius_km)
+    order = inside[top_k(distances[np.newaxis, inside], inside.size)[0]]
+    return rows[order, 0].astype(np.int64), distances[order]
+
+
+def _rounding_bound(distance_km):
+    # Largest distance that rounds to the same value as distance_km
+    scale = 10 ** DISTANCE_DECIMALS
+    return (np.rint(distance_km * scale) + 0.5) / scale
+
+
+class MarketCoordinatesStore:
+    """
+    Process-wide snapshot of the active market coordinates
+
+    Built lazily (or by warm() at worker startup) and kept current by the
+    Market post_save/post_delete signals, which patch the one changed
+    market in once its transaction commits (see update() and remove()). Changes made by other processes,
+    or by bulk queryset writes that send no signals, are picked up by a
+    count/updated_at check that runs at most every
+    MARKET_COORDINATES_REVALIDATE_SECONDS.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._coordinates = None
+        self._db_marker = None
+        self._checked_at = 0.0
+        self._stale = True
+
+    def get(self):
+        """
+        Return the current coordinates snapshot, rebuilding it if needed
+        """
+        coordinates = self._coordinates
+        if coordinates is not None and not self._stale and not self._needs_revalidation():
+            return coordinates
+
+        with self._lock:
+            if self._stale or self._coordinates is None:
+                self._rebuild()
+            elif self._needs_revalidation():
+                self._checked_at = time.monotonic()
+                if self._current_db_marker() != self._db_marker:
+                    self._rebuild()
+            return self._coordinates
+
+    def current(self):
+        """
+        The snapshot (as get() returns it) if this process has loaded one,
+        else None without loading it
+        """
+        if self._coordinates is None:
+            return None
+        return self.get()
+
+    def invalidate(self):
+        """
+        Mark the snapshot stale; the next get() rebuilds it
+        Waits for a rebuild in progress, which may have read older rows
+        """
+        with self._lock:
+            self._stale = True
+
+    def clear(self):
+        """
+        Drop the snapshot, as in a process that never loaded it
+        """
+        with self._lock:
+            self._coordinates = None
+            self._stale = True
+
+    def update(self, market):
+        """
+        Apply one saved market to the snapshot without reloading the others
+        """
+        self._apply(lambda coordinates: coordinates.with_market(market))
+
+    def remove(self, market_id):
+        """
+        Drop one deleted market from the snapshot
+        """
+        self._apply(lambda coordinates: coordinates.without_market(market_id))
+
+    def warm(self):
+        """
+        Load the snapshot and build its KD-tree ahead of the first request
+        """
+        coordinates = self.get()
+        if coordinates.uses_index:
+            coordinates.index
+
+    def _apply(self, change):
+        with self._lock:
+            if self._stale or self._coordinates is None:
+                return
+            coordinates = change(self._coordinates)
+            # The tree is rebuilt here, not in the next request
+            if coordinates.uses_index:
+                coordinates.index
+            self._coordinates = coordinates
+            self._db_marker = self._current_db_marker()
+
+    def _rebuild(self):
+        self._stale = False
+        self._db_marker = self._current_db_marker()
+        self._checked_at = time.monotonic()
+        self._coordinates = MarketCoordinates.from_database()
+
+    def _needs_revalidation(self):
+        interval = getattr(settings, 'MARKET_COORDINATES_REVALIDATE_SECONDS', 60)
+        if interval is None:
+            return False
+        return time.monotonic() - self._checked_at >= interval
+
+    @staticmethod
+    def _current_db_marker():
+        marker = Market.objects.aggregate(count=Count('id'), last_updated=Max('updated_at'))
+        return marker['count'], marker['last_updated']
+
+
+# Global instance
+market_coordinates_store = MarketCoordinatesStore()
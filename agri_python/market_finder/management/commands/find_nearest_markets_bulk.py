@@ -0,0 +1,202 @@
+import csv
+import json
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from agrinova_backend.bulk_files import file_format, read_records
+from authentication.models import CustomUser
+from market_finder.geo import market_coordinates_store
+from market_finder.market_utils import MarketFinderEngine, build_market_searches, insert_market_searches
+from market_finder.models import Market
+
+
+def parse_point(record):
+    """
+    (latitude, longitude) of one input row
+    Raises ValueError describing the first problem found
+    """
+    coordinates = []
+    for field, limit in (('latitude', 90), ('longitude', 180)):
+        try:
+            value = float(record.get(field))
+        except (TypeError, ValueError):
+            raise ValueError(f'{field} must be a number')
+        if not -limit <= value <= limit:
+            raise ValueError(f'{field} must be between -{limit} and {limit}')
+        coordinates.append(value)
+    return tuple(coordinates)
+
+
+def csv_fieldnames(max_results, saving):
+    fieldnames = ['id']
+    for rank in range(1, max_results + 1):
+        fieldnames += [f'market_{rank}', f'market_{rank}_id', f'distance_{rank}']
+    if saving:
+        fieldnames.append('search_id')
+    fieldnames.append('error')
+    return fieldnames
+
+
+class Command(BaseCommand):
+    help = 'Finds the nearest markets for a CSV/NDJSON file of locations (id, latitude, longitude)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Input file (.csv, .ndjson or .jsonl)')
+        parser.add_argument('output', help='Output file (.csv, .ndjson or .jsonl)')
+        parser.add_argument(
+            '--max-results',
+            type=int,
+            default=5,
+            help='Nearest markets listed per location'
+        )
+        parser.add_argument('--district', help='Only consider markets in this district')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10000,
+            help='Locations searched per query'
+        )
+        parser.add_argument(
+            '--save',
+            action='store_true',
+            help='Also store a MarketSearch log per location (requires --user)'
+        )
+        parser.add_argument('--user', help='Username that saved searches belong to')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        max_results = options['max_results']
+        if chunk_size < 1 or max_results < 1:
+            raise CommandError('--chunk-size and --max-results must be at least 1')
+
+        user = None
+        if options['save']:
+            if not options['user']:
+                raise CommandError('--save requires --user')
+            try:
+                user = CustomUser.objects.get(username=options['user'])
+            except CustomUser.DoesNotExist:
+                raise CommandError(f'User {options["user"]} does not exist')
+        saving = user is not None
+
+        input_format = file_format(options['input'])
+        output_format = file_format(options['output'])
+
+        coordinates = market_coordinates_store.get()
+        if len(coordinates) == 0:
+            raise CommandError('No active markets found. Run seed_markets first.')
+        names = dict(Market.objects.filter(is_active=True).values_list('id', 'name'))
+
+        self.stdout.write(
+            f'Searching {options["input"]} against {len(coordinates)} markets '
+            f'({"KD-tree" if coordinates.uses_index else "full scan"})...'
+        )
+
+        started = time.monotonic()
+        total_rows = 0
+        error_rows = 0
+
+        with open(options['input'], newline='') as input_file, \
+                open(options['output'], 'w', newline='') as output_file:
+            records = read_records(input_file, input_format)
+            writer = None
+            if output_format == 'csv':
+                writer = csv.DictWriter(output_file, fieldnames=csv_fieldnames(max_results, saving))
+                writer.writeheader()
+
+            first_row = 1
+            while True:
+                chunk = list(islice(records, chunk_size))
+                if not chunk:
+                    break
+
+                rows = self._search_chunk(chunk, first_row, options['district'], max_results, names, user)
+                for row in rows:
+                    if writer is not None:
+                        writer.writerow(self._flatten(row))
+                    else:
+                        output_file.write(json.dumps(row) + '\n')
+
+                first_row += len(chunk)
+                total_rows += len(rows)
+                error_rows += sum(1 for row in rows if row['error'] is not None)
+
+                if options['verbosity'] >= 2:
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(f'  {total_rows} rows ({total_rows / elapsed:.0f} rows/sec)')
+
+        elapsed = time.monotonic() - started
+        rate = total_rows / elapsed if elapsed > 0 else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'\nSearched {total_rows} locations ({error_rows} errors) in {elapsed:.1f}s '
+            f'({rate:.0f} rows/sec)'
+        ))
+
+    @staticmethod
+    def _search_chunk(records, first_row, district, max_results, names, user):
+        """
+        Validate and search one chunk of input records with a single query
+        Returns one output row per record
+        """
+        rows = []
+        points = []
+        for row_number, record in enumerate(records, first_row):
+            row = {'id': record.get('id') or row_number, 'markets': [], 'error': None}
+            try:
+                point = parse_point(record)
+            except ValueError as e:
+                row['error'] = str(e)
+            else:
+                points.append((row, point))
+            rows.append(row)
+
+        if not points:
+            return rows
+
+        market_ids, distances = MarketFinderEngine.find_nearest_markets_batch(
+            [latitude for _, (latitude, _) in points],
+            [longitude for _, (_, longitude) in points],
+            district=district,
+            max_results=max_results
+        )
+        # Skip markets removed since the coordinates were loaded
+        nearest = [
+            [(market_id, distance) for market_id, distance in zip(row_ids, row_distances) if market_id in names]
+            for row_ids, row_distances in zip(market_ids.tolist(), distances.tolist())
+        ]
+
+        for (row, _), row_nearest in zip(points, nearest):
+            row['markets'] = [
+                {'market_id': market_id, 'market': names[market_id], 'distance_km': round(distance, 2)}
+                for market_id, distance in row_nearest
+            ]
+            if not row_nearest:
+                row['error'] = 'No markets found'
+
+        if user is not None:
+            searches = build_market_searches(
+                user,
+                [point for _, point in points],
+                [[market_id for market_id, _ in row_nearest] for row_nearest in nearest],
+                [[distance for _, distance in row_nearest] for row_nearest in nearest],
+                district=district
+            )
+            with transaction.atomic():
+                insert_market_searches([search for search in searches if search is not None])
+            for (row, _), search in zip(points, searches):
+                row['search_id'] = search.id if search is not None else None
+            for row in rows:
+                row.setdefault('search_id', None)
+
+        return rows
+
+    @staticmethod
+    def _flatten(row):
+        flat = {key: value for key, value in row.items() if key != 'markets'}
+        for rank, market in enumerate(row['markets'], 1):
+            flat[f'market_{rank}'] = market['market']
+            flat[f'market_{rank}_id'] = market['market_id']
+            flat[f'distance_{rank}'] = market['distance_km']
+        return flat
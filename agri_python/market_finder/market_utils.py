@@ -3,8 +3,13 @@ Market Finder Utilities
 Includes Haversine formula for calculating distances
 """
 
-import math
-from .models import Market
+from .geo import (
+    haversine_km,
+    market_coordinates_store,
+    markets_within_from_database,
+    nearest_markets_from_database
+)
+from .models import Market, MarketSearch
 
 class MarketFinderEngine:
     """
@@ -27,30 +32,7 @@ class MarketFinderEngine:
         
         Returns distance in kilometers
         """
-        # Earth's radius in kilometers
-        R = 6371.0
-        
-        # Convert coordinates from degrees to radians
-        lat1_rad = math.radians(lat1)
-        lon1_rad = math.radians(lon1)
-        lat2_rad = math.radians(lat2)
-        lon2_rad = math.radians(lon2)
-        
-        # Calculate differences
-        dlat = lat2_rad - lat1_rad
-        dlon = lon2_rad - lon1_rad
-        
-        # Haversine formula
-        a = (math.sin(dlat / 2) ** 2 + 
-             math.cos(lat1_rad) * math.cos(lat2_rad) * 
-             math.sin(dlon / 2) ** 2)
-        
-        c = 2 * math.asin(math.sqrt(a))
-        
-        # Calculate distance
-        distance = R * c
-        
-        return round(distance, 2)
+        return round(haversine_km(lat1, lon1, lat2, lon2), 2)
     
     @staticmethod
     def find_nearest_markets(latitude, longitude, district=None, max_results=5):
@@ -66,33 +48,73 @@ class MarketFinderEngine:
         Returns:
             List of markets with distances, sorted by proximity
         """
-        # Get active markets
-        markets_query = Market.objects.filter(is_active=True)
-        
-        # Filter by district if provided
-        if district:
-            markets_query = markets_query.filter(district__icontains=district)
-        
-        markets = markets_query.all()
-        
-        # Calculate distances for all markets
-        market_distances = []
-        for market in markets:
-            distance = MarketFinderEngine.haversine_distance(
-                latitude, longitude,
-                market.latitude, market.longitude
-            )
-            
-            market_distances.append({
-                'market': market,
-                'distance_km': distance
-            })
+        coordinates = market_coordinates_store.current()
+        if coordinates is None:
+            # Not loaded in this process (e.g. a management command): query
+            # the markets around the point instead of loading all of them
+            return [
+                {'market': market, 'distance_km': round(distance, 2)}
+                for market, distance in nearest_markets_from_database(
+                    latitude, longitude, max_results, district=district
+                )
+            ]
+        
+        indices, distances = coordinates.nearest(latitude, longitude, max_results, district=district)
+        
+        # Only the winning rows are loaded
+        ids = coordinates.ids[indices[0]].tolist()
+        markets = Market.objects.filter(is_active=True).in_bulk(ids)
+        
+        return [
+            {'market': markets[market_id], 'distance_km': round(float(distance), 2)}
+            for market_id, distance in zip(ids, distances[0].tolist())
+            # Deleted or deactivated since the snapshot was taken
+            if market_id in markets
+        ]
+    
+    @staticmethod
+    def find_nearest_markets_batch(latitudes, longitudes, district=None, max_results=5):
+        """
+        Find the nearest markets to many points with one matrix (or
+        spatial index) query over the active markets
         
-        # Sort by distance
-        market_distances.sort(key=lambda x: x['distance_km'])
+        Returns:
+            (market ids, distances in km) arrays of shape
+            (points x max_results), nearest first; fewer columns when fewer
+            markets match
+        """
+        # Loading all coordinates once beats a bounding-box query per point
+        coordinates = market_coordinates_store.get()
+        indices, distances = coordinates.nearest(latitudes, longitudes, max_results, district=district)
+        return coordinates.ids[indices], distances
+    
+    @staticmethod
+    def find_markets_within(latitude, longitude, radius_km, district=None, market_type=None, facilities=None):
+        """
+        Find active markets within radius_km of the given coordinates
         
-        # Return top N results
-        return market_distances[:max_results]
+        Args:
+            district: Optional district filter
+            market_type: Optional Market.market_type filter
+            facilities: Optional {facility field: bool} filters
+            
+        Returns:
+            (market ids, distances in km) arrays, sorted by proximity
+        """
+        coordinates = market_coordinates_store.current()
+        if coordinates is None:
+            filters = {**(facilities or {})}
+            if district:
+                filters['district__icontains'] = district
+            if market_type:
+                filters['market_type'] = market_type
+            return markets_within_from_database(latitude, longitude, radius_km, **filters)
+        
+        indices, distances = coordinates.within(
+            latitude, longitude, radius_km,
+            district=district, market_type=market_type, facilities=facilities
+        )
+        return coordinates.ids[indices], distances
     
     @staticmethod
     def find_markets_by_district(district, max_results=10):
@@ -141,6 +163,35 @@ class MarketFinderEngine:
         }
 
 
+def insert_market_searches(searches):
+    """
+    Insert MarketSearch rows in one bulk insert
+    Used by the write-behind queue for search logs
+    """
+    MarketSearch.objects.bulk_create(searches)
+
+
+def build_market_searches(user, points, nearest_ids, nearest_distances, district='', crop_to_sell=''):
+    """
+    Unsaved MarketSearch logs for a batch lookup, one per point that found
+    a market (None for the others)
+    points: (latitude, longitude) pairs, aligned with nearest_ids and
+    nearest_distances, the per-point lists of market ids and distances
+    """
+    return [
+        MarketSearch(
+            user=user,
+            search_latitude=latitude,
+            search_longitude=longitude,
+            search_district=district or '',
+            crop_to_sell=crop_to_sell or '',
+            nearest_market_id=market_ids[0],
+            distance_km=round(distances[0], 2)
+        ) if market_ids else None
+        for (latitude, longitude), market_ids, distances in zip(points, nearest_ids, nearest_distances)
+    ]
+
+
 # Example Nepal coordinates for reference
 NEPAL_DISTRICTS_COORDS = {
     'Kathmandu': {'lat': 27.7172, 'lon': 85.3240},
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:05
+
+import uuid
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market_finder', '0001_initial'),
+    ]
+
+    # Added without a default first, so existing rows keep NULL instead of
+    # all sharing one generated UUID
+    operations = [
+        migrations.AddField(
+            model_name='marketsearch',
+            name='reference',
+            field=models.UUIDField(db_index=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='marketsearch',
+            name='reference',
+            field=models.UUIDField(db_index=True, default=uuid.uuid4, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market_finder', '0002_marketsearch_reference'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='market',
+            index=models.Index(fields=['is_active', 'latitude', 'longitude'], name='market_active_lat_lon_idx'),
+        ),
+    ]
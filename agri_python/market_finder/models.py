@@ -1,6 +1,6 @@
 from django.db import models
 from authentication.models import CustomUser
-import math
+import uuid
 
 class Market(models.Model):
     """
@@ -51,28 +51,17 @@ class Market(models.Model):
         """
         Calculate distance using Haversine formula
         """
-        # Earth's radius in kilometers
-        R = 6371.0
+        # geo imports this module
+        from .geo import haversine_km
         
-        # Convert coordinates to radians
-        lat1_rad = math.radians(self.latitude)
-        lon1_rad = math.radians(self.longitude)
-        lat2_rad = math.radians(lat)
-        lon2_rad = math.radians(lon)
-        
-        # Calculate differences
-        dlat = lat2_rad - lat1_rad
-        dlon = lon2_rad - lon1_rad
-        
-        # Haversine formula
-        a = math.sin(dlat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon/2)**2
-        c = 2 * math.asin(math.sqrt(a))
-        distance = R * c
-        
-        return round(distance, 2)
+        return round(haversine_km(self.latitude, self.longitude, lat, lon), 2)
     
     class Meta:
         ordering = ['district', 'name']
+        indexes = [
+            # Bounding-box searches (see geo.filter_within_box)
+            models.Index(fields=['is_active', 'latitude', 'longitude'], name='market_active_lat_lon_idx'),
+        ]
 
 class MarketPrice(models.Model):
     """
@@ -124,6 +113,8 @@ class MarketSearch(models.Model):
     
     # Metadata
     search_date = models.DateTimeField(auto_now_add=True)
+    # Client-visible ID, known before the row is written (see write_behind)
+    reference = models.UUIDField(default=uuid.uuid4, null=True, editable=False, db_index=True)
     
     def __str__(self):
         return f"{self.user.username} - {self.search_district} - {self.search_date.date()}"
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from .geo import FACILITY_FIELDS
 from .models import Market, MarketPrice, MarketSearch
 
 class MarketSerializer(serializers.ModelSerializer):
@@ -32,8 +33,8 @@ class MarketSearchSerializer(serializers.ModelSerializer):
         model = MarketSearch
         fields = ['id', 'user', 'search_latitude', 'search_longitude', 
                   'search_district', 'crop_to_sell', 'nearest_market', 
-                  'nearest_market_details', 'distance_km', 'search_date']
-        read_only_fields = ['id', 'search_date']
+                  'nearest_market_details', 'distance_km', 'search_date', 'reference']
+        read_only_fields = ['id', 'search_date', 'reference']
 
 class MarketSearchRequestSerializer(serializers.Serializer):
     """
@@ -44,3 +45,54 @@ class MarketSearchRequestSerializer(serializers.Serializer):
     district = serializers.CharField(max_length=100, required=False)
     crop_to_sell = serializers.CharField(max_length=100, required=False)
     max_results = serializers.IntegerField(default=5, min_value=1, max_value=20)
+
+class MarketBatchPointSerializer(serializers.Serializer):
+    """
+    One location of a batch market search
+    """
+    id = serializers.CharField(max_length=100, required=False, help_text='Client reference echoed in the result')
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+
+class MarketBatchSearchRequestSerializer(serializers.Serializer):
+    """
+    Serializer for batch market search request
+    Each point is validated separately with MarketBatchPointSerializer
+    """
+    points = serializers.ListField(
+        child=serializers.DictField(),
+        min_length=1,
+        max_length=10000
+    )
+    district = serializers.CharField(max_length=100, required=False)
+    crop_to_sell = serializers.CharField(max_length=100, required=False)
+    max_results = serializers.IntegerField(default=5, min_value=1, max_value=20)
+    save_searches = serializers.BooleanField(
+        default=False,
+        help_text='Also store a MarketSearch log per point (bulk inserted)'
+    )
+
+class MarketRadiusSearchSerializer(serializers.Serializer):
+    """
+    Query parameters of the within-radius market search
+    """
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+    radius_km = serializers.FloatField(min_value=0, max_value=1000)
+    district = serializers.CharField(max_length=100, required=False)
+    market_type = serializers.ChoiceField(choices=Market.MARKET_TYPES, required=False)
+    # Facility filters: true requires the facility, false excludes it
+    has_cold_storage = serializers.BooleanField(required=False, allow_null=True, default=None)
+    has_grading_facility = serializers.BooleanField(required=False, allow_null=True, default=None)
+    has_packaging_facility = serializers.BooleanField(required=False, allow_null=True, default=None)
+    transportation_available = serializers.BooleanField(required=False, allow_null=True, default=None)
+    
+    def facilities(self):
+        """
+        {facility field: bool} for the facility filters that were given
+        """
+        return {
+            field: self.validated_data[field]
+            for field in FACILITY_FIELDS
+            if self.validated_data.get(field) is not None
+        }
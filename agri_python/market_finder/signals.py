@@ -0,0 +1,34 @@
+"""
+Signal handlers for the market finder app
+Keeps the in-memory market coordinates snapshot in sync with the database
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Market
+from .geo import market_coordinates_store
+
+
+@receiver(post_save, sender=Market)
+def update_market_coordinates(sender, instance, raw=False, **kwargs):
+    """
+    Patch the saved market into the coordinates snapshot (and its index)
+    once the transaction commits, so a rolled-back save changes nothing
+    """
+    if raw:
+        # Loaded from a fixture; rebuild from the database instead
+        transaction.on_commit(market_coordinates_store.invalidate)
+        return
+    transaction.on_commit(lambda: market_coordinates_store.update(instance))
+
+
+@receiver(post_delete, sender=Market)
+def remove_market_coordinates(sender, instance, **kwargs):
+    """
+    Drop the deleted market from the coordinates snapshot (and its index)
+    once the transaction commits
+    """
+    # pk is cleared on the instance after the delete
+    market_id = instance.pk
+    transaction.on_commit(lambda: market_coordinates_store.remove(market_id))
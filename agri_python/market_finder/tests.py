@@ -1,3 +1,384 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DatabaseError, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from agrinova_backend.write_behind import WriteBehindQueue
+from .geo import bounding_boxes, haversine_km, market_coordinates_store
+from .market_utils import MarketFinderEngine
+from .models import Market, MarketPrice, MarketSearch
+
+
+class MarketListQueryCountTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='farmer', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.markets = [self.add_market() for _ in range(2)]
+
+    def add_market(self):
+        count = Market.objects.count()
+        market = Market.objects.create(
+            name=f'Market {count}',
+            district='Kathmandu',
+            address='Kathmandu',
+            latitude=27.7 + count / 100,
+            longitude=85.3,
+            market_type='wholesale'
+        )
+        for days in range(3):
+            MarketPrice.objects.create(
+                market=market,
+                crop_name='Rice',
+                price_per_kg=60 + days,
+                price_date=date(2026, 1, 1) + timedelta(days=days)
+            )
+        MarketSearch.objects.create(
+            user=self.user,
+            search_latitude=27.7,
+            search_longitude=85.3,
+            nearest_market=market,
+            distance_km=1.0
+        )
+        return market
+
+    def assertConstantQueries(self, url, num):
+        # Same query count before and after adding more rows
+        with self.assertNumQueries(num):
+            first = self.client.get(url)
+        self.add_market()
+        self.add_market()
+        with self.assertNumQueries(num):
+            second = self.client.get(url)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertGreater(len(second.data), len(first.data))
+
+    def test_search_history_query_count(self):
+        self.assertConstantQueries(reverse('market_finder:search-history'), 1)
+
+    def test_price_list_query_count(self):
+        self.assertConstantQueries(reverse('market_finder:market-price-list'), 1)
+
+    def test_prices_by_market_query_count(self):
+        url = reverse('market_finder:market-prices', args=[self.markets[0].pk])
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(response.data[0]['market_name'], 'Market 0')
+
+
+class NearestMarketTests(TestCase):
+    # Load the coordinates snapshot, as a web worker does at startup
+    warm_store = True
+
+    def setUp(self):
+        # Test rollbacks send no signals, so drop what earlier tests left behind
+        market_coordinates_store.clear()
+        # A grid of markets around Kathmandu, some at equal distances
+        for row in range(4):
+            for column in range(4):
+                Market.objects.create(
+                    name=f'Market {row}-{column}',
+                    district='Kathmandu' if column < 2 else 'Lalitpur',
+                    address='Nepal',
+                    latitude=27.6 + row * 0.05,
+                    longitude=85.2 + column * 0.05,
+                    market_type='retail'
+                )
+        if self.warm_store:
+            market_coordinates_store.warm()
+
+    def brute_force(self, latitude, longitude, district=None, max_results=5):
+        markets = Market.objects.filter(is_active=True)
+        if district:
+            markets = markets.filter(district__icontains=district)
+        distances = [(market.calculate_distance(latitude, longitude), market.pk) for market in markets]
+        distances.sort(key=lambda item: item[0])
+        return [(pk, distance) for distance, pk in distances[:max_results]]
+
+    def nearest(self, *args, **kwargs):
+        return [
+            (item['market'].pk, item['distance_km'])
+            for item in MarketFinderEngine.find_nearest_markets(*args, **kwargs)
+        ]
+
+    def test_matches_brute_force(self):
+        for latitude, longitude in ((27.7, 85.3), (27.675, 85.275), (26.5, 87.3)):
+            for district in (None, 'kathmandu', 'Lalit', 'Jhapa'):
+                for max_results in (1, 5, 20):
+                    self.assertEqual(
+                        self.nearest(latitude, longitude, district=district, max_results=max_results),
+                        self.brute_force(latitude, longitude, district, max_results)
+                    )
+
+    def within_brute_force(self, latitude, longitude, radius_km):
+        # Ties in Market's default order, as for nearest
+        return [
+            pk for pk, _ in self.brute_force(latitude, longitude, max_results=None)
+            if haversine_km(latitude, longitude, *Market.objects.values_list('latitude', 'longitude').get(pk=pk))
+            <= radius_km
+        ]
+
+    def test_within_radius_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(username='officer', password='secret'))
+        market = Market.objects.get(name='Market 1-1')
+        market.market_type = 'wholesale'
+        market.has_cold_storage = True
+        with self.captureOnCommitCallbacks(execute=True):
+            market.save()
+        url = reverse('market_finder:within-radius')
+        params = {'latitude': 27.675, 'longitude': 85.275, 'radius_km': 8, 'page_size': 3}
+
+        first = client.get(url, params)
+        second = client.get(url, {**params, 'page': 2})
+
+        expected = self.within_brute_force(27.675, 85.275, 8)
+        self.assertEqual(first.data['count'], len(expected))
+        self.assertEqual(
+            [item['id'] for item in first.data['results'] + second.data['results']], expected[:6]
+        )
+        self.assertEqual(first.data['results'][0]['distance_km'], market.calculate_distance(27.675, 85.275))
+
+        filtered = client.get(url, {**params, 'market_type': 'wholesale', 'has_cold_storage': 'true'})
+        self.assertEqual([item['id'] for item in filtered.data['results']], [market.pk])
+        excluded = client.get(url, {**params, 'has_cold_storage': 'false', 'page_size': 100})
+        self.assertEqual([item['id'] for item in excluded.data['results']], [pk for pk in expected if pk != market.pk])
+
+    def test_batch_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(username='officer', password='secret'))
+        points = [(27.7, 85.3), (27.675, 85.275), (26.5, 87.3)]
+        payload = {
+            'points': [{'id': f'farmer-{i}', 'latitude': lat, 'longitude': lon} for i, (lat, lon) in enumerate(points)]
+                      + [{'id': 'bad', 'latitude': 95, 'longitude': 85.3}],
+            'max_results': 3,
+            'save_searches': True,
+        }
+
+        response = client.post(reverse('market_finder:find-nearest-batch'), payload, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        for (latitude, longitude), result in zip(points, results):
+            self.assertEqual(
+                [(market['market_id'], market['distance_km']) for market in result['markets']],
+                self.brute_force(latitude, longitude, max_results=3)
+            )
+            self.assertEqual(
+                MarketSearch.objects.get(pk=result['search_id']).nearest_market_id,
+                result['markets'][0]['market_id']
+            )
+        self.assertEqual(results[3]['id'], 'bad')
+        self.assertIn('latitude', results[3]['error'])
+        self.assertEqual(MarketSearch.objects.count(), 3)
+        self.assertEqual(
+            set(response.data['markets']),
+            {str(market['market_id']) for result in results[:3] for market in result['markets']}
+        )
+
+    def test_batch_endpoint_query_count(self):
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(username='officer', password='secret'))
+        url = reverse('market_finder:find-nearest-batch')
+        market_coordinates_store.warm()
+
+        # Only the markets found are loaded, with one query for any number of points
+        for count in (1, 200):
+            points = [{'latitude': 27.6 + i * 0.001, 'longitude': 85.2} for i in range(count)]
+            with self.assertNumQueries(1):
+                response = client.post(url, {'points': points}, format='json')
+            self.assertEqual(len(response.data['results']), count)
+
+    def test_follows_market_changes(self):
+        nearest_id = self.nearest(27.6, 85.2, max_results=1)[0][0]
+        market = Market.objects.get(pk=nearest_id)
+        market.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            market.save()
+
+        self.assertNotIn(nearest_id, [pk for pk, _ in self.nearest(27.6, 85.2)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            market.delete()
+            Market.objects.create(
+                name='New Market', district='Kathmandu', address='Nepal',
+                latitude=27.6, longitude=85.2, market_type='retail'
+            )
+        self.assertEqual(self.nearest(27.6, 85.2, max_results=1)[0][1], 0.0)
+
+
+@mock.patch('market_finder.geo.INDEX_MIN_MARKETS', 1)
+class IndexedNearestMarketTests(NearestMarketTests):
+    """
+    Same checks with the searches going through the KD-tree
+    """
+
+    def test_uses_index(self):
+        self.assertTrue(market_coordinates_store.get().uses_index)
+
+    @override_settings(MARKET_COORDINATES_REVALIDATE_SECONDS=None)
+    def test_snapshot_changes_only_on_commit(self):
+        market = Market.objects.get(name='Market 0-0')
+        market_id = market.pk
+
+        with self.assertRaises(DatabaseError):
+            with transaction.atomic():
+                market.delete()
+                raise DatabaseError('rolled back')
+        self.assertIn(market_id, market_coordinates_store.get().ids.tolist())
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            Market.objects.get(pk=market_id).delete()
+        self.assertIn(market_id, market_coordinates_store.get().ids.tolist())
+
+        # The transaction commits
+        for callback in callbacks:
+            callback()
+        self.assertNotIn(market_id, market_coordinates_store.get().ids.tolist())
+        self.assertEqual(self.nearest(27.6, 85.2, max_results=1), self.brute_force(27.6, 85.2, max_results=1))
+
+    def test_within_radius_matches_brute_force(self):
+        coordinates = market_coordinates_store.get()
+        for radius_km in (0.0, 5.0, 12.5, 1000.0):
+            indices, distances = coordinates.within(27.675, 85.275, radius_km)
+
+            self.assertEqual(
+                coordinates.ids[indices].tolist(), self.within_brute_force(27.675, 85.275, radius_km)
+            )
+            self.assertTrue((distances <= radius_km).all())
+
+
+@override_settings(MARKET_SEARCH_INITIAL_RADIUS_KM=2.0)
+class DatabaseNearestMarketTests(NearestMarketTests):
+    """
+    Same checks in a process without a coordinates snapshot, where searches
+    query the database by bounding box
+    """
+    warm_store = False
+
+    def test_does_not_load_snapshot(self):
+        self.nearest(27.7, 85.3)
+        self.assertIsNone(market_coordinates_store.current())
+
+    def test_fetches_only_markets_near_the_point(self):
+        # A 2 km radius around a market holds just that one
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.nearest(27.6, 85.2, max_results=1)), 1)
+
+    def test_widens_radius_until_enough_markets(self):
+        # Over 100 km from every market
+        self.assertEqual(
+            self.nearest(26.5, 87.3, max_results=3),
+            self.brute_force(26.5, 87.3, max_results=3)
+        )
+
+
+class NearestMarketWriteBehindTests(TestCase):
+    def setUp(self):
+        market_coordinates_store.clear()
+        self.market = Market.objects.create(
+            name='Kalimati', district='Kathmandu', address='Kathmandu',
+            latitude=27.7, longitude=85.3, market_type='wholesale'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(username='farmer', password='secret'))
+        self.payload = {'latitude': 27.71, 'longitude': 85.31}
+
+    def test_search_log_is_queued(self):
+        queue = WriteBehindQueue(enabled=True, flush_interval=60)
+        self.addCleanup(queue.close)
+
+        with mock.patch('market_finder.views.write_behind_queue', queue):
+            response = self.client.post(reverse('market_finder:find-nearest'), self.payload, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['queued'])
+        self.assertIsNone(response.data['search_id'])
+        self.assertFalse(MarketSearch.objects.exists())
+
+        self.assertEqual(queue.flush(), 1)
+        search = MarketSearch.objects.get(reference=response.data['search_reference'])
+        self.assertEqual(search.nearest_market, self.market)
+
+    def test_search_log_is_written_synchronously_when_queue_is_full(self):
+        queue = WriteBehindQueue(enabled=True, flush_interval=60, max_pending=0)
+
+        with mock.patch('market_finder.views.write_behind_queue', queue):
+            response = self.client.post(reverse('market_finder:find-nearest'), self.payload, format='json')
+
+        self.assertFalse(response.data['queued'])
+        self.assertTrue(MarketSearch.objects.filter(pk=response.data['search_id']).exists())
+
+
+class BoundingBoxTests(SimpleTestCase):
+    def assertInBoxes(self, boxes, latitude, longitude):
+        self.assertTrue(any(
+            min_lat <= latitude <= max_lat and min_lon <= longitude <= max_lon
+            for min_lat, max_lat, min_lon, max_lon in boxes
+        ))
+
+    def test_contains_circle(self):
+        boxes = bounding_boxes(27.7, 85.3, 10)
+        self.assertEqual(len(boxes), 1)
+        # Points just inside 10 km due north and due east
+        self.assertInBoxes(boxes, 27.7 + 0.0899, 85.3)
+        self.assertLess(haversine_km(27.7, 85.3, 27.7 + 0.0899, 85.3), 10)
+        self.assertInBoxes(boxes, 27.7, 85.3 + 0.1015)
+        self.assertLess(haversine_km(27.7, 85.3, 27.7, 85.3 + 0.1015), 10)
+
+    def test_crosses_antimeridian(self):
+        boxes = bounding_boxes(-17.8, 179.9, 50)
+        self.assertEqual(len(boxes), 2)
+        self.assertInBoxes(boxes, -17.8, -179.9)
+        self.assertInBoxes(boxes, -17.8, 179.5)
+
+    def test_reaches_pole(self):
+        (min_lat, max_lat, min_lon, max_lon), = bounding_boxes(89.9, 10.0, 50)
+        self.assertEqual((max_lat, min_lon, max_lon), (90.0, -180.0, 180.0))
+        self.assertLess(min_lat, 89.9)
+
+
+class FindNearestMarketsBulkCommandTests(TestCase):
+    def setUp(self):
+        market_coordinates_store.clear()
+        for name, latitude, longitude in (('Kalimati', 27.699, 85.288), ('Pokhara', 28.209, 83.985)):
+            Market.objects.create(
+                name=name, district=name, address='Nepal',
+                latitude=latitude, longitude=longitude, market_type='wholesale'
+            )
+        self.user = get_user_model().objects.create_user(username='officer', password='secret')
+
+    def test_writes_nearest_markets_per_location(self):
+        with tempfile.TemporaryDirectory() as directory:
+            input_path = os.path.join(directory, 'locations.csv')
+            output_path = os.path.join(directory, 'nearest.ndjson')
+            with open(input_path, 'w') as input_file:
+                input_file.write('id,latitude,longitude\nf1,27.7,85.3\nf2,28.2,84.0\nf3,north,85.3\n')
+
+            call_command(
+                'find_nearest_markets_bulk', input_path, output_path,
+                max_results=1, save=True, user='officer', stdout=StringIO()
+            )
+
+            with open(output_path) as output_file:
+                rows = [json.loads(line) for line in output_file]
+
+        self.assertEqual([row['id'] for row in rows], ['f1', 'f2', 'f3'])
+        self.assertEqual([row['markets'][0]['market'] for row in rows[:2]], ['Kalimati', 'Pokhara'])
+        self.assertEqual(rows[2]['error'], 'latitude must be a number')
+        self.assertEqual(
+            list(MarketSearch.objects.filter(user=self.user).order_by('id').values_list('nearest_market__name', flat=True)),
+            ['Kalimati', 'Pokhara']
+        )
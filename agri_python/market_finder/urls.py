@@ -4,6 +4,8 @@ from .views import (
     MarketViewSet,
     MarketPriceViewSet,
     NearestMarketFinderView,
+    NearestMarketBatchView,
+    MarketsWithinRadiusView,
     MarketSearchHistoryView,
     MarketsByDistrictView,
     MarketPriceByMarketView
@@ -18,6 +20,8 @@ router.register(r'prices', MarketPriceViewSet, basename='market-price')
 urlpatterns = [
     path('', include(router.urls)),
     path('find-nearest/', NearestMarketFinderView.as_view(), name='find-nearest'),
+    path('find-nearest/batch/', NearestMarketBatchView.as_view(), name='find-nearest-batch'),
+    path('within-radius/', MarketsWithinRadiusView.as_view(), name='within-radius'),
     path('search-history/', MarketSearchHistoryView.as_view(), name='search-history'),
     path('by-district/', MarketsByDistrictView.as_view(), name='by-district'),
     path('markets/<int:market_id>/prices/', MarketPriceByMarketView.as_view(), name='market-prices'),
@@ -1,4 +1,6 @@
+from django.db import transaction
 from rest_framework import generics, status, permissions, viewsets
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from drf_yasg.utils import swagger_auto_schema
@@ -9,9 +11,14 @@ from .serializers import (
     MarketPriceSerializer, 
     MarketSearchSerializer,
     MarketSearchRequestSerializer,
+    MarketBatchPointSerializer,
+    MarketBatchSearchRequestSerializer,
+    MarketRadiusSearchSerializer,
     NearestMarketSerializer
 )
-from .market_utils import MarketFinderEngine
+from .market_utils import MarketFinderEngine, build_market_searches, insert_market_searches
+from agrinova_backend.idempotency import IDEMPOTENCY_KEY_PARAMETER, idempotent
+from agrinova_backend.write_behind import write_behind_queue
 
 class MarketViewSet(viewsets.ModelViewSet):
     """
@@ -32,7 +39,7 @@ class MarketPriceViewSet(viewsets.ModelViewSet):
     """
     Manage market prices for different crops.
     """
-    queryset = MarketPrice.objects.all()
+    queryset = MarketPrice.objects.select_related('market')
     serializer_class = MarketPriceSerializer
     
     def get_permissions(self):
@@ -57,8 +64,11 @@ class NearestMarketFinderView(APIView):
         d = 2r × arcsin(√(sin²(Δlat/2) + cos(lat1) × cos(lat2) × sin²(Δlon/2)))
         
         Returns markets sorted by distance with travel time estimates.
+        With write-behind enabled on the server, the search is logged just
+        after responding: `queued` is true and `search_id` is null.
         """,
         request_body=MarketSearchRequestSerializer,
+        manual_parameters=[IDEMPOTENCY_KEY_PARAMETER],
         responses={
             200: openapi.Response(
                 description="Markets found successfully",
@@ -73,14 +83,19 @@ class NearestMarketFinderView(APIView):
                             }
                         ],
                         "search_id": 1,
+                        "search_reference": "6f1d2c3b-8a4e-4f5a-9b7c-1d2e3f4a5b6c",
+                        "queued": False,
                         "message": "Found 5 nearby markets"
                     }
                 }
             ),
             404: "No markets found",
-            500: "Error finding markets"
+            500: "Error finding markets",
+            409: "A request with the same Idempotency-Key is still being processed",
+            422: "Idempotency-Key was already used for a different request"
         }
     )
+    @idempotent('find-nearest')
     def post(self, request):
         serializer = MarketSearchRequestSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -107,9 +122,9 @@ class NearestMarketFinderView(APIView):
                     'message': 'Try expanding your search area or check if district name is correct'
                 }, status=status.HTTP_404_NOT_FOUND)
             
-            # Save search record
+            # Save search record (after responding, with write-behind enabled)
             nearest_market = nearest_markets[0]['market']
-            market_search = MarketSearch.objects.create(
+            market_search = MarketSearch(
                 user=request.user,
                 search_latitude=latitude,
                 search_longitude=longitude,
@@ -118,6 +133,9 @@ class NearestMarketFinderView(APIView):
                 nearest_market=nearest_market,
                 distance_km=nearest_markets[0]['distance_km']
             )
+            queued = write_behind_queue.accepting()
+            if not queued:
+                market_search.save()
             
             # Prepare response with distance information
             markets_with_distance = []
@@ -129,17 +147,234 @@ class NearestMarketFinderView(APIView):
                 )
                 markets_with_distance.append(market_data)
             
-            return Response({
+            response = Response({
                 'markets': markets_with_distance,
                 'search_id': market_search.id,
+                'search_reference': str(market_search.reference),
+                'queued': queued,
                 'message': f'Found {len(markets_with_distance)} nearby markets'
             }, status=status.HTTP_200_OK)
             
+            if queued and not write_behind_queue.submit(insert_market_searches, market_search):
+                # The queue filled up or shut down since accepting()
+                market_search.save()
+            
+            return response
+            
         except Exception as e:
             return Response({
                 'error': f'Error finding markets: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+class NearestMarketBatchView(APIView):
+    """
+    Find the nearest markets for many farmer locations in one request.
+    
+    All valid points are searched together with one matrix (or spatial
+    index) query. Invalid points are reported individually without failing
+    the batch.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    @swagger_auto_schema(
+        operation_description="""
+        Find the nearest `max_results` markets for up to 10000 locations.
+        
+        Each entry in `points` takes `latitude`, `longitude` and an optional
+        `id` that is echoed back. Results are returned in input order and
+        refer to markets by id; each market's details appear once under
+        `markets`. With `save_searches`, a search log is stored per point
+        (bulk inserted) and its id returned as `search_id`.
+        """,
+        request_body=MarketBatchSearchRequestSerializer,
+        responses={
+            200: openapi.Response(
+                description="Batch processed",
+                examples={
+                    "application/json": {
+                        "results": [
+                            {
+                                "index": 0,
+                                "id": "farmer-17",
+                                "markets": [
+                                    {
+                                        "market_id": 1,
+                                        "distance_km": 2.15,
+                                        "estimated_travel_time_minutes": 3
+                                    }
+                                ]
+                            },
+                            {
+                                "index": 1,
+                                "id": "farmer-18",
+                                "error": {"latitude": ["Ensure this value is less than or equal to 90."]}
+                            }
+                        ],
+                        "markets": {
+                            "1": {"id": 1, "name": "Kalimati Market", "district": "Kathmandu"}
+                        },
+                        "message": "Found markets for 1 of 2 locations"
+                    }
+                }
+            )
+        }
+    )
+    def post(self, request):
+        batch_serializer = MarketBatchSearchRequestSerializer(data=request.data)
+        batch_serializer.is_valid(raise_exception=True)
+        batch = batch_serializer.validated_data
+        points = batch['points']
+        
+        # Validate each point on its own so one bad entry doesn't fail the batch
+        results = []
+        valid = []
+        for index, point in enumerate(points):
+            result = {'index': index}
+            if 'id' in point:
+                result['id'] = point['id']
+            serializer = MarketBatchPointSerializer(data=point)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                result['error'] = serializer.errors
+            results.append(result)
+        
+        nearest_ids, nearest_distances = [], []
+        if valid:
+            market_ids, distances = MarketFinderEngine.find_nearest_markets_batch(
+                [data['latitude'] for _, data in valid],
+                [data['longitude'] for _, data in valid],
+                district=batch.get('district'),
+                max_results=batch['max_results']
+            )
+            nearest_ids, nearest_distances = market_ids.tolist(), distances.tolist()
+        
+        markets = Market.objects.filter(is_active=True).in_bulk(
+            {market_id for row in nearest_ids for market_id in row}
+        )
+        # Deleted or deactivated since the coordinates were loaded
+        nearest = [
+            [(market_id, distance) for market_id, distance in zip(row_ids, row_distances) if market_id in markets]
+            for row_ids, row_distances in zip(nearest_ids, nearest_distances)
+        ]
+        
+        found = 0
+        for (index, _), row in zip(valid, nearest):
+            if not row:
+                results[index]['error'] = 'No markets found'
+                continue
+            results[index]['markets'] = [
+                {
+                    'market_id': market_id,
+                    'distance_km': round(distance, 2),
+                    'estimated_travel_time_minutes': MarketFinderEngine.calculate_travel_time(round(distance, 2))
+                }
+                for market_id, distance in row
+            ]
+            found += 1
+        
+        if batch['save_searches']:
+            searches = build_market_searches(
+                request.user,
+                [(data['latitude'], data['longitude']) for _, data in valid],
+                [[market_id for market_id, _ in row] for row in nearest],
+                [[distance for _, distance in row] for row in nearest],
+                district=batch.get('district'),
+                crop_to_sell=batch.get('crop_to_sell')
+            )
+            with transaction.atomic():
+                insert_market_searches([search for search in searches if search is not None])
+            for (index, _), search in zip(valid, searches):
+                if search is not None:
+                    results[index]['search_id'] = search.id
+        
+        used = {market_id for row in nearest for market_id, _ in row}
+        return Response({
+            'results': results,
+            'markets': {
+                str(market_id): NearestMarketSerializer(markets[market_id]).data
+                for market_id in sorted(used)
+            },
+            'message': f'Found markets for {found} of {len(points)} locations'
+        }, status=status.HTTP_200_OK)
+
+class MarketRadiusPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+class MarketsWithinRadiusView(generics.GenericAPIView):
+    """
+    Find all agricultural markets within a radius of a location.
+    
+    Candidates come from the market spatial index (or a bounding-box query),
+    so markets far outside the radius are never scored; only the markets on
+    the requested page are loaded.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = MarketRadiusPagination
+    
+    @swagger_auto_schema(
+        operation_description="""
+        List the markets within `radius_km` of a location, nearest first,
+        optionally filtered by district, market type and facilities.
+        Paginated with `page` and `page_size` (default 20, at most 100).
+        """,
+        query_serializer=MarketRadiusSearchSerializer,
+        responses={
+            200: openapi.Response(
+                description="Markets within the radius",
+                examples={
+                    "application/json": {
+                        "count": 12,
+                        "next": "http://localhost:8000/api/markets/within-radius/?latitude=27.7172&longitude=85.324&radius_km=10&page=2",
+                        "previous": None,
+                        "results": [
+                            {
+                                "id": 1,
+                                "name": "Kalimati Market",
+                                "distance_km": 2.15,
+                                "estimated_travel_time_minutes": 3
+                            }
+                        ]
+                    }
+                }
+            ),
+            400: "Invalid search parameters"
+        }
+    )
+    def get(self, request):
+        serializer = MarketRadiusSearchSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        
+        data = serializer.validated_data
+        market_ids, distances = MarketFinderEngine.find_markets_within(
+            data['latitude'],
+            data['longitude'],
+            data['radius_km'],
+            district=data.get('district'),
+            market_type=data.get('market_type'),
+            facilities=serializer.facilities()
+        )
+        
+        page = self.paginate_queryset(list(zip(market_ids.tolist(), distances.tolist())))
+        markets = Market.objects.filter(is_active=True).in_bulk([market_id for market_id, _ in page])
+        
+        results = []
+        for market_id, distance in page:
+            market = markets.get(market_id)
+            if market is None:
+                # Deleted or deactivated since the search
+                continue
+            market_data = NearestMarketSerializer(market).data
+            market_data['distance_km'] = round(distance, 2)
+            market_data['estimated_travel_time_minutes'] = MarketFinderEngine.calculate_travel_time(
+                market_data['distance_km']
+            )
+            results.append(market_data)
+        
+        return self.get_paginated_response(results)
+
 class MarketSearchHistoryView(generics.ListAPIView):
     """
     View history of market searches for the authenticated user.
@@ -154,7 +389,7 @@ class MarketSearchHistoryView(generics.ListAPIView):
         return super().get(request, *args, **kwargs)
     
     def get_queryset(self):
-        return MarketSearch.objects.filter(user=self.request.user)
+        return MarketSearch.objects.filter(user=self.request.user).select_related('user', 'nearest_market')
 
 class MarketsByDistrictView(generics.ListAPIView):
     """
@@ -200,4 +435,4 @@ class MarketPriceByMarketView(generics.ListAPIView):
     
     def get_queryset(self):
         market_id = self.kwargs.get('market_id')
-        return MarketPrice.objects.filter(market_id=market_id).order_by('-price_date')
+        return MarketPrice.objects.filter(market_id=market_id).select_related('market').order_by('-price_date')